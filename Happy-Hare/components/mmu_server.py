@@ -15,8 +15,9 @@
 #
 from __future__ import annotations
 import json
-import logging, os, sys, re, time, asyncio
-import runpy, argparse, shutil, traceback, tempfile, filecmp
+import logging, os, sys, re, time, asyncio, mmap
+import collections, contextlib, fcntl, hashlib, multiprocessing, concurrent.futures
+import runpy, argparse, shutil, traceback, tempfile, importlib.util
 from typing import (
     TYPE_CHECKING,
     List,
@@ -46,6 +47,185 @@ MIN_SM_VER       = (0, 18, 1)
 DB_NAMESPACE     = "moonraker"
 ACTIVE_SPOOL_KEY = "spoolman.spool_id"
 
+SPOOLMAN_PAGE_SIZE      = 500 # Spools fetched per request when (re)building the location cache
+SPOOLMAN_WATCH_BACKOFF  = (1., 60.) # Min/max delay between reconnection attempts of spool change websocket
+SPOOLMAN_MAX_WRITES     = 4   # Concurrent PATCH requests to Spoolman
+SPOOLMAN_WRITE_RETRIES  = 3   # Retries of transient write failures (timeouts, 5xx, 429)
+SPOOLMAN_WRITE_BACKOFF  = 0.5 # Initial retry delay (doubles each retry)
+
+# Result of a spool write
+WRITE_OK         = 'ok'
+WRITE_NOT_FOUND  = 'not_found'
+WRITE_ERROR      = 'error'
+WRITE_TRANSIENT  = 'transient'
+WRITE_SUPERSEDED = 'superseded' # Not sent because newer write for same spool was queued before it started
+
+class SpoolLocationCache:
+    """
+    Cache of spool location keyed by spool_id with value (printer, gate, attr_dict). Secondary indexes
+    from (printer, gate) and printer to spool_ids are maintained on every assignment so lookups do not
+    scan every spool. Index buckets are insertion ordered dicts used as sets
+    """
+
+    def __init__(self):
+        self._locations = {}
+        self._by_gate = {}    # {(printer, gate): {spool_id: None}}
+        self._by_printer = {} # {printer: {spool_id: None}}
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, spool_id):
+        return spool_id in self._locations
+
+    def __getitem__(self, spool_id):
+        return self._locations[spool_id]
+
+    def __setitem__(self, spool_id, location):
+        old = self._locations.get(spool_id)
+        if old is not None and (old[0], old[1]) != (location[0], location[1]):
+            self._unindex(spool_id, old)
+        self._locations[spool_id] = location
+        self._by_gate.setdefault((location[0], location[1]), {})[spool_id] = None
+        self._by_printer.setdefault(location[0], {})[spool_id] = None
+
+    def __delitem__(self, spool_id):
+        self._unindex(spool_id, self._locations.pop(spool_id))
+
+    def _unindex(self, spool_id, location):
+        for index, key in ((self._by_gate, (location[0], location[1])), (self._by_printer, location[0])):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(spool_id, None)
+                if not bucket:
+                    del index[key]
+
+    def get(self, spool_id, default=None):
+        return self._locations.get(spool_id, default)
+
+    def items(self):
+        return self._locations.items()
+
+    def clear(self):
+        self._locations.clear()
+        self._by_gate.clear()
+        self._by_printer.clear()
+
+    def printers(self):
+        return list(self._by_printer)
+
+    def gates(self, printer):
+        """
+        List of (gate, spool_ids) for printer
+        """
+        return [(g, list(bucket)) for (p, g), bucket in self._by_gate.items() if p == printer]
+
+    def spool_ids(self, printer=None, gate=None):
+        """
+        List of spool_ids at 'printer/gate', just 'gate' or just 'printer'
+        """
+        if printer is not None and gate is not None:
+            return list(self._by_gate.get((printer, gate), ()))
+        if printer is not None:
+            return list(self._by_printer.get(printer, ()))
+        if gate is not None:
+            return [sid for (_, g), bucket in self._by_gate.items() if g == gate for sid in bucket]
+        return list(self._locations)
+
+    def check_consistency(self):
+        """
+        Rebuild indexes from the primary map and compare. Returns list of problems (empty if consistent)
+        """
+        by_gate, by_printer = {}, {}
+        for sid, (printer, gate, _) in self._locations.items():
+            by_gate.setdefault((printer, gate), set()).add(sid)
+            by_printer.setdefault(printer, set()).add(sid)
+        errors = []
+        for name, expected, actual in (("gate", by_gate, self._by_gate), ("printer", by_printer, self._by_printer)):
+            actual = {key: set(bucket) for key, bucket in actual.items()}
+            for key in set(expected) | set(actual):
+                if expected.get(key) != actual.get(key):
+                    errors.append(f"{name} index {key}: expected {sorted(expected.get(key, ()))} found {sorted(actual.get(key, ()))}")
+        return errors
+
+class SpoolmanWriteQueue:
+    """
+    Bounded concurrency pipeline for spool writes. At most 'max_concurrency' requests are in flight.
+    Writes to the same spool are serialized. A write that has not started yet is shared by an identical
+    write or replaced by a different one for the same spool, in which case the replaced submitter receives
+    WRITE_SUPERSEDED. Transient failures are retried with exponential backoff. 'send' is an async callable
+    (spool_id, write) returning one of the WRITE_* results
+    """
+
+    def __init__(self, send, max_concurrency=SPOOLMAN_MAX_WRITES, retries=SPOOLMAN_WRITE_RETRIES, backoff=SPOOLMAN_WRITE_BACKOFF):
+        self.send = send
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.semaphore = None # Created lazily so it binds to the running event loop
+        self.pending = {}     # {spool_id: [write, future]} not yet started
+        self.active = {}      # {spool_id: task} draining writes for spool
+        self.stats = {'submitted': 0, 'coalesced': 0, 'superseded': 0, 'sent': 0, 'retries': 0, 'failed': 0}
+
+    def submit(self, spool_id, write):
+        """
+        Queue write for spool and return future that resolves to WRITE_* result
+        """
+        self.stats['submitted'] += 1
+        entry = self.pending.get(spool_id)
+        if entry is not None:
+            if entry[0] == write:
+                self.stats['coalesced'] += 1
+                return entry[1]
+            self.stats['superseded'] += 1
+            entry[1].set_result(WRITE_SUPERSEDED)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[spool_id] = [write, future]
+        if spool_id not in self.active:
+            self.active[spool_id] = asyncio.ensure_future(self._drain(spool_id))
+        return future
+
+    async def _drain(self, spool_id):
+        try:
+            while spool_id in self.pending:
+                write, future = self.pending.pop(spool_id)
+                try:
+                    result = await self._send_with_retry(spool_id, write)
+                except Exception as e:
+                    logging.error(f"Spoolman write for spool {spool_id} failed: {str(e)}")
+                    result = WRITE_ERROR
+                if result != WRITE_OK:
+                    self.stats['failed'] += 1
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.active.pop(spool_id, None)
+
+    async def _send_with_retry(self, spool_id, write):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            async with self.semaphore:
+                self.stats['sent'] += 1
+                result = await self.send(spool_id, write)
+            if result != WRITE_TRANSIENT or attempt == self.retries:
+                return WRITE_ERROR if result == WRITE_TRANSIENT else result
+            self.stats['retries'] += 1
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    @staticmethod
+    async def as_completed(futures):
+        """
+        Async generator of (key, result) for dict of {key: awaitable} in order of completion
+        """
+        waiting = {asyncio.ensure_future(f): key for key, f in futures.items()}
+        while waiting:
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for f in done:
+                yield waiting.pop(f), f.result()
+
 class MmuServer:
     def __init__(self, config: ConfigHelper):
         self.config = config
@@ -58,13 +238,18 @@ class MmuServer:
         self.klippy_apis: APIComp = self.server.lookup_component("klippy_apis")
         self.http_client: HttpClient = self.server.lookup_component("http_client")
 
-        # Full cache of spool_ids and location + key attributes (printer, gate, attr_dict))
+        # Full cache of spool_ids and location + key attributes (printer, gate, attr_dict)) indexed by location
         # Example: {2: ('BigRed', 0, {"material": "pla", "color": "ff56e0"}), 3: ('BigRed', 3, {"material": "abs"}), ...
-        self.spool_location = {}
+        self.spool_location = SpoolLocationCache()
 
         self.nb_gates = None             # Set during initialization to the size of the MMU or 1 if standalone
+        self.gate_map_endpoint = None    # Whether Happy Hare has the 'mmu/gate_map' webhooks endpoint (None = unknown)
         self.cache_lock = asyncio.Lock() # Lock to serialize a async calls for Happy Hare
 
+        # Klippy endpoints may change with every restart (e.g. Happy Hare update) so re-check each time
+        self.server.register_event_handler("server:klippy_ready", self._check_gate_map_endpoint)
+        self.server.register_event_handler("server:klippy_disconnect", self._reset_gate_map_endpoint)
+
         # Spoolman filament info retrieval functionality and update reporting
         if self.spoolman:
             self.server.register_remote_method("spoolman_refresh", self.refresh_cache)
@@ -79,10 +264,35 @@ class MmuServer:
 
         # Replace file_manager/metadata with this file
         self.setup_placeholder_processor(config)
+        self.setup_metadata_endpoint()
+
+        # Parallel pre-processing of uploads ahead of the (serial) metadata script
+        self.preprocess_pool = None
+        self.preprocess_pending = set()
+        if config.getboolean("enable_file_preprocessor", True):
+            if config.getboolean("enable_parallel_preprocessor", True):
+                self.setup_preprocess_service(config)
+            self.server.register_event_handler("file_manager:filelist_changed", self._filelist_changed)
 
         # Options
         self.update_location = self.config.getboolean("update_spoolman_location", True)
 
+        # Incremental sync of spool location cache from Spoolman change notifications. While the websocket is
+        # connected the cache is kept current by applying deltas. Any gap forces a (paged) full rebuild
+        self.incremental_sync = self.config.getboolean("spoolman_incremental_sync", True)
+        self.spoolman_page_size = self.config.getint("spoolman_page_size", SPOOLMAN_PAGE_SIZE, minval=1)
+        self.spool_cache_synced = False  # True if cache was built while watching and no notifications missed since
+        self.spool_watch_task = None
+        self.spool_watch_connected = False
+        self.spool_rebuilding = False
+        self.spool_events = []           # Notifications received during rebuild, replayed after it completes
+
+        # Pipeline for spool location writes (PATCH) to Spoolman
+        self.spool_writer = SpoolmanWriteQueue(
+            self._send_spool_write,
+            max_concurrency=self.config.getint("spoolman_max_concurrency", SPOOLMAN_MAX_WRITES, minval=1)
+        )
+
     async def _get_spoolman_version(self) -> tuple[int, int, int] | None:
         response = await self.http_client.get(url=f'{self.spoolman.spoolman_url}/v1/info')
         if response.status_code == 404:
@@ -132,6 +342,8 @@ class MmuServer:
                 # Create cache of spool location from Spoolman db for effeciency
                 if extras:
                     await self._build_spool_location_cache(silent=True)
+                    if self.incremental_sync and self.spool_watch_task is None:
+                        self.spool_watch_task = asyncio.create_task(self._watch_spoolman())
                 self.spoolman_has_extras = extras
 
             elif self.spoolman_version:
@@ -274,48 +486,73 @@ class MmuServer:
         temp = filament.get('settings_extruder_temp', '')
         return {'spool_id': spool_id, 'material': material, 'color': color_hex, 'name': name, 'temp': temp}
 
+    def _parse_spool_location(self, spool_info):
+        '''
+        Helper to extract (printer, gate, filament_attr) from Spoolman spool json
+        '''
+        extra = spool_info.get('extra', {})
+        printer_name = json.loads(extra.get(MMU_NAME_FIELD, "\"\"")).strip('"')
+        mmu_gate = int(extra.get(MMU_GATE_FIELD, -1))
+        return (printer_name, mmu_gate, self._get_filament_attr(spool_info))
+
     async def _build_spool_location_cache(self, fix=False, silent=False) -> bool:
         '''
-        Helper to get all spools and gates assigned to printers from Spoolman db and cache them
+        Helper to get all spools and gates assigned to printers from Spoolman db and cache them.
+        Spools are fetched in pages to bound response size. Change notifications that arrive
+        whilst building are queued and applied to the new cache afterwards
         '''
         logging.info("Building spool location cache from Spoolman db")
+        self.spool_rebuilding = True
+        self.spool_events = []
         try:
-            self.spool_location.clear()
-            # Fetch all spools
-            errors = ""
-            assignments = {}
-            sids_to_fix = []
-            reponse = await self.http_client.get(url=f'{self.spoolman.spoolman_url}/v1/spool')
-            for spool_info in reponse.json():
-                spool_id = spool_info['id']
-                printer_name = json.loads(spool_info['extra'].get(MMU_NAME_FIELD, "\"\"")).strip('"')
-                mmu_gate = int(spool_info['extra'].get(MMU_GATE_FIELD, -1))
-                filament_attr = self._get_filament_attr(spool_info)
-                self.spool_location[spool_id] = (printer_name, mmu_gate, filament_attr)
-
-                if printer_name and mmu_gate >= 0:
-                    if printer_name not in assignments:
-                        assignments[printer_name] = {}
-                    if mmu_gate not in assignments[printer_name]:
-                        assignments[printer_name][mmu_gate] = []
-                    assignments[printer_name][mmu_gate].append(spool_id)
-
-                # Highlight errors
-                if printer_name and mmu_gate < 0:
-                    errors += f"\n  - Spool {spool_id} has printer {printer_name} but no mmu_gate assigned"
-                    sids_to_fix.append(spool_id)
-                if mmu_gate >= 0 and not printer_name:
-                    errors += f"\n  - Spool {spool_id} has mmu_gate {mmu_gate} but no printer assigned"
-                    sids_to_fix.append(spool_id)
-
-            for p, gates in assignments.items():
-                for g, spool_list in gates.items():
-                    if len(spool_list) > 1:
-                        errors += f"\n  - Printer {p} @ gate {g} has multiple spool ids: {spool_list}"
-                        sids_to_fix.extend(spool_list[1:])
+            # Build into new cache and only replace on success so a failed fetch leaves existing cache intact
+            spool_location = SpoolLocationCache()
+            offset = 0
+            while True:
+                response = await self.http_client.get(
+                    url=f'{self.spoolman.spoolman_url}/v1/spool?sort=id:asc&limit={self.spoolman_page_size}&offset={offset}'
+                )
+                if response.has_error():
+                    raise Exception(self.spoolman._get_response_error(response))
+                spools = response.json()
+                for spool_info in spools:
+                    spool_location[spool_info['id']] = self._parse_spool_location(spool_info)
+                if len(spools) < self.spoolman_page_size:
+                    break
+                offset += len(spools)
         except Exception as e:
             await self._log_n_send(f"Failed to retrieve spools from spoolman: {str(e)}", error=True, silent=silent)
+            self.spool_cache_synced = False
             return False
+        finally:
+            self.spool_rebuilding = False
+
+        self.spool_location = spool_location
+        for event in self.spool_events:
+            self._apply_spool_event(event)
+        self.spool_events = []
+        self.spool_cache_synced = self.spool_watch_connected
+        return await self._check_spool_assignments(fix=fix, silent=silent)
+
+    async def _check_spool_assignments(self, fix=False, silent=False) -> bool:
+        '''
+        Helper to highlight (and optionally fix) inconsistent printer/gate assignments in cache
+        '''
+        errors = ""
+        sids_to_fix = []
+        for p in self.spool_location.printers():
+            for g, spool_list in self.spool_location.gates(p):
+                if p and g < 0:
+                    for spool_id in spool_list:
+                        errors += f"\n  - Spool {spool_id} has printer {p} but no mmu_gate assigned"
+                    sids_to_fix.extend(spool_list)
+                elif g >= 0 and not p:
+                    for spool_id in spool_list:
+                        errors += f"\n  - Spool {spool_id} has mmu_gate {g} but no printer assigned"
+                    sids_to_fix.extend(spool_list)
+                elif p and len(spool_list) > 1:
+                    errors += f"\n  - Printer {p} @ gate {g} has multiple spool ids: {spool_list}"
+                    sids_to_fix.extend(spool_list[1:])
 
         if errors:
             if fix:
@@ -323,66 +560,137 @@ class MmuServer:
             await self._log_n_send(f"Warning - Inconsistencies found in Spoolman db:{errors}", silent=silent)
 
         if fix:
+            old_locations = {sid: self.spool_location.get(sid, ('', -1, {})) for sid in sids_to_fix}
             tasks = {sid: self._unset_spool_gate(sid, silent=silent) for sid in sids_to_fix}
-            results = await asyncio.gather(*tasks.values())
 
-            # Log results and update cache
-            for sid, result in zip(tasks.keys(), results):
+            # Log results (cache is updated by _unset_spool_gate)
+            async for sid, result in SpoolmanWriteQueue.as_completed(tasks):
                 if result:
-                    old_printer, old_gate, filament_attr = self.spool_location.get(sid, ('', -1, {}))
-                    self.spool_location[sid] = ('', -1, filament_attr)
+                    old_printer, old_gate, _ = old_locations[sid]
                     await self._log_n_send(f"Spool {sid} unassigned from printer {old_printer} and gate {old_gate}", silent=silent)
         return True
 
+    async def _watch_spoolman(self):
+        '''
+        Long running task that subscribes to Spoolman spool change notifications and keeps the
+        location cache current. Reconnects with backoff. Any disconnect means notifications may have
+        been missed so the cache is marked unsynced and rebuilt once reconnected
+        '''
+        from tornado.websocket import websocket_connect
+        ws_url = re.sub(r"^http", "ws", self.spoolman.spoolman_url) + "/v1/spool"
+        backoff = SPOOLMAN_WATCH_BACKOFF[0]
+        while True:
+            try:
+                conn = await websocket_connect(ws_url, connect_timeout=10.)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.info(f"Spoolman change notifications unavailable ({str(e)}). Retrying in {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, SPOOLMAN_WATCH_BACKOFF[1])
+                continue
+
+            logging.info("Subscribed to Spoolman spool change notifications")
+            backoff = SPOOLMAN_WATCH_BACKOFF[0]
+            self.spool_watch_connected = True
+            asyncio.create_task(self._resync_spool_cache())
+            try:
+                while True:
+                    message = await conn.read_message()
+                    if message is None:
+                        break
+                    self._handle_spool_event(message)
+            finally:
+                self.spool_watch_connected = False
+                self.spool_cache_synced = False
+                conn.close()
+            logging.info("Spoolman change notification connection closed")
+
+    async def _resync_spool_cache(self):
+        async with self.cache_lock:
+            if not self.spool_cache_synced:
+                await self._build_spool_location_cache(silent=True)
+
+    def _handle_spool_event(self, message):
+        try:
+            event = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(event, dict) or event.get('resource') != 'spool':
+            return
+        if self.spool_rebuilding:
+            self.spool_events.append(event)
+        else:
+            self._apply_spool_event(event)
+
+    def _apply_spool_event(self, event):
+        '''
+        Apply a single Spoolman notification (added, updated or deleted spool) to the cache
+        '''
+        spool_info = event.get('payload') or {}
+        spool_id = spool_info.get('id')
+        if spool_id is None:
+            return
+        if event.get('type') == 'deleted':
+            if spool_id in self.spool_location:
+                del self.spool_location[spool_id]
+        else:
+            try:
+                self.spool_location[spool_id] = self._parse_spool_location(spool_info)
+            except (ValueError, TypeError, KeyError) as e:
+                logging.warning(f"Ignoring malformed Spoolman notification for spool {spool_id}: {str(e)}")
+
     # Function to find the first spool_id with a matching 'printer/gate', just 'gate' or just 'printer'
     def _find_first_spool_id(self, target_printer, target_gate):
-        return next((spoolid
-                for spoolid, (printer, gate, _) in self.spool_location.items()
-                if (target_printer is None or printer == target_printer) and gate == target_gate
-            ), -1)
+        return next(iter(self.spool_location.spool_ids(target_printer, target_gate)), -1)
 
     # Function to find all the spool_ids with a matching 'printer/gate', just 'gate' or just 'printer'
     def _find_all_spool_ids(self, target_printer, target_gate):
-        return [
-            spoolid
-            for spoolid, (printer, gate, _) in self.spool_location.items()
-            if (target_printer is None or printer == target_printer) and (target_gate is None or gate == target_gate)
-        ]
+        return self.spool_location.spool_ids(target_printer, target_gate)
+
+    # Function to verify secondary location indexes match the spool cache. Returns list of problems
+    def _check_spool_location_cache(self):
+        return self.spool_location.check_consistency()
 
     async def _set_spool_gate(self, spool_id, printer, gate, silent=False) -> bool:
         if not await self._check_init_spoolman(): return
 
-        # Use the PATCH method on the spoolman api
         if not silent:
             logging.info(f"Setting spool {spool_id} for printer {printer} @ gate {gate}")
-        data = {'extra': {MMU_NAME_FIELD: json.dumps(f"{printer}"), MMU_GATE_FIELD: json.dumps(gate)}}
-        if self.update_location:
-            data['location'] = f"{printer} @ MMU Gate:{gate}"
-        response = await self.http_client.request(
-            method="PATCH",
-            url=f"{self.spoolman.spoolman_url}/v1/spool/{spool_id}",
-            body=json.dumps(data)
-        )
-        if response.status_code == 404:
-            logging.error(f"'{self.spoolman.spoolman_url}/v1/spool/{spool_id}' not found")
+        result = await self.spool_writer.submit(spool_id, (printer, gate))
+        if result == WRITE_NOT_FOUND:
             await self._log_n_send(f"SpoolId {spool_id} not found", error=True, silent=False)
-            return False
-        elif response.has_error():
-            err_msg = self.spoolman._get_response_error(response)
-            logging.error(f"Attempt to set spool failed: {err_msg}")
+        elif result == WRITE_SUPERSEDED:
+            logging.info(f"Setting spool {spool_id} for printer {printer} superseded by newer update")
+        elif result != WRITE_OK:
             await self._log_n_send(f"Failed to set spool {spool_id} for printer {printer}. Look at moonraker.log for more details.", error=True, silent=False)
-            return False
-        return True
+        return result == WRITE_OK
 
     async def _unset_spool_gate(self, spool_id, silent=False) -> bool:
         if not await self._check_init_spoolman(): return
 
-        # Use the PATCH method on the spoolman api
         if not silent:
             logging.info(f"Unsetting gate map on spool id {spool_id}")
-        data = {'extra': {MMU_NAME_FIELD: json.dumps(""), MMU_GATE_FIELD: json.dumps(-1)}}
+        result = await self.spool_writer.submit(spool_id, ('', -1))
+        if result == WRITE_NOT_FOUND:
+            await self._log_n_send(f"SpoolId {spool_id} not found", error=True, silent=False)
+        elif result == WRITE_SUPERSEDED:
+            logging.info(f"Unsetting spool {spool_id} superseded by newer update")
+        elif result != WRITE_OK:
+            await self._log_n_send(f"Failed to unset spool {spool_id}. Look at moonraker.log for more details", error=True, silent=False)
+        return result == WRITE_OK
+
+    async def _send_spool_write(self, spool_id, location) -> str:
+        '''
+        Write (printer, gate) location of spool to Spoolman db (via the write queue) and update cache on success.
+        The shared http_client reuses connections to Spoolman
+        '''
+        printer, gate = location
+        data = {'extra': {MMU_NAME_FIELD: json.dumps(f"{printer}"), MMU_GATE_FIELD: json.dumps(gate)}}
         if self.update_location:
-            data['location'] = ""
+            data['location'] = f"{printer} @ MMU Gate:{gate}" if printer else ""
+
+        # Use the PATCH method on the spoolman api
         response = await self.http_client.request(
             method="PATCH",
             url=f"{self.spoolman.spoolman_url}/v1/spool/{spool_id}",
@@ -390,14 +698,33 @@ class MmuServer:
         )
         if response.status_code == 404:
             logging.error(f"'{self.spoolman.spoolman_url}/v1/spool/{spool_id}' not found")
-            await self._log_n_send(f"SpoolId {spool_id} not found", error=True, silent=False)
-            return False
+            return WRITE_NOT_FOUND
         elif response.has_error():
             err_msg = self.spoolman._get_response_error(response)
-            logging.error(f"Attempt to unset spool failed: {err_msg}")
-            await self._log_n_send(f"Failed to unset spool {spool_id}. Look at moonraker.log for more details", error=True, silent=False)
-            return False
-        return True
+            logging.error(f"Attempt to update spool {spool_id} failed: {err_msg}")
+            return WRITE_TRANSIENT if response.status_code in (408, 429) or response.status_code >= 500 else WRITE_ERROR
+        self.spool_location[spool_id] = (printer, gate, self.spool_location.get(spool_id, ('', -1, {}))[2])
+        return WRITE_OK
+
+    async def _check_gate_map_endpoint(self):
+        '''
+        Determine if Happy Hare registered the 'mmu/gate_map' webhooks endpoint
+        '''
+        result = await self.klippy_apis.list_endpoints(default=None)
+        self.gate_map_endpoint = result is not None and "mmu/gate_map" in result.get('endpoints', [])
+        if not self.gate_map_endpoint:
+            logging.info("Happy Hare 'mmu/gate_map' endpoint not available. Using MMU_GATE_MAP gcode for gate map updates")
+
+    async def _reset_gate_map_endpoint(self):
+        self.gate_map_endpoint = None
+
+    async def _send_gate_map_request(self, gate_dict, replace):
+        '''
+        Send gate map update to Happy Hare's 'mmu/gate_map' endpoint.
+        KlippyAPI has no public method for arbitrary endpoints so this is the only use of its private
+        _send_klippy_request(). Revisit if moonraker changes it
+        '''
+        await self.klippy_apis._send_klippy_request("mmu/gate_map", {'map': gate_dict, 'replace': replace, 'from_spoolman': True})
 
     async def _send_gate_map_update(self, gate_ids, replace=False, silent=False) -> bool:
         '''
@@ -416,6 +743,16 @@ class MmuServer:
                 )
                 for gate, spool_id in gate_ids
             }
+            # Prefer structured (json) update over serializing into gcode command
+            if self.gate_map_endpoint is None:
+                await self._check_gate_map_endpoint()
+            if self.gate_map_endpoint:
+                try:
+                    await self._send_gate_map_request(gate_dict, replace)
+                except Exception as e:
+                    await self._log_n_send(f"Exception sending gate map update to Happy Hare: {str(e)}", error=True, silent=silent)
+                    return False
+                return True
             try:
                 await self.klippy_apis.run_gcode(f"MMU_GATE_MAP MAP=\"{gate_dict}\" {'REPLACE=1' if replace else ''} FROM_SPOOLMAN=1 QUIET=1")
             except Exception as e:
@@ -425,11 +762,15 @@ class MmuServer:
 
     async def refresh_cache(self, fix=False, silent=False) -> bool:
         '''
-        Rebuilds the local cache of essential spool information
+        Rebuilds the local cache of essential spool information unless it is being kept current
+        by Spoolman change notifications, in which case only the assignment checks are run
         '''
         if not await self._check_init_spoolman(): return
         async with self.cache_lock:
             await self._initialize_mmu()
+            if self.spool_cache_synced:
+                # Cache is current from change notifications so no need to refetch
+                return await self._check_spool_assignments(fix=fix, silent=silent)
             return await self._build_spool_location_cache(fix=fix, silent=silent)
 
     async def get_filaments(self, gate_ids, silent=False) -> bool:
@@ -443,8 +784,8 @@ class MmuServer:
     async def push_gate_map(self, gate_ids=None, silent=False) -> bool:
         '''
         Store the gate map for the printer for a list of (gate, spool_id) tuples.
-        This attempts to reduce the number of necessary tasks and then run them in parallel
-        Then updates Happy Hare with filament attributes
+        This attempts to reduce the number of necessary writes and queues them to the write pipeline
+        Happy Hare is updated with filament attributes without waiting for the writes to complete
         '''
         if not await self._check_init_spoolman(): return
         async with self.cache_lock:
@@ -469,39 +810,37 @@ class MmuServer:
             # If setting a full gate map, include updates for "dirty" spool id's
             # that are not otherwise going to be overwritten
             if len(gate_ids) == self.nb_gates:
-                for spool_id, (p_name, gate, _) in self.spool_location.items():
-                    if p_name == self.printer_hostname and not any(s == spool_id for _, s in gate_ids):
+                mapped_sids = set(s for _, s in gate_ids)
+                for spool_id in self._find_all_spool_ids(self.printer_hostname, None):
+                    if spool_id not in mapped_sids:
                         updates[spool_id] = -1
 
-            # Create minimal set of async tasks to update Spoolman db and run them in parallel
+            # Queue minimal set of writes to Spoolman db. They run with bounded concurrency in the write pipeline
+            old_locations = {sid: self.spool_location.get(sid, ('', -1, {})) for sid in updates}
             tasks = {
-                sid: (
-                    self._unset_spool_gate(sid, silent=silent),
-                    None
-                ) if updates[sid] < 0 else (
-                    self._set_spool_gate(sid, self.printer_hostname, updates[sid], silent=silent),
-                    updates[sid]
+                sid: asyncio.ensure_future(
+                    self._unset_spool_gate(sid, silent=silent) if updates[sid] < 0 else
+                    self._set_spool_gate(sid, self.printer_hostname, updates[sid], silent=silent)
                 )
                 for sid in updates.keys()
             }
-            results = await asyncio.gather(*[task for task,_ in tasks.values()])
 
-            # Log results and update cache
-            for sid, result in zip(tasks.keys(), results):
-                if result:
-                    old_printer, old_gate, filament_attr = self.spool_location.get(sid, ('', -1, {}))
-                    gate = tasks[sid][1]
-                    if updates[sid] < 0: # 'unset' case
-                        self.spool_location[sid] = ('', -1, filament_attr)
-                        self.server.send_event("spoolman:unset_spool_gate", {"spool_id": sid, "printer": old_printer, "gate": old_gate})
-                        await self._log_n_send(f"Spool {sid} unassigned from printer {old_printer} and gate {old_gate} in Spoolman db", silent=silent)
-                    else: # 'set' case
-                        self.spool_location[sid] = (self.printer_hostname, gate, filament_attr)
-                        self.server.send_event("spoolman:set_spool_gate", {"spool_id": sid, "printer": self.printer_hostname, "gate": gate})
-                        await self._log_n_send(f"Spool {sid} assigned to printer {self.printer_hostname} @ gate {gate} in Spoolman db", silent=silent)
+            # Send update of filament attributes back to Happy Hare now. It does not depend on write results
+            synced = await self._send_gate_map_update(gate_ids, silent=silent)
 
-            # Send update of filament attributes back to Happy Hare
-            return await self._send_gate_map_update(gate_ids, silent=silent)
+        # Log results as each write completes (cache is updated by write pipeline). Lock is not held so a
+        # slow Spoolman response does not block other requests
+        async for sid, result in SpoolmanWriteQueue.as_completed(tasks):
+            if result:
+                old_printer, old_gate, _ = old_locations[sid]
+                gate = updates[sid]
+                if gate < 0: # 'unset' case
+                    self.server.send_event("spoolman:unset_spool_gate", {"spool_id": sid, "printer": old_printer, "gate": old_gate})
+                    await self._log_n_send(f"Spool {sid} unassigned from printer {old_printer} and gate {old_gate} in Spoolman db", silent=silent)
+                else: # 'set' case
+                    self.server.send_event("spoolman:set_spool_gate", {"spool_id": sid, "printer": self.printer_hostname, "gate": gate})
+                    await self._log_n_send(f"Spool {sid} assigned to printer {self.printer_hostname} @ gate {gate} in Spoolman db", silent=silent)
+        return synced
 
     async def pull_gate_map(self, silent=False) -> bool:
         '''
@@ -527,19 +866,18 @@ class MmuServer:
             if not silent:
                 logging.info(f"Clearing gate map for printer: {printer_name}")
 
-            # Create minimal set of async tasks to update Spoolman db and run them in parallel
+            # Create minimal set of writes to Spoolman db. They run with bounded concurrency in the write pipeline
             old_sids = self._find_all_spool_ids(printer_name, None)
             tasks = {sid: self._unset_spool_gate(sid, silent=silent) for sid in old_sids}
-            results = await asyncio.gather(*tasks.values())
+            old_locations = {sid: self.spool_location.get(sid, ('', -1, {})) for sid in tasks}
 
-            # Log results and update cache
+            # Log results (cache is updated by _set_spool_gate/_unset_spool_gate)
             updated_gate_ids = {}
-            for sid, result in zip(tasks.keys(), results):
+            async for sid, result in SpoolmanWriteQueue.as_completed(tasks):
                 if result:
-                    old_printer, old_gate, filament_attr = self.spool_location.get(sid, ('', -1, {}))
+                    old_printer, old_gate, _ = old_locations[sid]
                     if old_printer == self.printer_hostname and 0 <= old_gate < self.nb_gates and not updated_gate_ids.get(old_gate):
                         updated_gate_ids[old_gate] = -1
-                    self.spool_location[sid] = ('', -1, filament_attr)
                     self.server.send_event("spoolman:unset_spool_gate", {"spool_id": sid, "printer": old_printer, "gate": old_gate})
                     await self._log_n_send(f"Spool {sid} unassigned from printer {old_printer} and gate {old_gate}", silent=silent)
 
@@ -580,26 +918,25 @@ class MmuServer:
             if not silent:
                 logging.info(f"Attempting to set gate {gate} for printer {self.printer_hostname}")
 
-            # Create minimal set of async tasks to update Spoolman db and run them in parallel
+            # Create minimal set of writes to Spoolman db. They run with bounded concurrency in the write pipeline
             old_sids = self._find_all_spool_ids(self.printer_hostname, gate)
             tasks = {
                 sid: (self._unset_spool_gate(sid, silent=silent), None)
                 for sid in old_sids if sid != spool_id
             }
             tasks[spool_id] = (self._set_spool_gate(spool_id, self.printer_hostname, gate, silent=silent), gate)
-            results = await asyncio.gather(*[task for task,_ in tasks.values()])
+            old_locations = {sid: self.spool_location.get(sid, ('', -1, {})) for sid in tasks}
 
-            # Log results and update cache
+            # Log results (cache is updated by _set_spool_gate/_unset_spool_gate)
             updated_gate_ids = {}
-            for sid, result in zip(tasks.keys(), results):
+            async for sid, result in SpoolmanWriteQueue.as_completed({sid: task for sid, (task, _) in tasks.items()}):
                 if result:
-                    old_printer, old_gate, filament_attr = self.spool_location.get(sid, ('', -1, {}))
+                    old_printer, old_gate, _ = old_locations[sid]
                     gate = tasks[sid][1]
                     if sid in old_sids and sid != spool_id:
                         # 'unset' case
                         if old_printer == self.printer_hostname and 0 <= old_gate < self.nb_gates and not updated_gate_ids.get(old_gate):
                             updated_gate_ids[old_gate] = -1
-                        self.spool_location[sid] = ('', -1, filament_attr)
                         self.server.send_event("spoolman:unset_spool_gate", {"spool_id": sid, "printer": old_printer, "gate": old_gate})
                         await self._log_n_send(f"Spool {sid} unassigned from printer {old_printer} and gate {old_gate} in Spoolman db", silent=silent)
                     else:
@@ -608,7 +945,6 @@ class MmuServer:
                             if old_printer == self.printer_hostname and 0 <= old_gate < self.nb_gates and not updated_gate_ids.get(old_gate):
                                 updated_gate_ids[old_gate] = -1
                             updated_gate_ids[gate] = sid
-                        self.spool_location[sid] = (self.printer_hostname, gate, filament_attr)
                         self.server.send_event("spoolman:set_spool_gate", {"spool_id": sid, "printer": self.printer_hostname, "gate": gate})
                         await self._log_n_send(f"Spool {sid} assigned to printer {self.printer_hostname} @ gate {gate} in Spoolman db", silent=silent)
 
@@ -638,19 +974,18 @@ class MmuServer:
                     await self._log_n_send(f"Trying to unset spool {spool_id} but not found in cache. Perhaps try refreshing cache", error=True, silent=silent)
                     return False
 
-            # Create minimal set of async tasks to update Spoolman db and run them in parallel
+            # Create minimal set of writes to Spoolman db. They run with bounded concurrency in the write pipeline
             sids = self._find_all_spool_ids(self.printer_hostname, gate) if gate is not None else [spool_id]
             tasks = {sid: self._unset_spool_gate(sid, silent=silent) for sid in sids}
-            results = await asyncio.gather(*tasks.values())
+            old_locations = {sid: self.spool_location.get(sid, ('', -1, {})) for sid in tasks}
 
-            # Log results and update cache
+            # Log results (cache is updated by _set_spool_gate/_unset_spool_gate)
             updated_gate_ids = {}
-            for sid, result in zip(tasks.keys(), results):
+            async for sid, result in SpoolmanWriteQueue.as_completed(tasks):
                 if result:
-                    old_printer, old_gate, filament_attr = self.spool_location.get(sid, ('', -1, {}))
+                    old_printer, old_gate, _ = old_locations[sid]
                     if old_printer == self.printer_hostname and 0 <= old_gate < self.nb_gates and not updated_gate_ids.get(old_gate):
                         updated_gate_ids[old_gate] = -1
-                    self.spool_location[sid] = ('', -1, filament_attr)
                     self.server.send_event("spoolman:unset_spool_gate", {"spool_id": sid, "old_printer": self.printer_hostname, "old_gate": gate})
                     await self._log_n_send(f"Spool {sid} unassigned from printer {old_printer} and gate {old_gate} in Spoolman db", silent=silent)
 
@@ -694,7 +1029,9 @@ class MmuServer:
             msg += f"  - Remaining: {f_remaining_weight}\n"
 
             # Check if spool_id is assigned
-            spool = next((gate for sid, (printer, gate, _) in self.spool_location.items() if spool_id == sid and self.printer_hostname == printer), None)
+            printer, spool, _ = self.spool_location.get(spool_id, ('', None, {}))
+            if printer != self.printer_hostname:
+                spool = None
             if spool is not None:
                 msg += f"  - Gate: {spool}"
             else:
@@ -711,7 +1048,7 @@ class MmuServer:
         async with self.cache_lock:
             await self._initialize_mmu()
             printer_name = printer or self.printer_hostname
-            filtered = sorted(((spool_id, gate) for spool_id, (printer, gate, _) in self.spool_location.items() if printer == printer_name), key=lambda x: x[1])
+            filtered = sorted(((spool_id, self.spool_location[spool_id][1]) for spool_id in self._find_all_spool_ids(printer_name, None)), key=lambda x: x[1])
             if filtered:
                 msg = f"Spoolman gate assignment for printer: {printer_name}\n"
                 msg += "Gate | SpoolId\n"
@@ -740,6 +1077,87 @@ class MmuServer:
         from .file_manager import file_manager
         file_manager.METADATA_SCRIPT = os.path.abspath(__file__) + args
 
+    # Pre-process uploads in a pool of processes as soon as they arrive. The metadata script run by
+    # file_manager remains in place and will find the file already processed (or wait on the file lock)
+    def setup_preprocess_service(self, config):
+        self.preprocess_workers = config.getint("preprocess_workers", os.cpu_count() or 1, minval=1)
+        self.preprocess_nextpos = config.getboolean("enable_toolchange_next_pos", True)
+        self.preprocess_pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.preprocess_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _filelist_changed(self, response):
+        action = response.get('action')
+        item = response.get('item', {})
+        filename = item.get('path', '')
+        if item.get('root', 'gcodes') != 'gcodes' or not filename.endswith('.gcode'):
+            return
+        if action in ('delete_file', 'move_file'):
+            self._update_toolchange_index(response)
+            return
+        if action != 'create_file':
+            return
+        if self.preprocess_pool is None or filename in self.preprocess_pending:
+            return
+        self.preprocess_pending.add(filename)
+        asyncio.create_task(self._preprocess_upload(filename))
+
+    # Each upload is processed by a single worker. Tool discovery happens in the same streaming pass that
+    # rewrites the file so there is nothing to gain by splitting a file across the pool. All file access
+    # (including the already processed check) happens in the worker, never on the event loop
+    async def _preprocess_upload(self, filename):
+        loop = asyncio.get_running_loop()
+        gcode_dir = self.server.lookup_component("file_manager").get_directory()
+        try:
+            msgs = await loop.run_in_executor(self.preprocess_pool, preprocess_in_place, gcode_dir, filename, True, self.preprocess_nextpos)
+            for msg in msgs:
+                logging.info(msg)
+        except Exception as e:
+            logging.error(f"mmu_server: Parallel pre-processing of {filename} failed: {str(e)}")
+        finally:
+            self.preprocess_pending.discard(filename)
+
+    # Keep tool change index sidecar with its gcode file
+    def _update_toolchange_index(self, response):
+        if not toolchange_index:
+            return
+        index_file_for = toolchange_index.toolchange_index_file
+        gcode_dir = self.server.lookup_component("file_manager").get_directory()
+        if response.get('action') == 'delete_file':
+            index_file = index_file_for(os.path.join(gcode_dir, response['item']['path']))
+            new_index_file = None
+        else:
+            source = response.get('source_item', {})
+            if source.get('root', 'gcodes') != 'gcodes':
+                return
+            index_file = index_file_for(os.path.join(gcode_dir, source.get('path', '')))
+            new_index_file = index_file_for(os.path.join(gcode_dir, response['item']['path']))
+        try:
+            if not os.path.exists(index_file):
+                return
+            if new_index_file:
+                os.replace(index_file, new_index_file)
+            else:
+                os.remove(index_file)
+        except OSError as e:
+            logging.warning(f"mmu_server: Unable to update tool change index {index_file}: {str(e)}")
+
+    def close(self) -> None:
+        if self.spool_watch_task is not None:
+            self.spool_watch_task.cancel()
+        if self.preprocess_pool is not None:
+            self.preprocess_pool.shutdown(wait=False, cancel_futures=True)
+
+    # Expose cached gcode metadata so tool map lookups don't have to rescan the file
+    def setup_metadata_endpoint(self):
+        from ..common import RequestType
+        self.server.register_endpoint("/server/mmu/gcode_metadata", RequestType.GET, self._handle_gcode_metadata)
+
+    async def _handle_gcode_metadata(self, web_request: WebRequest) -> Dict[str, Any]:
+        filename = web_request.get_str("filename")
+        gcode_dir = self.server.lookup_component("file_manager").get_directory()
+        cache = GcodeMetadataCache(GcodeMetadataCache.cache_file_for(gcode_dir))
+        entry = await self.server.get_event_loop().run_in_thread(cache.lookup, os.path.join(gcode_dir, filename))
+        return {'filename': filename, 'metadata': entry}
+
 def load_component(config):
     return MmuServer(config)
 
@@ -799,152 +1217,373 @@ def gcode_processed_already(file_path):
         line = in_file.readline()
         return mmu_regex.match(line)
 
-def parse_gcode_file(file_path):
-    slicer_regex = re.compile(SLICER_REGEX, re.IGNORECASE)
-    has_tools_placeholder = has_total_toolchanges = has_colors_placeholder = has_temps_placeholder = has_materials_placeholder = has_purge_volumes_placeholder = filament_names_placeholder = False
-    found_colors = found_temps = found_materials = found_purge_volumes = found_filament_names = found_flush_multiplier = False
-    slicer = None
+# Bytes at head and tail of the file searched for slicer identification and config metadata
+METADATA_WINDOW = 1024 * 1024
 
-    tools_used = set()
-    total_toolchanges = 0
-    colors = []
-    temps = []
-    materials = []
-    purge_volumes = []
-    filament_names = []
-    flush_multiplier = 1.0 # Initialize flush_multiplier to 1.0
+# Slicer config block markers. PrusaSlicer/SuperSlicer use "; <slicer>_config = begin/end" and
+# OrcaSlicer/BambuStudio use "; CONFIG_BLOCK_START/END"
+CONFIG_BLOCK_START_REGEX = rb"^; (?:CONFIG_BLOCK_START|\w+_config = begin)[ \t]*\r?$"
+CONFIG_BLOCK_END_REGEX = rb"^; (?:CONFIG_BLOCK_END|\w+_config = end)[ \t]*\r?$"
 
-    with open(file_path, 'r') as in_file:
-        for line in in_file:
-            # Discover slicer
-            if not slicer and line.startswith(";"):
-                match = slicer_regex.match(line)
-                if match:
-                    slicer = match.group(1) or match.group(2)
-    if slicer in AUTHORZIED_SLICERS:
-        if isinstance(TOOL_DISCOVERY_REGEX, dict):
-            tools_regex = re.compile(TOOL_DISCOVERY_REGEX[slicer], re.IGNORECASE)
-        else:
-            tools_regex = re.compile(TOOL_DISCOVERY_REGEX, re.IGNORECASE)
-        if isinstance(COLORS_REGEX, dict):
-            colors_regex = re.compile(COLORS_REGEX[slicer], re.IGNORECASE)
-        else:
-            colors_regex = re.compile(COLORS_REGEX, re.IGNORECASE)
-        if isinstance(TEMPS_REGEX, dict):
-            temps_regex = re.compile(TEMPS_REGEX[slicer], re.IGNORECASE)
-        else:
-            temps_regex = re.compile(TEMPS_REGEX, re.IGNORECASE)
-        if isinstance(MATERIALS_REGEX, dict):
-            materials_regex = re.compile(MATERIALS_REGEX[slicer], re.IGNORECASE)
-        else:
-            materials_regex = re.compile(MATERIALS_REGEX, re.IGNORECASE)
-        if isinstance(PURGE_VOLUMES_REGEX, dict):
-            purge_volumes_regex = re.compile(PURGE_VOLUMES_REGEX[slicer], re.IGNORECASE)
-        else:
-            purge_volumes_regex = re.compile(PURGE_VOLUMES_REGEX, re.IGNORECASE)
-        if isinstance(FILAMENT_NAMES_REGEX, dict):
-            filament_names_regex = re.compile(FILAMENT_NAMES_REGEX[slicer], re.IGNORECASE)
-        else:
-            filament_names_regex = re.compile(FILAMENT_NAMES_REGEX, re.IGNORECASE)
+# Placeholders whose value is only known once the whole body has been read. The output reserves
+# worst case width for these (tool numbers are limited to two digits) and back-patches at the end
+DEFERRED_PLACEHOLDER_WIDTHS = {
+    METADATA_TOOL_DISCOVERY: len(",".join(map(str, range(100)))),
+    METADATA_TOTAL_TOOLCHANGES: 10,
+}
+
+# Persistent cache of extracted metadata (stored alongside gcodes directory)
+METADATA_CACHE_FILE = "mmu_gcode_metadata_cache.json"
+METADATA_CACHE_MAX_ENTRIES = 500
+METADATA_CACHE_MAX_BYTES = 4 * 1024 * 1024
+METADATA_CACHE_HASH_WINDOW = 64 * 1024 # Bytes of head and tail hashed for content key
+METADATA_CACHE_SAMPLES = 16            # Additional samples of body hashed for content key
+METADATA_CACHE_SAMPLE_SIZE = 4096
+
+# Byte level processing of body
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+SEMICOLON, UPPER_G, UPPER_T = ord(';'), ord('G'), ord('T')
+TOOL_FIRST_BYTES = frozenset(b'TtMm') # Possible first characters of TOOL_DISCOVERY_REGEX matches
+G0_G1 = (b'0', b'1')
+
+# Tool change index sidecar file. The layout is defined only by the klippy side reader which has no klipper
+# dependencies (this file is linked into moonraker from the same Happy Hare checkout)
+TOOLCHANGE_INDEX_MODULE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "extras", "mmu", "mmu_toolchange_index.py")
+TOOLCHANGE_COMMAND = b"MMU_CHANGE_TOOL TOOL="
+
+def _load_toolchange_index_module():
+    try:
+        spec = importlib.util.spec_from_file_location("mmu_toolchange_index", TOOLCHANGE_INDEX_MODULE)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    except Exception as e:
+        logging.warning(f"mmu_server: Tool change index disabled. Unable to load {TOOLCHANGE_INDEX_MODULE}: {str(e)}")
+        return None
+
+toolchange_index = _load_toolchange_index_module()
+
+ALL_PLACEHOLDERS = [METADATA_TOOL_DISCOVERY, METADATA_TOTAL_TOOLCHANGES, METADATA_COLORS, METADATA_TEMPS, METADATA_MATERIALS, METADATA_PURGE_VOLUMES, METADATA_FILAMENT_NAMES]
+
+def _compile_slicer_regex(regex, slicer):
+    return re.compile(regex[slicer] if isinstance(regex, dict) else regex, re.IGNORECASE)
+
+class GcodeMetadata:
+    """Accumulates tool usage and slicer config metadata from gcode lines"""
+
+    def __init__(self, slicer):
+        self.slicer = slicer
+        self.has_placeholder = False
+
+        self.tools_used = set()
+        self.total_toolchanges = 0
+        self.colors = []
+        self.temps = []
+        self.materials = []
+        self.purge_volumes = []
+        self.filament_names = []
+        self.toolchanges = [] # Tool change index records (not cached)
+        self.flush_multiplier = 1.0 # Initialize flush_multiplier to 1.0
+        self.found_colors = self.found_temps = self.found_materials = self.found_purge_volumes = self.found_filament_names = self.found_flush_multiplier = False
+
+        if slicer not in AUTHORZIED_SLICERS:
+            return
+        self.tools_regex = _compile_slicer_regex(TOOL_DISCOVERY_REGEX, slicer)
+        self.colors_regex = _compile_slicer_regex(COLORS_REGEX, slicer)
+        self.temps_regex = _compile_slicer_regex(TEMPS_REGEX, slicer)
+        self.materials_regex = _compile_slicer_regex(MATERIALS_REGEX, slicer)
+        self.purge_volumes_regex = _compile_slicer_regex(PURGE_VOLUMES_REGEX, slicer)
+        self.filament_names_regex = _compile_slicer_regex(FILAMENT_NAMES_REGEX, slicer)
+        self.flush_multiplier_regex = _compile_slicer_regex(FLUSH_MULTIPLIER_REGEX, slicer)
+
+    def parse_placeholders(self, line):
+        if not self.has_placeholder and '!' in line:
+            self.has_placeholder = any(p in line for p in ALL_PLACEHOLDERS)
+
+    def parse_tool(self, line):
+        # !referenced_tools! and !total_toolchanges! processing
+        match = self.tools_regex.match(line)
+        if match:
+            self.tools_used.add(int(match.group("tool")))
+            self.total_toolchanges += 1
+
+    def parse_config(self, line):
+        # !colors! processing
+        if not self.found_colors:
+            match = self.colors_regex.match(line)
+            if match:
+                colors_csv = [color.strip().lstrip('#') for color in match.group(1).split(';')]
+                if not self.colors:
+                    self.colors.extend(colors_csv)
+                else:
+                    self.colors = [n if o == '' else o for o,n in zip(self.colors, colors_csv)]
+                self.found_colors = all(len(c) > 0 for c in self.colors)
+
+        # !temperatures! processing
+        if not self.found_temps:
+            match = self.temps_regex.match(line)
+            if match:
+                temps_csv = re.split(';|,', match.group(2).strip())
+                self.temps.extend(temps_csv)
+                self.found_temps = True
+
+        # !materials! processing
+        if not self.found_materials:
+            match = self.materials_regex.match(line)
+            if match:
+                materials_csv = match.group(1).strip().split(';')
+                self.materials.extend(materials_csv)
+                self.found_materials = True
+
+        # flush_multiplier processing
+        if not self.found_flush_multiplier:
+            match = self.flush_multiplier_regex.match(line)
+            if match:
+                try:
+                    self.flush_multiplier = float(match.group(1).strip())
+                except ValueError:
+                    self.flush_multiplier = 1.0  # Default to 1.0 if conversion fails
+                self.found_flush_multiplier = True
+
+        # !purge_volumes! processing
+        if not self.found_purge_volumes:
+            match = self.purge_volumes_regex.match(line)
+            if match:
+                purge_volumes_csv = match.group(2).strip().split(',')
+                # Multiply each value by flush_multiplier
+                for volume_str in purge_volumes_csv:
+                    try:
+                        volume = float(volume_str)
+                        multiplied_volume = round(volume * self.flush_multiplier,1)
+                        self.purge_volumes.append(str(multiplied_volume))
+                    except ValueError:
+                        # If conversion fails, keep the original value
+                        self.purge_volumes.append(volume_str)
+                self.found_purge_volumes = True
+
+        # !filament_names! processing
+        if not self.found_filament_names:
+            match = self.filament_names_regex.match(line)
+            if match:
+                filament_names_csv = [e.strip() for e in re.split(',|;', match.group(2).strip())]
+                self.filament_names.extend(filament_names_csv)
+                self.found_filament_names = True
+
+    def placeholder_values(self, deferred=True):
+        """Returns list of (placeholder, value) pairs. Deferred (body derived) values can be excluded"""
+        values = []
+        if deferred:
+            values.append((METADATA_TOOL_DISCOVERY, ",".join(map(str, sorted(self.tools_used))) if self.tools_used else "0"))
+            values.append((METADATA_TOTAL_TOOLCHANGES, str(self.total_toolchanges)))
+        values.append((METADATA_COLORS, ",".join(map(str, self.colors))))
+        values.append((METADATA_TEMPS, ",".join(map(str, self.temps))))
+        values.append((METADATA_MATERIALS, ",".join(map(str, self.materials))))
+        values.append((METADATA_PURGE_VOLUMES, ",".join(map(str, self.purge_volumes))))
+        values.append((METADATA_FILAMENT_NAMES, ",".join(map(str, self.filament_names))))
+        return values
+
+    def to_dict(self):
+        return {
+            'slicer': self.slicer,
+            'tools_used': sorted(self.tools_used),
+            'total_toolchanges': self.total_toolchanges,
+            'colors': self.colors,
+            'temps': self.temps,
+            'materials': self.materials,
+            'purge_volumes': self.purge_volumes,
+            'filament_names': self.filament_names,
+        }
+
+    @classmethod
+    def from_dict(cls, entry):
+        gcode_metadata = cls(entry['slicer'])
+        gcode_metadata.tools_used = set(entry['tools_used'])
+        gcode_metadata.total_toolchanges = entry['total_toolchanges']
+        gcode_metadata.colors = list(entry['colors'])
+        gcode_metadata.temps = list(entry['temps'])
+        gcode_metadata.materials = list(entry['materials'])
+        gcode_metadata.purge_volumes = list(entry['purge_volumes'])
+        gcode_metadata.filament_names = list(entry['filament_names'])
+        return gcode_metadata
+
+class GcodeMetadataCache:
+    """
+    Persistent LRU cache of extracted gcode metadata keyed on file content. The key is the file
+    size plus a hash of the head, tail and a sparse sample of the body so computing it is cheap
+    regardless of file size. The cache is a json file bounded by number of entries and total
+    serialized size. Read-modify-write is serialized across processes with a lock file. Lookups
+    never write the file; recency of hits is remembered and applied on the next put.
+    A hit only saves reading the slicer config metadata when pre-processing; the body still has to
+    be rewritten. Lookups via /server/mmu/gcode_metadata are the only consumer that returns
+    without touching the gcode file
+    """
+
+    def __init__(self, cache_file, max_entries=METADATA_CACHE_MAX_ENTRIES, max_bytes=METADATA_CACHE_MAX_BYTES):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._hits = collections.OrderedDict()
+
+    @staticmethod
+    def cache_file_for(gcode_dir):
+        return os.path.join(os.path.dirname(os.path.normpath(gcode_dir)), METADATA_CACHE_FILE)
+
+    @staticmethod
+    def file_key(file_path):
+        size = os.path.getsize(file_path)
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as in_file:
+            if size <= 2 * METADATA_CACHE_HASH_WINDOW:
+                digest.update(in_file.read())
+            else:
+                digest.update(in_file.read(METADATA_CACHE_HASH_WINDOW))
+                step = (size - 2 * METADATA_CACHE_HASH_WINDOW) // (METADATA_CACHE_SAMPLES + 1)
+                for i in range(1, METADATA_CACHE_SAMPLES + 1):
+                    in_file.seek(METADATA_CACHE_HASH_WINDOW + i * step)
+                    digest.update(in_file.read(METADATA_CACHE_SAMPLE_SIZE))
+                in_file.seek(size - METADATA_CACHE_HASH_WINDOW)
+                digest.update(in_file.read(METADATA_CACHE_HASH_WINDOW))
+        return "%d-%s" % (size, digest.hexdigest())
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                return collections.OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            return collections.OrderedDict()
+
+    def _save(self, entries):
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_file, self.cache_file)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.cache_file + ".lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, key):
+        """Returns cached GcodeMetadata or None. Hits are marked most recently used on the next put"""
+        entry = self._load().get(key) # Cache file is replaced atomically so no lock is needed to read
+        if entry is None:
+            return None
+        self._hits.pop(key, None)
+        self._hits[key] = True
+        return GcodeMetadata.from_dict(entry)
+
+    def put(self, keys, gcode_metadata):
+        """Store metadata under one or more keys (e.g. original and processed file) and evict LRU entries"""
+        entry = gcode_metadata.to_dict()
+        with self._locked():
+            entries = self._load()
+            for key in self._hits:
+                if key in entries:
+                    entries.move_to_end(key)
+            self._hits.clear()
+            for key in keys:
+                entries.pop(key, None)
+                entries[key] = entry
+            sizes = [len(json.dumps(e)) for e in entries.values()]
+            total_bytes = sum(sizes)
+            for size in sizes:
+                if len(entries) <= self.max_entries and total_bytes <= self.max_bytes:
+                    break
+                entries.popitem(last=False)
+                total_bytes -= size
+            self._save(entries)
 
-        if isinstance(FLUSH_MULTIPLIER_REGEX, dict):
-            flush_multiplier_regex = re.compile(FLUSH_MULTIPLIER_REGEX[slicer], re.IGNORECASE)
+    def lookup(self, file_path):
+        """Returns cached metadata dict for file or None"""
+        gcode_metadata = self.get(self.file_key(file_path)) if os.path.isfile(file_path) else None
+        return gcode_metadata.to_dict() if gcode_metadata else None
+
+def detect_slicer(lines):
+    slicer_regex = re.compile(SLICER_REGEX, re.IGNORECASE)
+    for line in lines:
+        if line.startswith(";"):
+            match = slicer_regex.match(line)
+            if match:
+                return match.group(1) or match.group(2)
+    return None
+
+def find_config_block(mm, window=METADATA_WINDOW):
+    """
+    Locate (start, end) byte range of the slicer config block in memory mapped gcode. The tail
+    window is searched first (PrusaSlicer, SuperSlicer, OrcaSlicer) then the head (BambuStudio)
+    Returns None if no config block marker is found
+    """
+    size = len(mm)
+    start_regex = re.compile(CONFIG_BLOCK_START_REGEX, re.IGNORECASE | re.MULTILINE)
+    end_regex = re.compile(CONFIG_BLOCK_END_REGEX, re.IGNORECASE | re.MULTILINE)
+
+    match = None
+    for match in start_regex.finditer(mm, max(0, size - window)):
+        pass
+    if match is None:
+        match = start_regex.search(mm, 0, min(window, size))
+    if match is None:
+        return None
+    end_match = end_regex.search(mm, match.end())
+    return (match.start(), end_match.end() if end_match else size)
+
+def _window_lines(mm, start, end):
+    """Decode lines in byte range, discarding partial lines cut by the range boundaries"""
+    if start > 0:
+        start = mm.find(b'\n', start - 1, end) + 1 or end
+    if end < len(mm):
+        end = mm.rfind(b'\n', start, end) + 1 or start
+    return mm[start:end].decode(errors='replace').splitlines(True)
+
+def read_metadata_regions(file_path, window=METADATA_WINDOW):
+    """
+    Memory map file and extract just the regions holding slicer metadata so the metadata regexes
+    never touch the body. Returns (header_lines, config_lines) where header_lines is the bounded
+    head window (for slicer identification) and config_lines is the slicer config block or, if no
+    block markers are present, the bounded head and tail windows
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return [], []
+    with open(file_path, 'rb') as in_file, mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header_lines = _window_lines(mm, 0, min(window, size))
+        config_block = find_config_block(mm, window)
+        if config_block:
+            config_lines = _window_lines(mm, *config_block)
+        elif size <= 2 * window:
+            config_lines = _window_lines(mm, 0, size)
         else:
-            flush_multiplier_regex = re.compile(FLUSH_MULTIPLIER_REGEX, re.IGNORECASE)
+            config_lines = header_lines + _window_lines(mm, size - window, size)
+    return header_lines, config_lines
+
+def extract_metadata(file_path):
+    """Returns GcodeMetadata with slicer and config metadata (but not tool usage) populated"""
+    header_lines, config_lines = read_metadata_regions(file_path)
+    slicer = detect_slicer(header_lines) or detect_slicer(config_lines)
+    gcode_metadata = GcodeMetadata(slicer)
+    if slicer in AUTHORZIED_SLICERS:
+        for line in config_lines:
+            gcode_metadata.parse_config(line)
+    return gcode_metadata
 
+def parse_gcode_file(file_path):
+    """Legacy two pass processing. See preprocess_file() for single pass version"""
+    gcode_metadata = extract_metadata(file_path)
+    slicer = gcode_metadata.slicer
+    if slicer in AUTHORZIED_SLICERS:
+        # Only placeholder and tool change detection need to touch the body
         with open(file_path, 'r') as in_file:
             for line in in_file:
-                # !referenced_tools! and !total_toolchanges! processing
-                if not has_tools_placeholder and METADATA_TOOL_DISCOVERY in line:
-                    has_tools_placeholder = True
-
-                if not has_total_toolchanges and METADATA_TOTAL_TOOLCHANGES in line:
-                    has_total_toolchanges = True
-
-                match = tools_regex.match(line)
-                if match:
-                    tool = match.group("tool")
-                    tools_used.add(int(tool))
-                    total_toolchanges += 1
-
-                # !colors! processing
-                if not has_colors_placeholder and METADATA_COLORS in line:
-                    has_colors_placeholder = True
-
-                if not found_colors:
-                    match = colors_regex.match(line)
-                    if match:
-                        colors_csv = [color.strip().lstrip('#') for color in match.group(1).split(';')]
-                        if not colors:
-                            colors.extend(colors_csv)
-                        else:
-                            colors = [n if o == '' else o for o,n in zip(colors,colors_csv)]
-                        found_colors = all(len(c) > 0 for c in colors)
-
-                # !temperatures! processing
-                if not has_temps_placeholder and METADATA_TEMPS in line:
-                    has_temps_placeholder = True
-
-                if not found_temps:
-                    match = temps_regex.match(line)
-                    if match:
-                        temps_csv = re.split(';|,', match.group(2).strip())
-                        temps.extend(temps_csv)
-                        found_temps = True
-
-                # !materials! processing
-                if not has_materials_placeholder and METADATA_MATERIALS in line:
-                    has_materials_placeholder = True
-
-                if not found_materials:
-                    match = materials_regex.match(line)
-                    if match:
-                        materials_csv = match.group(1).strip().split(';')
-                        materials.extend(materials_csv)
-                        found_materials = True
-
-                # flush_multiplier processing
-                if not found_flush_multiplier:
-                    match = flush_multiplier_regex.match(line)
-                    if match:
-                        try:
-                            flush_multiplier = float(match.group(1).strip())
-                        except ValueError:
-                            flush_multiplier = 1.0  # Default to 1.0 if conversion fails
-                        found_flush_multiplier = True
-
-                # !purge_volumes! processing
-                if not has_purge_volumes_placeholder and METADATA_PURGE_VOLUMES in line:
-                    has_purge_volumes_placeholder = True
-
-                if not found_purge_volumes:
-                    match = purge_volumes_regex.match(line)
-                    if match:
-                        purge_volumes_csv = match.group(2).strip().split(',')
-                        # Multiply each value by flush_multiplier
-                        for volume_str in purge_volumes_csv:
-                            try:
-                                volume = float(volume_str)
-                                multiplied_volume = round(volume * flush_multiplier,1)
-                                purge_volumes.append(str(multiplied_volume))
-                            except ValueError:
-                                # If conversion fails, keep the original value
-                                purge_volumes.append(volume_str)
-                        found_purge_volumes = True
-
-                # !filament_names! processing
-                if not filament_names_placeholder and METADATA_FILAMENT_NAMES in line:
-                    filament_names_placeholder = True
-
-                if not found_filament_names:
-                    match = filament_names_regex.match(line)
-                    if match:
-                        filament_names_csv = [e.strip() for e in re.split(',|;', match.group(2).strip())]
-                        filament_names.extend(filament_names_csv)
-                        found_filament_names = True
-
-    return (has_tools_placeholder or has_total_toolchanges or has_colors_placeholder or has_temps_placeholder or has_materials_placeholder or has_purge_volumes_placeholder or filament_names_placeholder,
-            sorted(tools_used), total_toolchanges, colors, temps, materials, purge_volumes, filament_names, slicer)
+                gcode_metadata.parse_placeholders(line)
+                gcode_metadata.parse_tool(line)
+
+    return (gcode_metadata.has_placeholder, sorted(gcode_metadata.tools_used), gcode_metadata.total_toolchanges, gcode_metadata.colors, gcode_metadata.temps,
+            gcode_metadata.materials, gcode_metadata.purge_volumes, gcode_metadata.filament_names, slicer)
 
 def process_file(input_filename, output_filename, insert_nextpos, tools_used, total_toolchanges, colors, temps, materials, purge_volumes, filament_names):
 
@@ -992,25 +1631,24 @@ def process_file(input_filename, output_filename, insert_nextpos, tools_used, to
         outfile.write("; referenced_tools = %s\n" % ",".join(map(str, tools_used)))
 
 def add_placeholder(line, tools_used, total_toolchanges, colors, temps, materials, purge_volumes, filament_names):
+    values = [
+        (METADATA_TOOL_DISCOVERY, ",".join(map(str, tools_used)) if tools_used else "0"),
+        (METADATA_TOTAL_TOOLCHANGES, str(total_toolchanges)),
+        (METADATA_COLORS, ",".join(map(str, colors))),
+        (METADATA_TEMPS, ",".join(map(str, temps))),
+        (METADATA_MATERIALS, ",".join(map(str, materials))),
+        (METADATA_PURGE_VOLUMES, ",".join(map(str, purge_volumes))),
+        (METADATA_FILAMENT_NAMES, ",".join(map(str, filament_names))),
+    ]
+    return substitute_placeholders(line, values)
+
+def substitute_placeholders(line, values):
     # Ignore comment lines to preserve slicer metadata comments
     if not line.startswith(";"):
-        if METADATA_TOOL_DISCOVERY in line:
-            if tools_used:
-                line = line.replace(METADATA_TOOL_DISCOVERY, ",".join(map(str, tools_used)))
-            else:
-                line = line.replace(METADATA_TOOL_DISCOVERY, "0")
-        if METADATA_TOTAL_TOOLCHANGES in line:
-            line = line.replace(METADATA_TOTAL_TOOLCHANGES, str(total_toolchanges))
-        if METADATA_COLORS in line:
-            line = line.replace(METADATA_COLORS, ",".join(map(str, colors)))
-        if METADATA_TEMPS in line:
-            line = line.replace(METADATA_TEMPS, ",".join(map(str, temps)))
-        if METADATA_MATERIALS in line:
-            line = line.replace(METADATA_MATERIALS, ",".join(map(str, materials)))
-        if METADATA_PURGE_VOLUMES in line:
-            line = line.replace(METADATA_PURGE_VOLUMES, ",".join(map(str, purge_volumes)))
-        if METADATA_FILAMENT_NAMES in line:
-            line = line.replace(METADATA_FILAMENT_NAMES, ",".join(map(str, filament_names)))
+        if '!' in line:
+            for placeholder, value in values:
+                if placeholder in line:
+                    line = line.replace(placeholder, value)
     else:
         if METADATA_BEGIN_PURGING in line:
             line = line + "_MMU_STEP_SET_ACTION STATE=12\n"
@@ -1018,6 +1656,367 @@ def add_placeholder(line, tools_used, total_toolchanges, colors, temps, material
             line = line + "_MMU_STEP_SET_ACTION RESTORE=1\n"
     return line
 
+def parse_e(line, start):
+    """Parse the E value starting at index 'start' of a gcode move line or None if malformed"""
+    try:
+        return float(line[start:].split(None, 1)[0].split(b';', 1)[0])
+    except (ValueError, IndexError):
+        return None
+
+def _reserve_deferred_line(line):
+    """Returns reserved byte length of line with deferred placeholders at their worst case width"""
+    for placeholder, width in DEFERRED_PLACEHOLDER_WIDTHS.items():
+        line = line.replace(placeholder.encode(), b"x" * width)
+    return len(line)
+
+def _patch_deferred_lines(output_filename, deferred_lines, values, toolchanges):
+    """
+    Overwrite reserved lines in place now that body derived values are known, padding with trailing
+    spaces. If any patched line doesn't fit its reservation the file is rewritten instead and the
+    byte offsets of the tool change records are moved to match
+    """
+    patched_lines = []
+    overflow = False
+    for offset, line, reserved in deferred_lines:
+        eol = line[len(line.rstrip(b"\r\n")):]
+        for placeholder, value in values:
+            line = line.replace(placeholder, value)
+        patched = line[:len(line) - len(eol)] + b" " * (reserved - len(line)) + eol
+        overflow = overflow or len(patched) > reserved
+        patched_lines.append((offset, patched, reserved))
+
+    if not overflow:
+        with open(output_filename, 'r+b') as outfile:
+            for offset, patched, _ in patched_lines:
+                outfile.seek(offset)
+                outfile.write(patched)
+        return
+
+    tmp_filename = output_filename + ".tmp"
+    with open(output_filename, 'rb') as infile, open(tmp_filename, 'wb', buffering=WRITE_BUFFER_SIZE) as outfile:
+        pos = 0
+        for offset, patched, reserved in patched_lines:
+            _copy_bytes(infile, outfile, offset - pos)
+            outfile.write(patched)
+            infile.seek(offset + reserved)
+            pos = offset + reserved
+        shutil.copyfileobj(infile, outfile, READ_CHUNK_SIZE)
+    os.replace(tmp_filename, output_filename)
+
+    shift = 0
+    i = 0
+    for j, record in enumerate(toolchanges):
+        while i < len(patched_lines) and patched_lines[i][0] < record[0]:
+            shift += len(patched_lines[i][1]) - patched_lines[i][2]
+            i += 1
+        toolchanges[j] = (record[0] + shift,) + tuple(record[1:])
+
+def _copy_bytes(infile, outfile, length):
+    """Copy length bytes from current position of infile in large reads"""
+    while length > 0:
+        chunk = infile.read(min(length, READ_CHUNK_SIZE))
+        if not chunk:
+            break
+        outfile.write(chunk)
+        length -= len(chunk)
+
+def _read_line_chunks(infile, chunk_size=READ_CHUNK_SIZE):
+    """Yields lists of complete lines (with line endings) from large binary reads"""
+    remainder = b""
+    while True:
+        chunk = infile.read(chunk_size)
+        if not chunk:
+            break
+        if remainder:
+            chunk = remainder + chunk
+        end = chunk.rfind(b"\n") + 1
+        remainder = chunk[end:]
+        if end:
+            yield chunk[:end].splitlines(True)
+    if remainder:
+        yield [remainder]
+
+def preprocess_file(input_filename, output_filename, insert_nextpos, cached_metadata=None):
+    """
+    Single streaming pass that discovers tools, substitutes placeholders and optionally adds the
+    next position to tool changes. The slicer and its config metadata are read up front from the
+    memory mapped config block (or bounded head/tail) of the file. Placeholders that depend on
+    the whole body (tools used, number of toolchanges) are written with reserved width and
+    back-patched once the pass completes.
+
+    The body is processed as bytes in large chunks and lines are classified by first byte so the
+    tool and G1 regexes only run on candidate lines.
+    If cached_metadata (from a previous upload of identical content) is supplied, reading of the
+    slicer config metadata is skipped. Body derived values are always taken from this pass so the
+    output is consistent with the file even if the (sampled) cache key collides.
+    Returns GcodeMetadata (nothing is written if the slicer isn't supported)
+    """
+    gcode_metadata = cached_metadata or extract_metadata(input_filename)
+    if gcode_metadata.slicer not in AUTHORZIED_SLICERS:
+        return gcode_metadata
+
+    values = [(p.encode(), v.encode()) for p, v in gcode_metadata.placeholder_values(deferred=False)]
+    placeholders = [p.encode() for p in ALL_PLACEHOLDERS]
+    deferred_placeholders = [p.encode() for p in DEFERRED_PLACEHOLDER_WIDTHS]
+    begin_purging = METADATA_BEGIN_PURGING.encode()
+    end_purging = METADATA_END_PURGING.encode()
+    tools_regex = re.compile(TOOL_DISCOVERY_REGEX.encode(), re.IGNORECASE)
+    t_pattern = re.compile(T_PATTERN.encode())
+    g1_pattern = re.compile(G1_PATTERN.encode())
+    tools_used = gcode_metadata.tools_used = set()
+    total_toolchanges = 0
+    has_placeholder = False
+    deferred_lines = [] # (offset, line, reserved_len) of lines to back-patch
+
+    # Tool change index (see write_toolchange_index())
+    toolchanges = gcode_metadata.toolchanges = []
+    relative_e = False  # M82/M83
+    last_e = 0.         # Last absolute E position
+    extruded = 0.       # Estimated cumulative extrusion
+    line_no = 0         # Input line number
+    extra_lines = 1     # Lines added to output ahead of current input line (starts with fingerprint)
+    from_tool = -1
+
+    with open(input_filename, 'rb') as infile, open(output_filename, 'wb', buffering=WRITE_BUFFER_SIZE) as outfile:
+        write = outfile.write
+        buffer = [] # Buffer lines between a "T" line and the next matching "G1" line
+        tool = None # Store the tool number from a "T" line
+        write(f'{HAPPY_HARE_FINGERPRINT}\n'.encode())
+
+        def record_toolchange(x=None, y=None):
+            nonlocal from_tool
+            to_tool = int(tool)
+            toolchanges.append((outfile.tell(), tool_line_no, from_tool, to_tool,
+                                float('nan') if x is None else float(x), float('nan') if y is None else float(y), tool_extruded))
+            from_tool = to_tool
+
+        def write_line(line):
+            if line[0] != SEMICOLON and any(p in line for p in deferred_placeholders):
+                reserved = _reserve_deferred_line(line)
+                deferred_lines.append((outfile.tell(), line, reserved))
+                eol = line[len(line.rstrip(b"\r\n")):]
+                write(b" " * (reserved - len(eol)) + eol)
+            else:
+                write(line)
+
+        for lines in _read_line_chunks(infile):
+            for line in lines:
+                line_no += 1
+                c = line[0]
+                bang = b"!" in line
+                if bang and not has_placeholder:
+                    has_placeholder = any(p in line for p in placeholders)
+
+                if c == SEMICOLON:
+                    # Ignore comment lines to preserve slicer metadata comments
+                    if b"CP TOOLCHANGE" in line:
+                        if begin_purging in line:
+                            line = line + b"_MMU_STEP_SET_ACTION STATE=12\n"
+                            extra_lines += 1
+                        elif end_purging in line:
+                            line = line + b"_MMU_STEP_SET_ACTION RESTORE=1\n"
+                            extra_lines += 1
+                else:
+                    if c == UPPER_G:
+                        # Extrusion estimate for tool change index
+                        if line[1:2] in G0_G1:
+                            i = line.find(b" E")
+                            if i > 0:
+                                e = parse_e(line, i + 2)
+                                if e is not None:
+                                    if relative_e:
+                                        extruded += e
+                                    else:
+                                        extruded += e - last_e
+                                        last_e = e
+                        elif line.startswith(b"G92"):
+                            i = line.find(b" E")
+                            if i > 0:
+                                last_e = parse_e(line, i + 2) or 0.
+                    elif c in TOOL_FIRST_BYTES:
+                        if line.startswith(b"M83"):
+                            relative_e = True
+                        elif line.startswith(b"M82"):
+                            relative_e = False
+                        # !referenced_tools! and !total_toolchanges! processing
+                        match = tools_regex.match(line)
+                        if match:
+                            tools_used.add(int(match.group("tool")))
+                            total_toolchanges += 1
+                    if bang:
+                        for placeholder, value in values:
+                            if placeholder in line:
+                                line = line.replace(placeholder, value)
+
+                if tool is not None:
+                    # Buffer subsequent lines after a "T" line until next "G1" x,y move line is found
+                    buffer.append(line)
+                    if c == UPPER_G:
+                        g1_match = g1_pattern.match(line)
+                        if g1_match:
+                            # Now replace "T" line and write buffered lines, including the current "G1" line
+                            x, y = g1_match.groups()
+                            record_toolchange(x, y)
+                            if insert_nextpos:
+                                write(b'MMU_CHANGE_TOOL TOOL=%s NEXT_POS="%s,%s" ; T%s\n' % (tool, x, y, tool))
+                            else:
+                                write(b'MMU_CHANGE_TOOL TOOL=%s ; T%s\n' % (tool, tool))
+                            for buffered_line in buffer:
+                                write_line(buffered_line)
+                            buffer.clear()
+                            tool = None
+                    continue
+
+                if c == UPPER_T:
+                    t_match = t_pattern.match(line)
+                    if t_match:
+                        tool = t_match.group(1)
+                        tool_line_no = line_no + extra_lines
+                        tool_extruded = extruded
+                        continue
+                if bang:
+                    write_line(line)
+                else:
+                    write(line)
+
+        # If there is anything left in buffer it means there wasn't a final "G1" line
+        if buffer:
+            write(b"T%s\n" % tool)
+            tool_line_no += 1
+            record_toolchange()
+            write(b'MMU_CHANGE_TOOL TOOL=%s ; T%s\n' % (tool, tool))
+            for line in buffer:
+                write_line(line)
+
+        # Finally append "; referenced_tools =" as new metadata (why won't Prusa pick up my PR?)
+        write(("; referenced_tools = %s\n" % ",".join(map(str, sorted(tools_used)))).encode())
+
+    gcode_metadata.total_toolchanges = total_toolchanges
+    gcode_metadata.has_placeholder = has_placeholder
+    if deferred_lines:
+        values = [(p.encode(), v.encode()) for p, v in gcode_metadata.placeholder_values()]
+        _patch_deferred_lines(output_filename, deferred_lines, values, toolchanges)
+    return gcode_metadata
+
+def write_toolchange_index(gcode_file, toolchanges):
+    """
+    Write compact binary index of tool changes in processed gcode file. One fixed size record per
+    tool change sorted by byte offset so readers can binary search directly on the file
+    """
+    if toolchange_index:
+        toolchange_index.write_toolchange_index(gcode_file, toolchanges)
+
+def relocate_toolchanges(gcode_file, toolchanges):
+    """
+    Return tool change records with byte offset and line number moved to match gcode_file after it has
+    been rewritten by later processing that only adds or changes other lines (e.g. moonraker object
+    processing). Returns None if the tool change lines no longer match the records
+    """
+    relocated = []
+    with open(gcode_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        needle = b"\n" + TOOLCHANGE_COMMAND
+        pos, line = 0, 1
+        for record in toolchanges:
+            i = mm.find(needle, pos)
+            if i < 0:
+                return None
+            line += mm[pos:i + 1].count(b"\n")
+            pos = i + 1
+            tool = b"%d" % record[3]
+            start = pos + len(TOOLCHANGE_COMMAND)
+            if mm[start:start + len(tool) + 1] not in (tool + b" ", tool + b"\n"):
+                return None
+            relocated.append((pos, line) + tuple(record[2:]))
+        if mm.find(needle, pos) >= 0:
+            return None
+    return relocated
+
+def refresh_toolchange_index(gcode_file):
+    """
+    Re-align existing tool change index after gcode file was rewritten following pre-processing (moonraker
+    metadata runs object processing after us). Index is removed if it can't be re-aligned
+    """
+    if not toolchange_index:
+        return
+    index_file = toolchange_index.toolchange_index_file(gcode_file)
+    if not os.path.exists(index_file):
+        return
+    index = toolchange_index.MmuToolchangeIndex(gcode_file)
+    valid = index.is_valid()
+    index.close()
+    if valid:
+        return
+    records = toolchange_index.read_toolchange_index(index_file)
+    relocated = relocate_toolchanges(gcode_file, records) if records else None
+    if relocated:
+        toolchange_index.write_toolchange_index(gcode_file, relocated)
+    else:
+        os.remove(index_file)
+
+def preprocess_in_place(path, filename, insert_placeholders=False, insert_nextpos=False):
+    """
+    Pre-process gcode file (relative to gcode dir path) replacing it with the processed version.
+    An exclusive lock is held on the file so that the moonraker metadata script and the parallel
+    preprocessing service never process the same file at the same time. Whoever runs second will
+    find the file already processed. Returns list of log messages
+    """
+    msgs = []
+    file_path = os.path.join(path, filename)
+    fname = os.path.basename(file_path)
+    if not fname.endswith(".gcode"):
+        return msgs
+    if os.path.islink(file_path):
+        file_path = os.path.realpath(file_path)
+
+    with open(file_path, 'rb') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if gcode_processed_already(file_path):
+            return msgs
+        with tempfile.TemporaryDirectory() as tmp_dir_name:
+            tmp_file = os.path.join(tmp_dir_name, fname)
+
+            gcode_metadata = None
+            if insert_placeholders:
+                start = time.time()
+                cache = GcodeMetadataCache(GcodeMetadataCache.cache_file_for(path))
+                cache_key = cached_metadata = None
+                source = "metadata cache miss"
+                try:
+                    cache_key = cache.file_key(file_path)
+                    cached_metadata = cache.get(cache_key)
+                    if cached_metadata:
+                        source = "metadata cache hit"
+                except Exception as e:
+                    msgs.append(f"mmu_server: Metadata cache unavailable: {str(e)}")
+                gcode_metadata = preprocess_file(file_path, tmp_file, insert_nextpos, cached_metadata=cached_metadata)
+                msgs.append("mmu_server: Single pass pre-processing took %.2fs (%s). Detected gcode by slicer: %s" % (time.time() - start, source, gcode_metadata.slicer))
+
+            if gcode_metadata and ((insert_nextpos and len(gcode_metadata.tools_used) > 0) or gcode_metadata.has_placeholder):
+                msg = []
+                if gcode_metadata.has_placeholder:
+                    msg.append("Wrote MMU placeholders")
+                if insert_nextpos:
+                    msg.append("Inserted next position to tool changes")
+                msgs.append("mmu_server: %s" % ",".join(msg))
+
+                # Move temporary file back in place (always differs from original because of fingerprint)
+                shutil.move(tmp_file, file_path)
+                if gcode_metadata.toolchanges:
+                    try:
+                        write_toolchange_index(file_path, gcode_metadata.toolchanges)
+                    except Exception as e:
+                        msgs.append(f"mmu_server: Failed to write tool change index: {str(e)}")
+
+                # Cache under both original and processed content so re-uploads and later lookups are immediate
+                if cache_key:
+                    try:
+                        cache.put([cache_key, cache.file_key(file_path)], gcode_metadata)
+                    except Exception as e:
+                        msgs.append(f"mmu_server: Failed to update metadata cache: {str(e)}")
+            else:
+                msgs.append(f"No MMU metadata placeholders found in file: {file_path}")
+    return msgs
+
 def main(path, filename, insert_placeholders=False, insert_nextpos=False):
     file_path = os.path.join(path, filename)
     if not os.path.isfile(file_path):
@@ -1025,39 +2024,8 @@ def main(path, filename, insert_placeholders=False, insert_nextpos=False):
         sys.exit(-1)
     try:
         metadata.logger.info(f"mmu_server: Pre-processing file: {file_path}")
-        fname = os.path.basename(file_path)
-        if fname.endswith(".gcode") and not gcode_processed_already(file_path):
-            with tempfile.TemporaryDirectory() as tmp_dir_name:
-                tmp_file = os.path.join(tmp_dir_name, fname)
-
-                if insert_placeholders:
-                    start = time.time()
-                    has_placeholder, tools_used, total_toolchanges, colors, temps, materials, purge_volumes, filament_names, slicer = parse_gcode_file(file_path)
-                    metadata.logger.info("Reading placeholders took %.2fs. Detected gcode by slicer: %s" % (time.time() - start, slicer))
-                else:
-                    tools_used = total_toolchanges = colors = temps = materials = purge_volumes = filament_names = slicer = None
-                    has_placeholder = False
-
-                if (insert_nextpos and tools_used is not None and len(tools_used) > 0) or has_placeholder:
-                    start = time.time()
-                    msg = []
-                    if has_placeholder:
-                        msg.append("Writing MMU placeholders")
-                    if insert_nextpos:
-                        msg.append("Inserting next position to tool changes")
-                    process_file(file_path, tmp_file, insert_nextpos, tools_used, total_toolchanges, colors, temps, materials, purge_volumes, filament_names)
-                    metadata.logger.info("mmu_server: %s took %.2fs" % (",".join(msg), time.time() - start))
-
-                    # Move temporary file back in place
-                    if os.path.islink(file_path):
-                        file_path = os.path.realpath(file_path)
-                    if not filecmp.cmp(tmp_file, file_path):
-                        shutil.move(tmp_file, file_path)
-                    else:
-                        metadata.logger.info(f"Files are the same, skipping replacement of: {file_path} by {tmp_file}")
-                else:
-                    metadata.logger.info(f"No MMU metadata placeholders found in file: {file_path}")
-
+        for msg in preprocess_in_place(path, filename, insert_placeholders, insert_nextpos):
+            metadata.logger.info(msg)
     except Exception:
         metadata.logger.info(traceback.format_exc())
         sys.exit(-1)
@@ -1117,5 +2085,11 @@ if __name__ == "__main__":
     # Parsing for mmu placeholders and next pos insertion. We do this first so we can add additonal metadata
     main(config["gcode_dir"], config["filename"], args.placeholders, args.nextpos)
 
-    # Original metadata parser
-    metadata.main(config)
+    # Original metadata parser. Object processing can rewrite the file so tool change index is re-aligned after
+    try:
+        metadata.main(config)
+    finally:
+        try:
+            refresh_toolchange_index(os.path.realpath(os.path.join(config["gcode_dir"], config["filename"])))
+        except Exception:
+            metadata.logger.info(traceback.format_exc())
@@ -12,7 +12,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 #
-import gc, sys, ast, random, logging, time, contextlib, math, os.path, re, unicodedata, traceback
+import gc, sys, ast, copy, random, logging, time, contextlib, math, os.path, re, unicodedata, traceback
 
 # Klipper imports
 import chelper
@@ -26,13 +26,16 @@ from ..mmu_sensors              import MmuRunoutHelper
 
 # MMU subcomponent clases
 from .mmu_shared                import *
-from .mmu_logger                import MmuLogger
+from .mmu_logger                import MmuLogger, MmuColorCache
 from .mmu_selector              import *
 from .mmu_test                  import MmuTest
 from .mmu_utils                 import DebugStepperMovement, PurgeVolCalculator
 from .mmu_sensor_manager        import MmuSensorManager
 from .mmu_led_manager           import MmuLedManager
 from .mmu_sync_feedback_manager import MmuSyncFeedbackManager
+from .mmu_toolchange_index      import MmuToolchangeIndex
+from .mmu_persistence           import MmuVariablePersistence
+from .mmu_calibration_telemetry import MmuCalibrationTelemetry
 
 
 # Main klipper module
@@ -183,6 +186,7 @@ class Mmu:
     VARS_MMU_GEAR_ROTATION_DISTANCES  = "mmu_gear_rotation_distances"
     VARS_MMU_CALIB_BOWDEN_LENGTHS     = "mmu_calibration_bowden_lengths" # Per-gate calibrated bowden lengths
     VARS_MMU_CALIB_BOWDEN_HOME        = "mmu_calibration_bowden_home"    # Was encoder, gate or gear sensor used as reference point
+    VARS_MMU_CALIB_TELEMETRY          = "mmu_calibration_telemetry"      # Per-gate load/unload observations for autotuning
     VARS_MMU_CALIB_BOWDEN_LENGTH      = "mmu_calibration_bowden_length"  # DEPRECATED (for upgrade only)
     VARS_MMU_GEAR_ROTATION_DISTANCE   = "mmu_gear_rotation_distance"     # DEPRECATED (for upgrade only)
     VARS_MMU_CALIB_PREFIX             = "mmu_calibration_"               # DEPRECATED (for upgrade only)
@@ -211,6 +215,9 @@ class Mmu:
     AUTOMAP_COLOR          = 'color'
     AUTOMAP_OPTIONS        = [AUTOMAP_NONE, AUTOMAP_FILAMENT_NAME, AUTOMAP_SPOOL_ID, AUTOMAP_MATERIAL, AUTOMAP_CLOSEST_COLOR, AUTOMAP_COLOR]
 
+    # Deferred rotation_distance updates are skipped unless they shift the gear by at least one full step over this distance
+    ROTATION_DISTANCE_RESOLUTION_LENGTH = 100. # mm
+
     EMPTY_GATE_STATS_ENTRY = {'pauses': 0, 'loads': 0, 'load_distance': 0.0, 'load_delta': 0.0, 'unloads': 0, 'unload_distance': 0.0, 'unload_delta': 0.0, 'load_failures': 0, 'unload_failures': 0, 'quality': -1.}
 
     W3C_COLORS = [('aliceblue','#F0F8FF'), ('antiquewhite','#FAEBD7'), ('aqua','#00FFFF'), ('aquamarine','#7FFFD4'), ('azure','#F0FFFF'), ('beige','#F5F5DC'),
@@ -257,10 +264,14 @@ class Mmu:
         self.filament_remaining = 0.
         self._last_tool = self._next_tool = self.TOOL_GATE_UNKNOWN
         self._next_gate = None
+        self.prestaged_gates = set()          # Gates (not selected) with filament pre-staged at gear sensor
+        self._prestaging_gate = None          # Gate whose gear stepper is temporarily driven for pre-staging
         self.toolchange_retract = 0.          # Set from mmu_macro_vars
         self._can_write_variables = True
+        self.var_persistence = None           # Setup on connect
         self.toolchange_purge_volume = 0.
         self.mmu_logger = None                # Setup on connect
+        self._color_cache = MmuColorCache()   # Compiled color substitution of log messages
         self._standalone_sync = False         # Used to indicate synced extruder intention whilst out of print
         self._suppress_release_grip = False   # Used to suppress the relaxing of grip on recursive calls to prevent servo flutter
         self.bowden_start_pos = None
@@ -269,10 +280,16 @@ class Mmu:
         self.has_toolhead_cutter = False      # Form tip cutting macro (like _MMU_CUT_TIP)
         self._is_running_test = False         # True while running QA or soak tests
         self.slicer_tool_map = None
+        self._status_generations = dict((group, 0) for group in self.STATUS_GROUPS)
+        self._status_groups = {}              # Cache of built status groups {group: (key, values)}
+        self._status_last = {}                # Last status returned (for change detection)
+        self._status_changed = {}             # Status serial number at which each key last changed
+        self._status_serial = 0
 
         # Event handlers
         self.printer.register_event_handler('klippy:connect', self.handle_connect)
         self.printer.register_event_handler("klippy:disconnect", self.handle_disconnect)
+        self.printer.register_event_handler("klippy:shutdown", self.handle_shutdown)
         self.printer.register_event_handler("klippy:ready", self.handle_ready)
 
         # Instruct users to re-run ./install.sh if version number changes
@@ -319,6 +336,7 @@ class Mmu:
         self.autotune_rotation_distance = config.getint('autotune_rotation_distance', 0, minval=0, maxval=1)
         self.autocal_bowden_length = config.getint('autocal_bowden_length', 1, minval=0, maxval=1)
         self.autotune_bowden_length = config.getint('autotune_bowden_length', 0, minval=0, maxval=1)
+        self.autotune_samples = config.getint('autotune_samples', 20, minval=3, maxval=100) # Not exposed
         self.skip_cal_encoder = config.getint('skip_cal_encoder', 0, minval=0, maxval=1)
         self.autotune_encoder = config.getint('autotune_encoder', 0, minval=0, maxval=1) # Not exposed TODO placeholder for implementation
 
@@ -367,8 +385,10 @@ class Mmu:
         self.gate_load_retries = config.getint('gate_load_retries', 1, minval=1, maxval=5)
         self.gate_autoload = config.getint('gate_autoload', 1, minval=0, maxval=1)
         self.gate_final_eject_distance = config.getfloat('gate_final_eject_distance', 0)
+        self.lookahead_prestage = config.getint('lookahead_prestage', 0, minval=0, maxval=1) # Home next gate ahead of tool change (independent gates only)
         self.bypass_autoload = config.getint('bypass_autoload', 1, minval=0, maxval=1)
         self.encoder_dwell = config.getfloat('encoder_dwell', 0.1, minval=0., maxval=2.) # Not exposed
+        self.variables_write_delay = config.getfloat('variables_write_delay', 1., minval=0.) # Not exposed
         self.encoder_move_step_size = config.getfloat('encoder_move_step_size', 15., minval=5., maxval=25.) # Not exposed
 
         # Configuration for (fast) bowden move
@@ -471,6 +491,7 @@ class Mmu:
         # Logging
         self.log_level = config.getint('log_level', 1, minval=0, maxval=4)
         self.log_file_level = config.getint('log_file_level', 2, minval=-1, maxval=4)
+        self._update_log_threshold()
         self.log_statistics = config.getint('log_statistics', 0, minval=0, maxval=1)
         self.log_visual = config.getint('log_visual', 1, minval=0, maxval=1)
         self.log_startup_status = config.getint('log_startup_status', 1, minval=0, maxval=2)
@@ -590,6 +611,7 @@ class Mmu:
         self.gcode.register_command('MMU_SELECT', self.cmd_MMU_SELECT, desc = self.cmd_MMU_SELECT_help)
         self.gcode.register_command('MMU_SELECT_BYPASS', self.cmd_MMU_SELECT_BYPASS, desc = self.cmd_MMU_SELECT_BYPASS_help) # Alias for MMU_SELECT BYPASS=1
         self.gcode.register_command('MMU_PRELOAD', self.cmd_MMU_PRELOAD, desc = self.cmd_MMU_PRELOAD_help)
+        self.gcode.register_command('MMU_PRESTAGE', self.cmd_MMU_PRESTAGE, desc = self.cmd_MMU_PRESTAGE_help)
         self.gcode.register_command('MMU_CHANGE_TOOL', self.cmd_MMU_CHANGE_TOOL, desc = self.cmd_MMU_CHANGE_TOOL_help)
         # TODO Currently cannot not registered directly as Tx commands because cannot attach color/spool_id required by Mailsail
         #for tool in range(self.num_gates):
@@ -653,6 +675,12 @@ class Mmu:
         # Initializer tasks
         self.gcode.register_command('__MMU_BOOTUP', self.cmd_MMU_BOOTUP, desc = self.cmd_MMU_BOOTUP_help) # Bootup tasks
 
+        # Structured (json) gate map updates from moonraker components without gcode serialization
+        self._gate_map_requests = {} # Pending batches {request_id: [gate_map, replace, from_spoolman, result]}
+        self._gate_map_request_id = 0
+        self.printer.lookup_object('webhooks').register_endpoint("mmu/gate_map", self._handle_gate_map_request)
+        self.gcode.register_command('__MMU_GATE_MAP_UPDATE', self.cmd_MMU_GATE_MAP_UPDATE, desc = self.cmd_MMU_GATE_MAP_UPDATE_help)
+
         # Load development test commands
         _ = MmuTest(self)
 
@@ -701,6 +729,7 @@ class Mmu:
         self.mmu_toolhead = MmuToolHead(config, self)
         rails = self.mmu_toolhead.get_kinematics().rails
         self.gear_rail = rails[1]
+        self._pending_rd = None # (rd, steppers) waiting for next flush boundary
         self.mmu_extruder_stepper = self.mmu_toolhead.mmu_extruder_stepper # Will be a MmuExtruderStepper if 'self.homing_extruder' is True
 
         # Setup filament sensors that are also used for homing (endstops). Must be done during initialization
@@ -728,6 +757,7 @@ class Mmu:
             logging.info("MMU: Log: %s" % mmu_log)
             self.mmu_logger = MmuLogger(mmu_log)
             self.mmu_logger.log("\n\n\nMMU Startup -----------------------------------------------\n")
+            self._update_log_threshold()
 
     def handle_connect(self):
         self._setup_logging()
@@ -777,6 +807,8 @@ class Mmu:
         self.print_stats = self.printer.lookup_object("print_stats", None)
         if self.print_stats is None:
             self.log_debug("[virtual_sdcard] is not found in config, advanced state control is not possible")
+        self.virtual_sdcard = self.printer.lookup_object("virtual_sdcard", None)
+        self.toolchange_index = None # Lazily loaded tool change index for current print file
         self.pause_resume = self.printer.lookup_object('pause_resume', None)
         if self.pause_resume is None:
             raise self.config.error("MMU requires [pause_resume] to work, please add it to your config!")
@@ -797,6 +829,7 @@ class Mmu:
             revision_var = None
         if not self.save_variables or (rd_var is None and revision_var is None):
             raise self.config.error("Calibration settings file (mmu_vars.cfg) not found. Check [save_variables] section in mmu_macro_vars.cfg\nAlso ensure you only have a single [save_variables] section defined in your printer config and it contains the line: mmu__revision = 0. If not, add this line and restart")
+        self.var_persistence = MmuVariablePersistence(self, self.save_variables, write_delay=self.variables_write_delay)
 
         # Create autotune manager to oversee calibration updates based on available telemetry
         self.calibration_manager = MmuCalibrationManager(self)
@@ -806,10 +839,10 @@ class Mmu:
         if bowden_length:
             self.log_debug("Upgrading %s variable" % (self.VARS_MMU_CALIB_BOWDEN_LENGTH))
             bowden_lengths = self._ensure_list_size([round(bowden_length, 1)], self.num_gates)
-            self.save_variables.allVariables.pop(self.VARS_MMU_CALIB_BOWDEN_LENGTH, None)
+            self.delete_variable(self.VARS_MMU_CALIB_BOWDEN_LENGTH)
             # Can't write file now so we let this occur naturally on next write
-            self.save_variables.allVariables[self.VARS_MMU_CALIB_BOWDEN_LENGTHS] = bowden_lengths
-            self.save_variables.allVariables[self.VARS_MMU_CALIB_BOWDEN_HOME] = self.gate_homing_endstop
+            self.save_variable(self.VARS_MMU_CALIB_BOWDEN_LENGTHS, bowden_lengths)
+            self.save_variable(self.VARS_MMU_CALIB_BOWDEN_HOME, self.gate_homing_endstop)
 
         rotation_distance = self.save_variables.allVariables.get(self.VARS_MMU_GEAR_ROTATION_DISTANCE, None)
         if rotation_distance:
@@ -818,12 +851,12 @@ class Mmu:
             for i in range(self.num_gates):
                 ratio = self.save_variables.allVariables.get("%s%d" % (self.VARS_MMU_CALIB_PREFIX, i), 0)
                 rotation_distances.append(round(rotation_distance * ratio, 4))
-                self.save_variables.allVariables.pop("%s%d" % (self.VARS_MMU_CALIB_PREFIX, i), None)
-            self.save_variables.allVariables.pop(self.VARS_MMU_GEAR_ROTATION_DISTANCE, None)
+                self.delete_variable("%s%d" % (self.VARS_MMU_CALIB_PREFIX, i))
+            self.delete_variable(self.VARS_MMU_GEAR_ROTATION_DISTANCE)
             # Can't write file now so we let this occur naturally on next write
-            self.save_variables.allVariables[self.VARS_MMU_GEAR_ROTATION_DISTANCES] = rotation_distances
+            self.save_variable(self.VARS_MMU_GEAR_ROTATION_DISTANCES, rotation_distances)
         else:
-            self.save_variables.allVariables.pop("%s0" % self.VARS_MMU_CALIB_PREFIX, None)
+            self.delete_variable("%s0" % self.VARS_MMU_CALIB_PREFIX)
 
         # Load bowden length configuration (calibration set with MMU_CALIBRATE_BOWDEN) ----------------------
         self.bowden_lengths = self.save_variables.allVariables.get(self.VARS_MMU_CALIB_BOWDEN_LENGTHS, None)
@@ -851,8 +884,8 @@ class Mmu:
         else:
             self.bowden_lengths = [0] * self.num_gates
             self.calibration_status |= self.CALIBRATED_BOWDENS
-        self.save_variables.allVariables[self.VARS_MMU_CALIB_BOWDEN_LENGTHS] = self.bowden_lengths
-        self.save_variables.allVariables[self.VARS_MMU_CALIB_BOWDEN_HOME] = bowden_home
+        self.save_variable(self.VARS_MMU_CALIB_BOWDEN_LENGTHS, self.bowden_lengths)
+        self.save_variable(self.VARS_MMU_CALIB_BOWDEN_HOME, bowden_home)
 
         # Load gear rotation distance configuration (calibration set with MMU_CALIBRATE_GEAR) ---------------
         self.default_rotation_distance = self.gear_rail.steppers[0].get_rotation_distance()[0] # TODO Should probably be per gear in case they are disimilar?
@@ -877,7 +910,7 @@ class Mmu:
         else:
             self.log_warning("Warning: Gear rotation distances not found in mmu_vars.cfg. Probably not calibrated yet")
             self.rotation_distances = [-1] * self.num_gates
-        self.save_variables.allVariables[self.VARS_MMU_GEAR_ROTATION_DISTANCES] = self.rotation_distances
+        self.save_variable(self.VARS_MMU_GEAR_ROTATION_DISTANCES, self.rotation_distances)
 
         # Load encoder configuration (calibration set with MMU_CALIBRATE_ENCODER) ---------------------------
         self.encoder_resolution = 1.0
@@ -919,10 +952,16 @@ class Mmu:
 
     def handle_disconnect(self):
         self.log_debug('Klipper disconnected!')
+        if self.var_persistence:
+            self.var_persistence.stop()
 
         # Sub components
         self.selector.handle_disconnect()
 
+    def handle_shutdown(self):
+        if self.var_persistence:
+            self.var_persistence.flush()
+
     def handle_ready(self):
         # Pull retraction length from macro config
         sequence_vars_macro = self.printer.lookup_object("gcode_macro _MMU_SEQUENCE_VARS", None)
@@ -1020,6 +1059,7 @@ class Mmu:
 
     def _restore_automap_option(self, skip=False):
         self.slicer_tool_map['skip_automap'] = skip
+        self._bump_status_generation('tool_map')
 
     # Helper to infer type for setting gcode macro variables
     def _fix_type(self, s):
@@ -1420,8 +1460,61 @@ class Mmu:
                 return round(max(0, min(100, progress * 100)))
         return -1
 
+    # Status fields that only change via setters. A group is rebuilt only when its generation is bumped (setters
+    # that mutate in place) or when one of its attributes is replaced, otherwise previous objects are reused.
+    # Rebuilt groups hold copies so that webhooks sees in-place changes and an unbumped change can't leak out
+    STATUS_GROUPS = {
+        'gate_map': ('gate_status', 'gate_filament_name', 'gate_material', 'gate_color', 'gate_temperature',
+                     'gate_spool_id', 'gate_speed_override', 'gate_color_rgb'),
+        'ttg_map': ('ttg_map', 'endless_spool_groups', 'slicer_color_rgb'),
+        'tool_map': ('tool_extrusion_multipliers', 'tool_speed_multipliers', 'slicer_tool_map'),
+    }
+
+    # Must be called after in-place modification of any attribute in the group
+    def _bump_status_generation(self, *groups):
+        for group in groups:
+            self._status_generations[group] += 1
+
+    def _get_status_group(self, group):
+        attrs = self.STATUS_GROUPS[group]
+        objs = tuple(getattr(self, attr) for attr in attrs)
+        cached = self._status_groups.get(group)
+        if cached is not None:
+            gen, cached_objs = cached[0]
+            if gen == self._status_generations[group] and all(a is b for a, b in zip(objs, cached_objs)):
+                return cached[1], False
+        values = dict((attr, copy.deepcopy(obj) if isinstance(obj, dict) else list(obj) if isinstance(obj, list) else obj)
+                      for attr, obj in zip(attrs, objs))
+        self._status_groups[group] = ((self._status_generations[group], objs), values)
+        return values, True
+
+    # Reuse previously returned sub-status object if unchanged so that comparison by consumers is trivial
+    def _reuse_status(self, key, value):
+        last = self._status_last.get(key)
+        return last if last is not None and (last is value or last == value) else value
+
     # Returning new list() is so that clients like KlipperScreen sees the change
     def get_status(self, eventtime):
+        status = self._build_status(eventtime)
+
+        # Record changed keys. Unchanged groups and cached sub-status objects short circuit on identity
+        last = self._status_last
+        changed = [k for k, v in status.items() if k not in last or (last[k] is not v and last[k] != v)]
+        if changed:
+            self._status_serial += 1
+            for k in changed:
+                self._status_changed[k] = self._status_serial
+        self._status_last = status
+        return status
+
+    # Returns (serial, {key: value}) of status keys that have changed since 'serial'. Pass serial of None for all
+    def get_status_delta(self, eventtime, serial=None):
+        status = self.get_status(eventtime)
+        if serial is None:
+            return self._status_serial, status
+        return self._status_serial, dict((k, status[k]) for k, s in self._status_changed.items() if s > serial and k in status)
+
+    def _build_status(self, eventtime):
         status = {
             'enabled': self.is_enabled,
             'num_gates': self.num_gates,
@@ -1448,20 +1541,6 @@ class Mmu:
             'filament_pos': self.filament_pos, # State machine position
             'filament_direction': self.filament_direction,
             'pending_spool_id': self.pending_spool_id,
-            'ttg_map': self.ttg_map,
-            'endless_spool_groups': self.endless_spool_groups,
-            'gate_status': self.gate_status,
-            'gate_filament_name': self.gate_filament_name,
-            'gate_material': self.gate_material,
-            'gate_color': self.gate_color,
-            'gate_temperature': self.gate_temperature,
-            'gate_spool_id': self.gate_spool_id,
-            'gate_speed_override': self.gate_speed_override,
-            'gate_color_rgb': self.gate_color_rgb,
-            'slicer_color_rgb': self.slicer_color_rgb,
-            'tool_extrusion_multipliers': self.tool_extrusion_multipliers,
-            'tool_speed_multipliers': self.tool_speed_multipliers,
-            'slicer_tool_map': self.slicer_tool_map,
             'action': self._get_action_string(),
             'has_bypass': self.selector.has_bypass(),
             'sync_drive': self.mmu_toolhead.is_synced(),
@@ -1480,7 +1559,12 @@ class Mmu:
             'bowden_progress': self._get_bowden_progress(), # Simple 0-100%. -1 if not performing bowden move
             'espooler_active': self.espooler.get_operation(self.gate_selected)[0] if self.has_espooler() else ''
         }
-        status.update(self.selector.get_status())
+        for group in self.STATUS_GROUPS:
+            status.update(self._get_status_group(group)[0])
+        # Selector status is a few scalars without setter hooks so it is reused by equality. Sensor and encoder
+        # status objects are cached by their owners and only rebuilt when their state changes
+        for k, v in self.selector.get_status().items():
+            status[k] = self._reuse_status(k, v)
         status['sensors'] = self.sensor_manager.get_status()
         if self.has_encoder():
             status['encoder'] = self.encoder_sensor.get_status(eventtime)
@@ -1828,75 +1912,71 @@ class Mmu:
 
         return "\n".join([formatted_help] + formatted_params) + '\n'
 
-    def _color_message(self, msg):
-        try:
-            html_msg = msg.format(
-                '</span>',                       # {0} COLOR OFF
-                '<span style="color:#C0C0C0">',  # {1} COLOR GREY
-                '<span style="color:#FF69B4">',  # {2} COLOR RED
-                '<span style="color:#90EE90">',  # {3} COLOR GREEN
-                '<span style="color:#87CEEB">',  # {4} COLOR CYAN
-                '<b>',                           # {5} BOLD ON
-                '</b>'                           # {6} BOLD OFF
-            )
-        except (IndexError, KeyError, ValueError) as e:
-            html_msg = msg
+    # Logging facade. Messages can be passed as a format string plus args in which case the level is checked
+    # first and formatting is only performed if the message will be output to console or logfile, e.g.
+    #   self.log_trace("Moved %.1fmm at %.1fmm/s", dist, speed)
+    # Note that args are still evaluated by the caller so guard expensive ones with log_enabled(level)
+
+    # Must be called whenever log_level, log_file_level or mmu_logger changes
+    def _update_log_threshold(self):
+        self._log_threshold = max(self.log_level, self.log_file_level if self.mmu_logger else -1)
+
+    def _color_message(self, msg, args=()):
+        return self._color_cache.color_message(msg, args, plain_html=self.serious)
 
-        msg = re.sub(r'\{\d\}', '', msg) # Remove numbered placeholders for plain msg
-        if self.serious:
-            html_msg = msg
-        return html_msg, msg
+    def _plain_message(self, msg, args=()):
+        msg = msg % args if args else msg
+        return msg, msg
+
+    def _log_at_level(self, level, prefix, msg, args):
+        msg = prefix + (msg % args if args else msg)
+        if self.mmu_logger and self.log_file_level >= level:
+            self.mmu_logger.log(msg)
+        if self.log_level >= level:
+            self.gcode.respond_info(msg)
 
     def log_to_file(self, msg, prefix='> '):
         msg = "%s%s" % (prefix, msg)
         if self.mmu_logger:
             self.mmu_logger.log(msg)
 
-    def log_error(self, msg, color=False):
-        html_msg, msg = self._color_message(msg) if color else (msg, msg)
+    def log_error(self, msg, *args, **kwargs):
+        html_msg, msg = self._color_message(msg, args) if kwargs.get('color', False) else self._plain_message(msg, args)
         if self.mmu_logger:
             self.mmu_logger.log(msg)
         self.gcode.respond_raw("!! %s" % html_msg)
 
-    def log_warning(self, msg):
-        self.log_always("{2}%s{0}" % msg, color=True)
+    def log_warning(self, msg, *args):
+        self.log_always("{2}%s{0}" % (msg % args if args else msg), color=True)
 
-    def log_always(self, msg, color=False):
-        html_msg, msg = self._color_message(msg) if color else (msg, msg)
+    def log_always(self, msg, *args, **kwargs):
+        html_msg, msg = self._color_message(msg, args) if kwargs.get('color', False) else self._plain_message(msg, args)
         if self.mmu_logger:
             self.mmu_logger.log(msg)
         self.gcode.respond_info(html_msg)
 
-    def log_info(self, msg, color=False):
-        html_msg, msg = self._color_message(msg) if color else (msg, msg)
+    def log_info(self, msg, *args, **kwargs):
+        if self._log_threshold < self.LOG_INFO: return
+        html_msg, msg = self._color_message(msg, args) if kwargs.get('color', False) else self._plain_message(msg, args)
         if self.mmu_logger and self.log_file_level > 0:
             self.mmu_logger.log(msg)
         if self.log_level > 0:
             self.gcode.respond_info(html_msg)
 
-    def log_debug(self, msg):
-        msg = "%s DEBUG: %s" % (UI_SEPARATOR, msg)
-        if self.mmu_logger and self.log_file_level > 1:
-            self.mmu_logger.log(msg)
-        if self.log_level > 1:
-            self.gcode.respond_info(msg)
+    def log_debug(self, msg, *args):
+        if self._log_threshold < self.LOG_DEBUG: return
+        self._log_at_level(self.LOG_DEBUG, "%s DEBUG: " % UI_SEPARATOR, msg, args)
 
-    def log_trace(self, msg):
-        msg = "%s %s TRACE: %s" % (UI_SEPARATOR, UI_SEPARATOR, msg)
-        if self.mmu_logger and self.log_file_level > 2:
-            self.mmu_logger.log(msg)
-        if self.log_level > 2:
-            self.gcode.respond_info(msg)
+    def log_trace(self, msg, *args):
+        if self._log_threshold < self.LOG_TRACE: return
+        self._log_at_level(self.LOG_TRACE, "%s %s TRACE: " % (UI_SEPARATOR, UI_SEPARATOR), msg, args)
 
-    def log_stepper(self, msg):
-        msg = "%s %s %s STEPPER: %s" % (UI_SEPARATOR, UI_SEPARATOR, UI_SEPARATOR, msg)
-        if self.mmu_logger and self.log_file_level > 3:
-            self.mmu_logger.log(msg)
-        if self.log_level > 3:
-            self.gcode.respond_info(msg)
+    def log_stepper(self, msg, *args):
+        if self._log_threshold < self.LOG_STEPPER: return
+        self._log_at_level(self.LOG_STEPPER, "%s %s %s STEPPER: " % (UI_SEPARATOR, UI_SEPARATOR, UI_SEPARATOR), msg, args)
 
     def log_enabled(self, level):
-        return (self.mmu_logger and self.log_file_level >= level) or self.log_level >= level
+        return self._log_threshold >= level
 
     # Fun visual display of MMU state
     def _display_visual_state(self, silent=False):
@@ -2384,6 +2464,7 @@ class Mmu:
 
                 self.rotation_distances = [self.default_rotation_distance] * self.num_gates
                 self.save_variable(self.VARS_MMU_GEAR_ROTATION_DISTANCES, self.rotation_distances, write=True)
+                self.calibration_manager.reset_telemetry()
                 self.log_always("Gear calibration for all gates has been reset")
 
                 self.calibration_status &= ~self.CALIBRATED_GEAR_0
@@ -2404,6 +2485,7 @@ class Mmu:
                     else:
                         self.rotation_distances[gate] = new_rd
                     self.save_variable(self.VARS_MMU_GEAR_ROTATION_DISTANCES, self.rotation_distances, write=True)
+                    self.calibration_manager.reset_telemetry(None if all_gates else gate)
                     self.log_always("Gear calibration for %s has been saved" % ("all gates" if all_gates else "gate %d" % gate))
 
                     # This feature can be used to calibrate any gate gear but gate 0 is mandatory
@@ -2715,6 +2797,7 @@ class Mmu:
 
     # Assign spool id to gate and clear from other gates returning list of changes
     def assign_spool_id(self, gate, spool_id):
+        self._bump_status_generation('gate_map')
         self.gate_spool_id[gate] = spool_id
         mod_gate_ids = [(gate, spool_id)]
         for i, sid in enumerate(self.gate_spool_id):
@@ -2846,6 +2929,7 @@ class Mmu:
             self._reset_job_statistics() # Reset job stats but leave persisted totals alone
             self.reactor.update_timer(self.hotend_off_timer, self.reactor.NEVER) # Don't automatically turn off extruder heaters
             self.is_handling_runout = False
+            self.prestaged_gates.clear()
             self._clear_slicer_tool_map()
             self._enable_runout() # Enable runout/clog detection while printing
             self._initialize_encoder(dwell=None) # Encoder 0000
@@ -2888,8 +2972,14 @@ class Mmu:
             self.resume_to_state = "ready"
             self.paused_extruder_temp = None
             self.reactor.update_timer(self.hotend_off_timer, self.reactor.NEVER) # Don't automatically turn off extruder heaters
+            self._unstage_gates()
+            self.flush_variables()
             self._restore_automap_option()
             self._disable_runout() # Disable runout/clog detection after print
+            job = self.job_statistics
+            if job.get('rd_requests'):
+                self.log_debug("Sync feedback rotation_distance updates this print: %d requested, %d applied, %d skipped, %d coalesced" % (
+                    job['rd_requests'], job.get('rd_updates', 0), job.get('rd_skipped', 0), job.get('rd_coalesced', 0)))
 
             if self.printer.lookup_object("idle_timeout").idle_timeout != self.default_idle_timeout:
                 self.gcode.run_script_from_command("SET_IDLE_TIMEOUT TIMEOUT=%d" % self.default_idle_timeout) # Restore original idle_timeout
@@ -2907,6 +2997,7 @@ class Mmu:
 
     def handle_mmu_error(self, reason, force_in_print=False):
         self._fix_started_state() # Get out of 'started' state before transistion to mmu pause
+        self.flush_variables() # Ensure persisted state is on disk before user intervention
 
         run_pause_macro = run_error_macro = recover_pos = send_event = False
         self._espooler_assist_off()
@@ -3063,6 +3154,7 @@ class Mmu:
                     mmu_state = self.gcode_move.saved_states[self.TOOLHEAD_POSITION_STATE]
                     self.tool_speed_multipliers[self.tool_selected] = mmu_state['speed_factor'] * 60.
                     self.tool_extrusion_multipliers[self.tool_selected] = mmu_state['extrude_factor']
+                    self._bump_status_generation('tool_map')
 
                 # This will save the print position in the macro and apply park
                 self.wrap_gcode_command(self.save_position_macro)
@@ -3593,18 +3685,29 @@ class Mmu:
     # Wrapper so we can minimize actual disk writes and batch updates
     def save_variable(self, variable, value, write=False):
         self.save_variables.allVariables[variable] = value
+        if self.var_persistence:
+            self.var_persistence.mark_dirty(variable)
         if write:
             self.write_variables()
 
     def delete_variable(self, variable, write=False):
         _ = self.save_variables.allVariables.pop(variable, None)
+        if self.var_persistence:
+            self.var_persistence.mark_dirty(variable)
         if write:
             self.write_variables()
 
+    # Writes are coalesced and performed on a background thread so never block on disk I/O
     def write_variables(self):
         if self._can_write_variables:
             mmu_vars_revision = self.save_variables.allVariables.get(self.VARS_MMU_REVISION, 0) + 1
-            self.gcode.run_script_from_command("SAVE_VARIABLE VARIABLE=%s VALUE=%d" % (self.VARS_MMU_REVISION, mmu_vars_revision))
+            self.save_variable(self.VARS_MMU_REVISION, mmu_vars_revision)
+            self.var_persistence.request_write()
+
+    # Force synchronous write of any pending changes (shutdown and error paths)
+    def flush_variables(self):
+        if self.var_persistence:
+            self.var_persistence.flush()
 
     @contextlib.contextmanager
     def _wrap_suspendwrite_variables(self):
@@ -4002,6 +4105,121 @@ class Mmu:
             self._set_gate_status(self.gate_selected, self.GATE_EMPTY)
             raise MmuError("Filament not detected")
 
+    # Next gate that the upcoming tool change (from tool change index) will use
+    def _get_prestage_candidate(self):
+        for tc in self.get_upcoming_toolchanges(1):
+            if 0 <= tc['to_tool'] < self.num_gates:
+                return self.ttg_map[tc['to_tool']]
+        return None
+
+    # Return reason why gate cannot be pre-staged or None if possible. Pre-staging moves a gear stepper other
+    # than the selected one so is only possible on MMU's with independent gates (per-gate gear steppers) and
+    # a per-gate gear sensor to home to while the gear rail is not synced to the extruder. While printing it
+    # is only done automatically once the print has resumed after a tool change (in_print=True) so the homing
+    # move on the MMU toolhead overlaps with printing. It is not run from a command because holding the gcode
+    # mutex for the homing move would stall the print
+    def _check_can_prestage(self, gate, in_print=False):
+        if not self.mmu_machine.multigear:
+            return "MMU does not have independent gates"
+        if self.gate_homing_endstop != self.SENSOR_GEAR_PREFIX or not self.sensor_manager.has_gate_sensor(self.SENSOR_GEAR_PREFIX, gate):
+            return "requires 'gate_homing_endstop: %s' and gear sensor on gate" % self.SENSOR_GEAR_PREFIX
+        if self.gate_parking_distance <= 0:
+            return "filament is not parked behind gear sensor"
+        if gate == self.gate_selected:
+            return "gate is currently selected"
+        if self.gate_status[gate] == self.GATE_EMPTY:
+            return "gate is empty"
+        if self._next_tool != self.TOOL_GATE_UNKNOWN or self.is_paused():
+            return "tool change in progress or paused"
+        if self._prestaging_gate is not None:
+            return "pre-staging of gate %d in progress" % self._prestaging_gate
+        if self.is_printing() and not in_print:
+            return "only done automatically after tool change while printing"
+        if self.mmu_toolhead.is_gear_synced_to_extruder():
+            return "gear stepper is synced to extruder"
+        return None
+
+    def _is_prestaged(self, gate):
+        return gate in self.prestaged_gates and bool(self.sensor_manager.check_gate_sensor(self.SENSOR_GEAR_PREFIX, gate))
+
+    # Move filament in (unselected) gate from park position to gear sensor so the next tool change can
+    # skip the gate homing phase. The selected gate and filament position state are not changed
+    def _prestage_gate(self, gate):
+        if self.sensor_manager.check_gate_sensor(self.SENSOR_GEAR_PREFIX, gate):
+            self.prestaged_gates.add(gate)
+            return
+
+        endstop_name = self.sensor_manager.get_gate_sensor_name(self.SENSOR_GEAR_PREFIX, gate)
+        adjust = self.gate_speed_override[gate] / 100.
+        self._prestaging_gate = gate
+        try:
+            self.mmu_toolhead.select_gear_stepper(gate)
+            msg = "Pre-staging gate %d to %s sensor" % (gate, endstop_name)
+            _,homed,_,_ = self.trace_filament_move(msg, self.gate_homing_max, speed=self.gear_homing_speed * adjust, motor="gear", homing_move=1, endstop_name=endstop_name, speed_override=False)
+        finally:
+            self.mmu_toolhead.select_gear_stepper(self.gate_selected)
+            self._prestaging_gate = None
+        if not homed:
+            raise MmuError("Filament did not reach %s sensor" % endstop_name)
+        self.prestaged_gates.add(gate)
+
+    # Called at the end of a tool change once the toolhead has been restored. The pre-stage itself runs from a
+    # reactor callback so that it overlaps with the resumed print rather than adding to the tool change time
+    def _schedule_prestage(self):
+        if self.lookahead_prestage and self.mmu_machine.multigear and self.is_printing():
+            self.reactor.register_callback(self._prestage_next_gate)
+
+    # Pre-stage the gate of the following tool change while printing. Failure is not fatal, the next tool
+    # change will simply home the gate as normal
+    def _prestage_next_gate(self, eventtime=None):
+        if not (self.lookahead_prestage and self.mmu_machine.multigear and self.is_printing()):
+            return
+        gate = self._get_prestage_candidate()
+        if gate is None:
+            return
+        reason = self._check_can_prestage(gate, in_print=True)
+        if reason:
+            self.log_debug("Not pre-staging gate %d: %s" % (gate, reason))
+            return
+        try:
+            self._prestage_gate(gate)
+            self.log_debug("Gate %d pre-staged ready for next tool change" % gate)
+        except (MmuError, self.printer.command_error) as ee:
+            self.log_warning("Pre-staging of gate %d failed: %s" % (gate, str(ee)))
+
+    # Pre-staging runs outside of the gcode mutex so anything else that drives the gear rail must wait for it
+    def _wait_for_prestage(self):
+        while self._prestaging_gate is not None:
+            self.reactor.pause(self.reactor.monotonic() + 0.05)
+
+    # Return filament of pre-staged gates to park position, e.g. at print end so it isn't left at gear sensor
+    def _unstage_gates(self):
+        self._wait_for_prestage()
+        for gate in sorted(self.prestaged_gates):
+            try:
+                self._unstage_gate(gate)
+            except (MmuError, self.printer.command_error) as ee:
+                self.log_warning("Could not re-park pre-staged gate %d: %s" % (gate, str(ee)))
+        self.prestaged_gates.clear()
+
+    def _unstage_gate(self, gate):
+        if not self.sensor_manager.check_gate_sensor(self.SENSOR_GEAR_PREFIX, gate):
+            return # Already parked behind sensor
+        endstop_name = self.sensor_manager.get_gate_sensor_name(self.SENSOR_GEAR_PREFIX, gate)
+        adjust = self.gate_speed_override[gate] / 100.
+        self._prestaging_gate = gate
+        try:
+            self.mmu_toolhead.select_gear_stepper(gate)
+            msg = "Reverse homing pre-staged gate %d off %s sensor" % (gate, endstop_name)
+            _,homed,_,_ = self.trace_filament_move(msg, -self.gate_homing_max, speed=self.gear_homing_speed * adjust, motor="gear", homing_move=-1, endstop_name=endstop_name, speed_override=False)
+            if homed:
+                self.trace_filament_move("Re-parking gate %d" % gate, -self.gate_parking_distance, motor="gear", speed_override=False)
+        finally:
+            self.mmu_toolhead.select_gear_stepper(self.gate_selected)
+            self._prestaging_gate = None
+        if not homed:
+            raise MmuError("Filament did not clear %s sensor" % endstop_name)
+
     # Eject final clear of gate. Important for MMU's where filament is always gripped (e.g. most type-B)
     def _eject_from_gate(self, gate=None):
         # If gate not specified assume current gate
@@ -4031,6 +4249,7 @@ class Mmu:
 
         self._set_filament_pos_state(self.FILAMENT_POS_UNLOADED, silent=True) # Should already be in this position
         self._set_gate_status(gate, self.GATE_EMPTY)
+        self.prestaged_gates.discard(gate)
         self.log_always("The filament in gate %d can be removed" % gate)
 
     # Load filament into gate. This is considered the starting position for the rest of the filament loading
@@ -4761,7 +4980,12 @@ class Mmu:
 
             else:
                 if start_filament_pos <= self.FILAMENT_POS_UNLOADED:
-                    overshoot = self._load_gate()
+                    if self._is_prestaged(self.gate_selected):
+                        self.log_debug("Gate %d was pre-staged, skipping gate homing" % self.gate_selected)
+                        self._set_filament_pos_state(self.FILAMENT_POS_HOMED_GATE)
+                    else:
+                        overshoot = self._load_gate()
+                    self.prestaged_gates.discard(self.gate_selected)
 
                 if calibrating:
                     if self.extruder_homing_endstop in [self.SENSOR_EXTRUDER_NONE, self.SENSOR_EXTRUDER_COLLISION]:
@@ -4802,7 +5026,7 @@ class Mmu:
             if calibrating:
                 self.calibration_manager.update_bowden_calibration(calibrated_bowden_length)
             elif full and not extruder_only and not self.gcode_load_sequence:
-                self.calibration_manager.load_telemetry(bowden_move_ratio, homing_movement, deficit)
+                self.calibration_manager.load_telemetry(bowden_move_ratio, homing_movement, deficit, self._get_bowden_move_speed(self.DIRECTION_LOAD))
 
             # Activate loaded spool in Spoolman
             self._spoolman_activate_spool(self.gate_spool_id[self.gate_selected])
@@ -5000,7 +5224,7 @@ class Mmu:
 
             # Notify autotune manager
             if full and not extruder_only and not self.gcode_unload_sequence:
-                self.calibration_manager.unload_telemetry(bowden_move_ratio, homing_movement, deficit)
+                self.calibration_manager.unload_telemetry(bowden_move_ratio, homing_movement, deficit, self._get_bowden_move_speed(self.DIRECTION_UNLOAD))
 
             # POST_UNLOAD user defined macro
             if macros_and_track:
@@ -5186,6 +5410,18 @@ class Mmu:
     #
     # All moves return: actual (relative), homed, measured, delta; mmu_toolhead.get_position[1] holds absolute position
     #
+    # Speed of the fast (non-homing) gear move through the bowden including per-gate override
+    def _get_bowden_move_speed(self, direction):
+        if direction == self.DIRECTION_UNLOAD:
+            speed = self.gear_unload_speed
+        elif not self.has_filament_buffer or (self.gate_selected >= 0 and self.gate_status[self.gate_selected] != self.GATE_AVAILABLE_FROM_BUFFER):
+            speed = self.gear_from_spool_speed
+        else:
+            speed = self.gear_from_buffer_speed
+        if self.gate_selected >= 0:
+            speed *= self.gate_speed_override[self.gate_selected] / 100.
+        return speed
+
     def trace_filament_move(self, trace_str, dist, speed=None, accel=None, motor="gear", homing_move=0, endstop_name="default", track=False, wait=False, encoder_dwell=False, speed_override=True):
         encoder_start = self.get_encoder_distance(dwell=encoder_dwell)
         pos = self.mmu_toolhead.get_position()
@@ -5286,8 +5522,7 @@ class Mmu:
                                         speed *= 0.8 # Reduce speed by 20%
                                     self.log_error("Did not complete homing move: %s" % str(e))
                                 else:
-                                    if self.log_enabled(self.LOG_STEPPER):
-                                        self.log_stepper("Did not home: %s" % str(e))
+                                    self.log_stepper("Did not home: %s", e)
                                 homed = False
                             finally:
                                 halt_pos = self.mmu_toolhead.get_position()
@@ -5301,13 +5536,12 @@ class Mmu:
                                     self.mmu_toolhead.set_position(halt_pos) # Correct the gear rail position
 
                                 actual = halt_pos[1] - init_pos
-                                if self.log_enabled(self.LOG_STEPPER):
-                                    self.log_stepper("%s HOMING MOVE: max dist=%.1f, speed=%.1f, accel=%.1f, endstop_name=%s, wait=%s >> %s" % (motor.upper(), dist, speed, accel, endstop_name, wait, "%s halt_pos=%.1f (rail moved=%.1f, extruder moved=%.1f), start_pos=%.1f, trig_pos=%.1f" % ("HOMED" if homed else "DID NOT HOMED",  halt_pos[1], actual, ext_actual, start_pos, trig_pos[1])))
+                                self.log_stepper("%s HOMING MOVE: max dist=%.1f, speed=%.1f, accel=%.1f, endstop_name=%s, wait=%s >> %s halt_pos=%.1f (rail moved=%.1f, extruder moved=%.1f), start_pos=%.1f, trig_pos=%.1f",
+                                                 motor.upper(), dist, speed, accel, endstop_name, wait, "HOMED" if homed else "DID NOT HOMED", halt_pos[1], actual, ext_actual, start_pos, trig_pos[1])
                             if not got_comms_timeout:
                                 break
                     else:
-                        if self.log_enabled(self.LOG_STEPPER):
-                            self.log_stepper("%s MOVE: dist=%.1f, speed=%.1f, accel=%.1f, wait=%s" % (motor.upper(), dist, speed, accel, wait))
+                        self.log_stepper("%s MOVE: dist=%.1f, speed=%.1f, accel=%.1f, wait=%s", motor.upper(), dist, speed, accel, wait)
                         pos[1] += dist
                         with self.wrap_accel(accel):
                             self.mmu_toolhead.move(pos, speed)
@@ -5318,8 +5552,7 @@ class Mmu:
                     if homing_move != 0:
                         self.log_error("Not possible to perform homing move while synced")
                     else:
-                        if self.log_enabled(self.LOG_STEPPER):
-                            self.log_stepper("%s MOVE: dist=%.1f, speed=%.1f, accel=%.1f, wait=%s" % (motor.upper(), dist, speed, accel, wait))
+                        self.log_stepper("%s MOVE: dist=%.1f, speed=%.1f, accel=%.1f, wait=%s", motor.upper(), dist, speed, accel, wait)
                         ext_pos[3] += dist
                         self.toolhead.move(ext_pos, speed)
 
@@ -5331,16 +5564,14 @@ class Mmu:
         encoder_end = self.get_encoder_distance(dwell=encoder_dwell)
         measured = encoder_end - encoder_start
         delta = abs(actual) - measured # +ve means measured less than moved, -ve means measured more than moved
-        if trace_str:
+        if trace_str and self.log_enabled(self.LOG_TRACE):
+            pos = self.mmu_toolhead.get_position()[1]
             if homing_move != 0:
-                trace_str += ". Stepper: '%s' %s after moving %.1fmm (of max %.1fmm), encoder measured %.1fmm (delta %.1fmm)"
-                trace_str = trace_str % (motor, ("homed" if homed else "did not home"), actual, dist, measured, delta)
-                trace_str += ". Pos: @%.1f, (%.1fmm)" % (self.mmu_toolhead.get_position()[1], encoder_end)
+                self.log_trace(trace_str + ". Stepper: '%s' %s after moving %.1fmm (of max %.1fmm), encoder measured %.1fmm (delta %.1fmm). Pos: @%.1f, (%.1fmm)",
+                               motor, ("homed" if homed else "did not home"), actual, dist, measured, delta, pos, encoder_end)
             else:
-                trace_str += ". Stepper: '%s' moved %.1fmm, encoder measured %.1fmm (delta %.1fmm)"
-                trace_str = trace_str % (motor, dist, measured, delta)
-            trace_str += ". Pos: @%.1f, (%.1fmm)" % (self.mmu_toolhead.get_position()[1], encoder_end)
-            self.log_trace(trace_str)
+                self.log_trace(trace_str + ". Stepper: '%s' moved %.1fmm, encoder measured %.1fmm (delta %.1fmm). Pos: @%.1f, (%.1fmm)",
+                               motor, dist, measured, delta, pos, encoder_end)
 
         if self._can_use_encoder() and motor == "gear" and track:
             if dist > 0:
@@ -5390,6 +5621,7 @@ class Mmu:
     def _wrap_espooler(self, motor, dist, speed, accel, homing_move):
         self._wait_for_espooler = False
         espooler_operation = self.ESPOOLER_OFF
+        gate = self.gate_selected if self._prestaging_gate is None else self._prestaging_gate
 
         if self.has_espooler():
             pwm_value = 0
@@ -5413,14 +5645,14 @@ class Mmu:
 
             if espooler_operation != self.ESPOOLER_OFF:
                 self._wait_for_espooler = not homing_move
-                self.espooler.set_operation(self.gate_selected, pwm_value, espooler_operation)
+                self.espooler.set_operation(gate, pwm_value, espooler_operation)
         try:
             yield self
 
         finally:
             self._wait_for_espooler = False
             if espooler_operation != self.ESPOOLER_OFF:
-                self.espooler.set_operation(self.gate_selected, 0, self.ESPOOLER_OFF)
+                self.espooler.set_operation(gate, 0, self.ESPOOLER_OFF)
 
     # Turn on print espooler assist mode for current gate
     def _espooler_assist_on(self):
@@ -5829,6 +6061,7 @@ class Mmu:
             if self.tool_speed_multipliers[tool] != current_speed_factor or self.tool_extrusion_multipliers[tool] != current_extrude_factor:
                 self.tool_speed_multipliers[tool] = current_speed_factor
                 self.tool_extrusion_multipliers[tool] = current_extrude_factor
+                self._bump_status_generation('tool_map')
                 self.log_debug("Saved speed/extrusion multiplier for tool T%d as %d%% and %d%%" % (tool, current_speed_factor * 100, current_extrude_factor * 100))
 
     def _restore_tool_override(self, tool):
@@ -5843,6 +6076,7 @@ class Mmu:
                 self.log_debug("Restored speed/extrusion multiplier for tool T%d as %d%% and %d%%" % (tool, speed_factor * 100, extrude_factor * 100))
 
     def _set_tool_override(self, tool, speed_percent, extrude_percent):
+        self._bump_status_generation('tool_map')
         if tool == -1:
             for i in range(self.num_gates):
                 if speed_percent is not None:
@@ -6021,11 +6255,62 @@ class Mmu:
             self.log_debug("Gate not calibrated, falling back to default: %.4f" % rd)
         return rd
 
-    def set_rotation_distance(self, rd):
-        if rd:
+    # Set rotation_distance of the selected gear stepper(s). Immediate updates (calibration, gate change) are applied now
+    # and cancel any pending deferred update. Deferred updates (sync-feedback) skip no-op and sub-resolution changes,
+    # coalesce to the latest value and are applied to all selected gear steppers together at the next lookahead flush
+    def set_rotation_distance(self, rd, deferred=False):
+        if not rd:
+            return
+        if not deferred:
+            self._pending_rd = None
             self.log_trace("Setting gear motor rotation distance: %.4f" % rd)
-            if self.gear_rail.steppers:
-                self.gear_rail.steppers[0].set_rotation_distance(rd)
+            for s in self.mmu_toolhead.selected_gear_steppers:
+                s.set_rotation_distance(rd)
+            return
+
+        self._count_rd_update('rd_requests')
+        steppers = list(self.mmu_toolhead.selected_gear_steppers)
+        if not steppers:
+            return
+        if self._pending_rd is not None:
+            self._count_rd_update('rd_coalesced')
+            self._pending_rd = (rd, steppers) # Callback already registered, latest value wins
+            return
+        if all(self._is_insignificant_rd_change(s, rd) for s in steppers):
+            self._count_rd_update('rd_skipped')
+            return
+        self._pending_rd = (rd, steppers)
+        th = self.toolhead if self.mmu_toolhead.is_gear_synced_to_extruder() else self.mmu_toolhead
+        th.register_lookahead_callback(self._apply_pending_rotation_distance)
+
+    def _apply_pending_rotation_distance(self, print_time):
+        if self._pending_rd is None:
+            return # Cancelled by immediate update
+        rd, steppers = self._pending_rd
+        self._pending_rd = None
+        if steppers != self.mmu_toolhead.selected_gear_steppers:
+            self._count_rd_update('rd_skipped') # Gear selection changed since request
+            return
+        changed = [s for s in steppers if not self._is_insignificant_rd_change(s, rd)]
+        if not changed:
+            self._count_rd_update('rd_skipped')
+            return
+        self.log_trace("Setting gear motor rotation distance: %.4f (%d stepper%s)" % (rd, len(changed), "s" if len(changed) > 1 else ""))
+        for s in changed:
+            s.set_rotation_distance(rd)
+        self._count_rd_update('rd_updates')
+
+    # A change is insignificant if it would shift the gear by less than one full step over ROTATION_DISTANCE_RESOLUTION_LENGTH
+    def _is_insignificant_rd_change(self, stepper, rd):
+        current_rd, steps_per_rotation = stepper.get_rotation_distance()
+        if rd == current_rd:
+            return True
+        step_shift = self.ROTATION_DISTANCE_RESOLUTION_LENGTH * abs(1. / rd - 1. / current_rd) * steps_per_rotation
+        return step_shift < 1.
+
+    def _count_rd_update(self, name):
+        self.job_statistics.setdefault(name, 0)
+        self.job_statistics[name] += 1
 
     def save_rotation_distance(self, gate, rd):
         locked = False # TODO implement a per-gate calibration locking protocol
@@ -6337,6 +6622,7 @@ class Mmu:
         else:
             tool = gcmd.get_int('TOOL', minval=0, maxval=self.num_gates - 1)
 
+        self._wait_for_prestage()
         try:
             with self.wrap_sync_gear_to_extruder():
                 with self._wrap_suspend_runout(): # Don't want runout accidently triggering during tool change
@@ -6446,6 +6732,9 @@ class Mmu:
         finally:
             self.toolchange_purge_volume = 0.
 
+        # After gear sync has been restored so the pre-stage sees the final sync state
+        self._schedule_prestage()
+
     cmd_MMU_LOAD_help = "Loads filament on current tool/gate or optionally loads just the extruder for bypass or recovery usage (EXTRUDER_ONLY=1)"
     def cmd_MMU_LOAD(self, gcmd):
         self.log_to_file(gcmd.get_commandline())
@@ -6977,6 +7266,7 @@ class Mmu:
         self.gate_endstop_to_encoder = gcmd.get_float('GATE_SENSOR_TO_ENCODER', self.gate_endstop_to_encoder)
         self.gate_autoload = gcmd.get_int('GATE_AUTOLOAD', self.gate_autoload, minval=0, maxval=1)
         self.gate_final_eject_distance = gcmd.get_float('GATE_FINAL_EJECT_DISTANCE', self.gate_final_eject_distance)
+        self.lookahead_prestage = gcmd.get_int('LOOKAHEAD_PRESTAGE', self.lookahead_prestage, minval=0, maxval=1)
         self.gate_unload_buffer = gcmd.get_float('GATE_UNLOAD_BUFFER', self.gate_unload_buffer, minval=0.)
         self.gate_homing_max = gcmd.get_float('GATE_HOMING_MAX', self.gate_homing_max)
         self.gate_parking_distance = gcmd.get_float('GATE_PARKING_DISTANCE', self.gate_parking_distance)
@@ -7021,6 +7311,7 @@ class Mmu:
             raise gcmd.error("spoolman_support is invalid. Options are: %s" % self.SPOOLMAN_OPTIONS)
         if spoolman_support == self.SPOOLMAN_OFF:
             self.gate_spool_id[:] = [-1] * self.num_gates
+            self._bump_status_generation('gate_map')
         self.spoolman_support = spoolman_support
 
         prev_t_macro_color = self.t_macro_color
@@ -7031,6 +7322,7 @@ class Mmu:
 
         self.log_level = gcmd.get_int('LOG_LEVEL', self.log_level, minval=0, maxval=4)
         self.log_file_level = gcmd.get_int('LOG_FILE_LEVEL', self.log_file_level, minval=0, maxval=4)
+        self._update_log_threshold()
         self.log_visual = gcmd.get_int('LOG_VISUAL', self.log_visual, minval=0, maxval=1)
         self.log_statistics = gcmd.get_int('LOG_STATISTICS', self.log_statistics, minval=0, maxval=1)
         self.log_m117_messages = gcmd.get_int('LOG_M117_MESSAGES', self.log_m117_messages, minval=0, maxval=1)
@@ -7140,6 +7432,8 @@ class Mmu:
             msg += "\ngate_preload_parking_distance = %s" % self.gate_preload_parking_distance
             msg += "\ngate_autoload = %s" % self.gate_autoload
             msg += "\ngate_final_eject_distance = %s" % self.gate_final_eject_distance
+            if self.mmu_machine.multigear:
+                msg += "\nlookahead_prestage = %d" % self.lookahead_prestage
             if self.sensor_manager.has_sensor(self.SENSOR_EXTRUDER_ENTRY):
                 msg += "\nbypass_autoload = %s" % self.bypass_autoload
             if self.has_encoder():
@@ -7491,6 +7785,7 @@ class Mmu:
                 self._set_tool_selected(self.TOOL_GATE_UNKNOWN)
 
     def _persist_ttg_map(self):
+        self._bump_status_generation('ttg_map')
         self.save_variable(self.VARS_MMU_TOOL_TO_GATE_MAP, self.ttg_map, write=True)
 
     def _reset_ttg_map(self):
@@ -7501,6 +7796,7 @@ class Mmu:
         self._update_slicer_color_rgb() # Indexed by gate
 
     def _persist_endless_spool(self):
+        self._bump_status_generation('ttg_map')
         self.save_variable(self.VARS_MMU_ENABLE_ENDLESS_SPOOL, self.enable_endless_spool)
         self.save_variable(self.VARS_MMU_ENDLESS_SPOOL_GROUPS, self.endless_spool_groups)
         self.write_variables()
@@ -7521,6 +7817,7 @@ class Mmu:
                 self.mmu_macro_event(self.MACRO_EVENT_GATE_MAP_CHANGED, "GATE=%d" % gate)
 
     def _persist_gate_status(self):
+        self._bump_status_generation('gate_map')
         self.save_variable(self.VARS_MMU_GATE_STATUS, self.gate_status, write=True)
 
     # Ensure that webhooks sees get_status() change after gate map update. It is important to call this prior to
@@ -7535,6 +7832,7 @@ class Mmu:
         self.gate_speed_override = list(self.gate_speed_override)
 
     def _persist_gate_map(self, spoolman_sync=False, gate_ids=None):
+        self._bump_status_generation('gate_map')
         self.save_variable(self.VARS_MMU_GATE_STATUS, self.gate_status)
         self.save_variable(self.VARS_MMU_GATE_FILAMENT_NAME, self.gate_filament_name)
         self.save_variable(self.VARS_MMU_GATE_MATERIAL, self.gate_material)
@@ -7938,6 +8236,107 @@ class Mmu:
         except MmuError as ee:
             self.handle_mmu_error(str(ee))
 
+    # Apply batch update of gate map attributes {gate: {attr: value}} from spoolman or UI (MMU_GATE_MAP MAP= or
+    # mmu/gate_map webhook). Returns list of (gate, spool_id) whose spool_id was changed. Caller must persist
+    def _apply_gate_map_update(self, gate_map, replace=False, from_spoolman=False):
+        self.log_debug("Received gate map update (replace: %s)" % replace)
+        if replace:
+            # Replace complete map including spool_id (should only be in spoolman "pull" mode)
+            if self.spoolman_support != self.SPOOLMAN_PULL:
+                self.log_debug("Assertion failure: received gate map replacement update but not in spoolman 'pull' mode")
+
+            # If from spoolman gate_map should be a full gate list with spool_id = -1 for unset gates
+            for gate, fil in gate_map.items():
+                if not (0 <= gate < self.num_gates):
+                    self.log_debug("Warning: Illegal gate number %d supplied in gate map update - ignored" % gate)
+                    continue
+
+                # Update gate attributes if we have valid spool_id
+                spool_id = self.safe_int(fil.get('spool_id', -1))
+                self.gate_spool_id[gate] = spool_id
+                self.gate_filament_name[gate] = fil.get('name', '')
+                self.gate_material[gate] = fil.get('material', '')
+                self.gate_color[gate] = fil.get('color', '')
+                self.gate_temperature[gate] = max(
+                    self.safe_int(fil.get('temp', self.default_extruder_temp)),
+                    self.default_extruder_temp
+                )
+                # gate_speed_override and gate_status can be set locally
+        else:
+            # Update map (ui or from spoolman in "readonly" and "push" modes)
+            ids_dict = {}
+            for gate, fil in gate_map.items():
+                if not (0 <= gate < self.num_gates):
+                    self.log_debug("Warning: Illegal gate number %d supplied in gate map update - ignored" % gate)
+                    continue
+
+                spool_id = self.safe_int(fil.get('spool_id', -1))
+                if (not from_spoolman or spool_id != -1):
+                    # Update attributes but don't allow spoolman to accidently clear
+                    self.gate_filament_name[gate] = fil.get('name', '')
+                    self.gate_material[gate] = fil.get('material', '')
+                    self.gate_color[gate] = fil.get('color', '')
+                    self.gate_temperature[gate] = max(
+                        self.safe_int(fil.get('temp', self.default_extruder_temp)),
+                        self.default_extruder_temp
+                    )
+                    self.gate_speed_override[gate] = self.safe_int(fil.get('speed_override', self.gate_speed_override[gate]))
+                    self.gate_status[gate] = self.safe_int(fil.get('status', self.gate_status[gate])) # For UI manual fixing of availabilty
+
+                # If spool_id has changed, clean up possible stale use of old one
+                if spool_id != self.gate_spool_id[gate]:
+                    self.log_debug("Spool_id changed for gate %d in MMU_GATE_MAP" % gate)
+                    mod_gate_ids = self.assign_spool_id(gate, spool_id)
+                    for (gate, sid) in mod_gate_ids:
+                        ids_dict[gate] = sid
+            return list(ids_dict.items())
+        return []
+
+    # Webhooks endpoint equivalent of MMU_GATE_MAP MAP=.. for moonraker components. Params:
+    #   map: {gate: {attr: value}}, replace: bool, from_spoolman: bool
+    # The batch is handed to an internal command run with gcode.run_script() so that it is applied under the
+    # gcode mutex (never in the middle of a tool change) and gate map events can run macros. The update is
+    # applied with one persist and LED refresh
+    def _handle_gate_map_request(self, web_request):
+        if not self.is_enabled:
+            raise web_request.error("MMU is disabled")
+        gate_map = web_request.get_dict('map')
+        replace = bool(web_request.get('replace', False))
+        from_spoolman = bool(web_request.get('from_spoolman', False))
+        try:
+            gate_map = {int(gate): fil for gate, fil in gate_map.items()} # JSON keys are strings
+        except ValueError as e:
+            raise web_request.error("Invalid gate map update: %s" % str(e))
+
+        self._gate_map_request_id += 1
+        request_id = self._gate_map_request_id
+        self._gate_map_requests[request_id] = [gate_map, replace, from_spoolman, None]
+        try:
+            self.gcode.run_script("__MMU_GATE_MAP_UPDATE ID=%d" % request_id)
+        except self.printer.command_error as e:
+            raise web_request.error(str(e))
+        finally:
+            changed_gate_ids = self._gate_map_requests.pop(request_id)[3]
+        web_request.send({'changed_gate_ids': changed_gate_ids or []})
+
+    cmd_MMU_GATE_MAP_UPDATE_help = "Internal command to apply gate map update received by mmu/gate_map endpoint"
+    def cmd_MMU_GATE_MAP_UPDATE(self, gcmd):
+        request = self._gate_map_requests.get(gcmd.get_int('ID'))
+        if request is None:
+            raise gcmd.error("Unknown gate map update")
+        gate_map, replace, from_spoolman, _ = request
+        try:
+            self._renew_gate_map() # Ensure that webhooks sees changes
+            changed_gate_ids = self._apply_gate_map_update(gate_map, replace, from_spoolman)
+        except Exception as e:
+            self.log_debug("Invalid gate map update: %s\nException: %s" % (gate_map, str(e)))
+            raise gcmd.error("Invalid gate map update: %s" % str(e))
+        self._update_gate_color_rgb()
+
+        # Caution, make sure that an update from spoolman does end up in infinite loop!
+        self._persist_gate_map(spoolman_sync=bool(changed_gate_ids) and not from_spoolman, gate_ids=changed_gate_ids) # This will also update LED status
+        request[3] = changed_gate_ids
+
     cmd_MMU_GATE_MAP_help = "Display or define the type and color of filaments on each gate"
     def cmd_MMU_GATE_MAP(self, gcmd):
         self.log_to_file(gcmd.get_commandline())
@@ -7982,59 +8381,7 @@ class Mmu:
 
         if gate_map: # --------- BATCH UPDATE from spoolman or UI --------
             try:
-                self.log_debug("Received gate map update (replace: %s)" % replace)
-                if replace:
-                    # Replace complete map including spool_id (should only be in spoolman "pull" mode)
-                    if self.spoolman_support != self.SPOOLMAN_PULL:
-                        self.mmu.log_debug("Assertion failure: received gate map replacement update but not in spoolman 'pull' mode")
-
-                    # If from spoolman gate_map should be a full gate list with spool_id = -1 for unset gates
-                    for gate, fil in gate_map.items():
-                        if not (0 <= gate < self.num_gates):
-                            self.log_debug("Warning: Illegal gate number %d supplied in gate map update - ignored" % gate)
-                            continue
-
-                        # Update gate attributes if we have valid spool_id
-                        spool_id = self.safe_int(fil.get('spool_id', -1))
-                        self.gate_spool_id[gate] = spool_id
-                        self.gate_filament_name[gate] = fil.get('name', '')
-                        self.gate_material[gate] = fil.get('material', '')
-                        self.gate_color[gate] = fil.get('color', '')
-                        self.gate_temperature[gate] = max(
-                            self.safe_int(fil.get('temp', self.default_extruder_temp)),
-                            self.default_extruder_temp
-                        )
-                        # gate_speed_override and gate_status can be set locally
-                else:
-                    # Update map (ui or from spoolman in "readonly" and "push" modes)
-                    ids_dict = {}
-                    for gate, fil in gate_map.items():
-                        if not (0 <= gate < self.num_gates):
-                            self.log_debug("Warning: Illegal gate number %d supplied in gate map update - ignored" % gate)
-                            continue
-
-                        spool_id = self.safe_int(fil.get('spool_id', -1))
-                        if (not from_spoolman or spool_id != -1):
-                            # Update attributes but don't allow spoolman to accidently clear
-                            self.gate_filament_name[gate] = fil.get('name', '')
-                            self.gate_material[gate] = fil.get('material', '')
-                            self.gate_color[gate] = fil.get('color', '')
-                            self.gate_temperature[gate] = max(
-                                self.safe_int(fil.get('temp', self.default_extruder_temp)),
-                                self.default_extruder_temp
-                            )
-                            self.gate_speed_override[gate] = self.safe_int(fil.get('speed_override', self.gate_speed_override[gate]))
-                            self.gate_status[gate] = self.safe_int(fil.get('status', self.gate_status[gate])) # For UI manual fixing of availabilty
-
-                        # If spool_id has changed, clean up possible stale use of old one
-                        if spool_id != self.gate_spool_id[gate]:
-                            self.log_debug("Spool_id changed for gate %d in MMU_GATE_MAP" % gate)
-                            mod_gate_ids = self.assign_spool_id(gate, spool_id)
-                            for (gate, sid) in mod_gate_ids:
-                                ids_dict[gate] = sid
-
-                    changed_gate_ids = list(ids_dict.items())
-
+                changed_gate_ids = self._apply_gate_map_update(gate_map, replace, from_spoolman)
             except Exception as e:
                 self.log_debug("Invalid MAP parameter: %s\nException: %s" % (gate_map, str(e)))
                 raise gcmd.error("Invalid MAP parameter. See mmu.log for details")
@@ -8173,6 +8520,20 @@ class Mmu:
         msg = "|\n".join([msg_tool, msg_sped, msg_extr]) + "|\n"
         self.log_always(msg)
 
+    # Return list of next 'count' tool changes in the current print file (from index written by file
+    # preprocessor) starting from the current virtual_sdcard position. Empty list if not available
+    def get_upcoming_toolchanges(self, count=1):
+        if self.virtual_sdcard is None:
+            return []
+        file_path = self.virtual_sdcard.file_path()
+        if file_path is None:
+            return []
+        if self.toolchange_index is None or self.toolchange_index.gcode_file != file_path:
+            if self.toolchange_index is not None:
+                self.toolchange_index.close()
+            self.toolchange_index = MmuToolchangeIndex(file_path)
+        return self.toolchange_index.upcoming(self.virtual_sdcard.get_file_position(), count)
+
     cmd_MMU_SLICER_TOOL_MAP_help = "Display or define the tools used in print as specified by slicer"
     def cmd_MMU_SLICER_TOOL_MAP(self, gcmd):
         self.log_to_file(gcmd.get_commandline())
@@ -8195,6 +8556,7 @@ class Mmu:
         num_slicer_tools = gcmd.get_int('NUM_SLICER_TOOLS', self.num_gates, minval=1, maxval=self.num_gates) # Allow slicer to have less tools than MMU gates
         automap_strategy = gcmd.get('AUTOMAP', None)
         skip_automap = gcmd.get_int('SKIP_AUTOMAP', None, minval=0, maxval=1)
+        upcoming = gcmd.get_int('UPCOMING', 0, minval=0)
 
         quiet = False
         if reset:
@@ -8255,6 +8617,7 @@ class Mmu:
             except ValueError as e:
                 raise gcmd.error("Error parsing PURGE_VOLUMES: %s" % str(e))
             quiet = True
+        self._bump_status_generation('tool_map')
 
         if not quiet:
             colors = sum(1 for tool in self.slicer_tool_map['tools'] if self.slicer_tool_map['tools'][tool]['in_use'])
@@ -8292,6 +8655,17 @@ class Mmu:
 
             elif have_purge_map:
                 msg += "\nDETAIL=1 to see purge volume map"
+            if upcoming:
+                changes = self.get_upcoming_toolchanges(upcoming)
+                if changes:
+                    msg += "\nUpcoming tool changes:"
+                    for tc in changes:
+                        msg += "\nLine %d: T%s > T%d" % (tc['line'], tc['from_tool'] if tc['from_tool'] >= 0 else "?", tc['to_tool'])
+                        if tc['next_pos']:
+                            msg += " (next pos: %.1f, %.1f)" % tc['next_pos']
+                        msg += ", %.1fmm extruded before" % tc['extruded']
+                else:
+                    msg += "\nNo tool change index available for current print"
             self.log_always(msg)
 
     cmd_MMU_CALC_PURGE_VOLUMES_help = "Calculate purge volume matrix based on filament color overriding slicer tool map import"
@@ -8326,6 +8700,7 @@ class Mmu:
 
         try:
             self.slicer_tool_map['purge_volumes'] = self._generate_purge_matrix(tool_rgb_colors, min_purge, max_purge, multiplier)
+            self._bump_status_generation('tool_map')
             self.log_always("Purge map updated. Use 'MMU_SLICER_TOOL_MAP PURGE_MAP=1' to view")
         except Exception as e:
             raise MmuError("Error generating purge volues: %s" % str(e))
@@ -8499,6 +8874,34 @@ class Mmu:
         except MmuError as ee:
             self.handle_mmu_error("Filament preload for gate %d failed: %s" % (gate, str(ee)))
 
+    cmd_MMU_PRESTAGE_help = "Pre-stage filament of next (or specified) gate at gear sensor ready for next tool change"
+    def cmd_MMU_PRESTAGE(self, gcmd):
+        self.log_to_file(gcmd.get_commandline())
+        if self.check_if_disabled(): return
+        if self.check_if_not_homed(): return
+
+        quiet = bool(gcmd.get_int('QUIET', 0, minval=0, maxval=1))
+        gate = gcmd.get_int('GATE', None, minval=0, maxval=self.num_gates - 1)
+        log = self.log_debug if quiet else self.log_always
+        if gate is None:
+            gate = self._get_prestage_candidate()
+            if gate is None:
+                log("No upcoming tool change to pre-stage")
+                return
+
+        reason = self._check_can_prestage(gate)
+        if reason:
+            log("Cannot pre-stage gate %d: %s" % (gate, reason))
+            return
+
+        try:
+            with self.wrap_suppress_visual_log():
+                self._prestage_gate(gate)
+            log("Gate %d pre-staged ready for next tool change" % gate)
+        except (MmuError, self.printer.command_error) as ee:
+            # Not fatal, the tool change will simply home the gate as normal
+            self.log_warning("Pre-staging of gate %d failed: %s" % (gate, str(ee)))
+
 
 def load_config(config):
     return Mmu(config)
@@ -8509,18 +8912,27 @@ def load_config(config):
 #
 class MmuCalibrationManager:
 
+    AUTOTUNE_MIN_SAMPLES = 3     # Observations required before estimate can replace existing calibration
+    AUTOTUNE_RD_CI = 0.005       # Required rotation_distance confidence (95% interval half width as fraction of estimate)
+    AUTOTUNE_BOWDEN_CI = 0.01    # Required bowden length confidence (95% interval half width as fraction of estimate)
+
     def __init__(self, mmu):
         self.mmu = mmu
+        self.telemetry = MmuCalibrationTelemetry(mmu, mmu.VARS_MMU_CALIB_TELEMETRY, max_samples=mmu.autotune_samples)
 
-    def load_telemetry(self, bowden_move_ratio, homing_movement, deficit):
+    def load_telemetry(self, bowden_move_ratio, homing_movement, deficit, speed):
         if homing_movement is not None:
             homing_movement -= deficit
-        self._autotune(self.mmu.DIRECTION_LOAD, bowden_move_ratio, homing_movement)
+        self._autotune(self.mmu.DIRECTION_LOAD, bowden_move_ratio, homing_movement, deficit, speed)
 
-    def unload_telemetry(self, bowden_move_ratio, homing_movement, deficit):
+    def unload_telemetry(self, bowden_move_ratio, homing_movement, deficit, speed):
         if homing_movement is not None:
             homing_movement -= deficit
-        self._autotune(self.mmu.DIRECTION_UNLOAD, bowden_move_ratio, homing_movement)
+        self._autotune(self.mmu.DIRECTION_UNLOAD, bowden_move_ratio, homing_movement, deficit, speed)
+
+    # Discard telemetry that is invalidated by manual (re)calibration
+    def reset_telemetry(self, gate=None):
+        self.telemetry.reset(gate)
 
     # Use data from load or unload operation to auto-calibrate / auto-tune
     #
@@ -8528,7 +8940,7 @@ class MmuCalibrationManager:
     #  - ratio of large bowden move to that measured by encoder (0 if it can't be relied on)
     #  - the amount of unexpected homing necessary to reach endstop. We want some homing
     #    movement but we can use excessive numbers for tuning (None indicates not available)
-    #  - the direction of filament movement
+    #  - the direction and speed of filament movement
     #
     # Things we could/can tune from this infomation:
     #  - If gate 0, use the bowden move ratio to update encoder calibration ("encoder calibration"). Dangerous so not done!
@@ -8537,10 +8949,26 @@ class MmuCalibrationManager:
     #  - If gate >0, use the bowden move ratio to set/tune the gear rotation_distance ("gate calibration")
     #    but only do this if homing movement data tells us we haven't overshot. Can be done in both directions
     #
-    # Calibration replaces the previous value. Autotuning applies a moving average
-    def _autotune(self, direction, bowden_move_ratio, homing_movement):
+    # Every observation is kept in the per-gate telemetry store. Calibration replaces the previous value. Autotuning
+    # only moves to the robust estimate once there are enough samples, the confidence interval is tight and the
+    # estimate is significantly different from the current value so a single bad homing cannot cause drift
+    def _autotune(self, direction, bowden_move_ratio, homing_movement, deficit, speed):
+        gate = self.mmu.gate_selected
         msg = "Autotune: bowden move ratio: %.4f, Extra homing movement: %s" % (bowden_move_ratio, "n/a" if homing_movement is None else "%.1fmm" % homing_movement)
-        if homing_movement is not None:
+        if homing_movement is not None and gate >= 0 and direction in [self.mmu.DIRECTION_LOAD, self.mmu.DIRECTION_UNLOAD]:
+            current_rd = self.mmu.gear_rail.steppers[0].get_rotation_distance()[0]
+            bowden_length = self.mmu._get_bowden_length(gate)
+
+            # Allow max 10% variation from the gate's calibrated (or default) rotation_distance for autotune. Encoder
+            # measurements failing this sanity check are not recorded so they can't skew later estimates
+            new_rd = round(bowden_move_ratio * current_rd, 4)
+            ref_rd = self.mmu.get_rotation_distance(gate)
+            sane = ref_rd <= 0 or math.isclose(new_rd, ref_rd, rel_tol=0.1)
+            if sane or bowden_move_ratio <= 0:
+                self.telemetry.record(gate, direction, bowden_move_ratio, homing_movement, deficit, speed, current_rd, bowden_length)
+            else:
+                msg += ". Calculated rotation_distance: %.4f for gate %d failed sanity check and has been ignored" % (new_rd, gate)
+
             # TODO Currently only works with gate >0. Could work with gate 0 if variable_rotation_distance is True
             # TODO and bowden is calibrated and we don't tune bowden below
 
@@ -8548,25 +8976,20 @@ class MmuCalibrationManager:
             if (
                 self.mmu.autotune_rotation_distance and
                 self.mmu.mmu_machine.variable_rotation_distances and
-                self.mmu.gate_selected > 0 and
+                gate > 0 and
                 bowden_move_ratio > 0 and
-                homing_movement > 0
+                homing_movement > 0 and
+                sane
             ):
-                if direction in [self.mmu.DIRECTION_LOAD, self.mmu.DIRECTION_UNLOAD]:
-                    current_rd = self.mmu.gear_rail.steppers[0].get_rotation_distance()[0]
-                    new_rd = round(bowden_move_ratio * current_rd, 4)
-                    gate0_rd = self.mmu.rotation_distances[0]
-
-                    # Allow max 10% variation from gate 0 for autotune
-                    if math.isclose(new_rd, gate0_rd, rel_tol=0.1):
-                        if not self.mmu.calibrating and self.mmu.rotation_distances[self.mmu.gate_selected] > 0:
-                            # Tuning existing calibration
-                            new_rd = round((self.mmu.rotation_distances[self.mmu.gate_selected] * 5 + new_rd) / 6, 4) # Moving average
-                            msg += ". Autotuned rotation_distance: %.4f for gate %d" % (new_rd, self.mmu.gate_selected)
-                        if not math.isclose(current_rd, new_rd):
-                            self.mmu.save_rotation_distance(self.mmu.gate_selected, new_rd)
-                    else:
-                        msg += ". Calculated rotation_distance: %.4f for gate %d failed sanity check and has been ignored" % (new_rd, self.mmu.gate_selected)
+                if not self.mmu.calibrating and self.mmu.rotation_distances[gate] > 0:
+                    # Tuning existing calibration
+                    est = self.telemetry.estimate_rotation_distance(gate)
+                    new_rd = self._tuned_value(est, self.mmu.rotation_distances[gate], self.AUTOTUNE_RD_CI, 4)
+                    msg += ". Rotation_distance estimate: %s" % self._estimate_string(est, 4)
+                    if new_rd is not None:
+                        msg += ". Autotuned rotation_distance: %.4f for gate %d" % (new_rd, gate)
+                if new_rd is not None and not math.isclose(current_rd, new_rd):
+                    self.mmu.save_rotation_distance(gate, new_rd)
 
             # TODO Currently only works with gate 0. Could work with other gates if variable_bowden_lengths is True
             # TODO and rotation distance is calibrated and not being tuned above
@@ -8575,30 +8998,22 @@ class MmuCalibrationManager:
             if (
                 self.mmu.autotune_bowden_length and
                 self.mmu.mmu_machine.require_bowden_move and
-                self.mmu.gate_selected == 0 and
+                gate == 0 and
+                bowden_length > 0 and
                 (
                     0.9 < bowden_move_ratio < 1.1 or
                     not self.mmu.has_encoder()
                 )
             ):
-                if direction in [self.mmu.DIRECTION_LOAD, self.mmu.DIRECTION_UNLOAD]:
-                    bowden_length = self.mmu._get_bowden_length(self.mmu.gate_selected)
-                    # We expect homing_movement to be 0 if perfectly calibrated and perfect movement
-                    # Note that we only change calibrated bowden length if extra homing is >1% of bowden length
-                    error_tolerance = bowden_length * 0.01 # 1% of bowden length
-                    if abs(homing_movement) > error_tolerance:
-                        if homing_movement > 0:
-                            new_bl = bowden_length + error_tolerance
-                        else:
-                            new_bl = bowden_length - error_tolerance
-                    else:
-                        new_bl = bowden_length
-                    new_bl = round((bowden_length * 5 + new_bl) / 6, 1) # Still perform moving average to smooth changes
-                    if not math.isclose(bowden_length, new_bl):
-                        self.save_bowden_length(self.mmu.gate_selected, new_bl)
-                        msg += " Autotuned bowden length: %.1f" % new_bl
-
-            if self.mmu.gate_selected == 0 and homing_movement > 0 and bowden_move_ratio > 0:
+                # We expect homing_movement to be 0 if perfectly calibrated and perfect movement
+                est = self.telemetry.estimate_bowden_length(gate, require_ratio=self.mmu.has_encoder())
+                new_bl = self._tuned_value(est, bowden_length, self.AUTOTUNE_BOWDEN_CI, 1)
+                msg += ". Bowden length estimate: %s" % self._estimate_string(est, 1)
+                if new_bl is not None:
+                    self.save_bowden_length(gate, new_bl)
+                    msg += ". Autotuned bowden length: %.1f" % new_bl
+
+            if gate == 0 and homing_movement > 0 and bowden_move_ratio > 0:
                 # Bowden movement based warning of encoder calibration aka MMU_CALIBRATE_ENCODER
                 if not 0.95 < bowden_move_ratio < 1.05:
                     msg += ". Encoder measurement on gate 0 was outside of desired calibration range. You may want to check function or recalibrate"
@@ -8607,15 +9022,31 @@ class MmuCalibrationManager:
 
         self.mmu.log_debug(msg)
 
+    # Return new calibration value if robust estimate is confident and significantly different from current, else None
+    def _tuned_value(self, est, current, rel_ci, precision):
+        if est is None or est['samples'] < self.AUTOTUNE_MIN_SAMPLES or est['ci'] > est['estimate'] * rel_ci:
+            return None
+        new_value = round(est['estimate'], precision)
+        if abs(new_value - current) <= max(est['ci'], 10 ** -precision):
+            return None
+        return new_value
+
+    def _estimate_string(self, est, precision):
+        if est is None:
+            return "n/a"
+        return "%.*f +/-%.*f (n=%d, rejected=%d)" % (precision, est['estimate'], precision, est['ci'], est['samples'], est['rejected'])
+
     # Update bowden calibration for current gate and clog_detection if not yet calibrated
     def update_bowden_calibration(self, length):
         if length < 0:
             self.save_bowden_length(self.mmu.gate_selected, -1) # Reset
+            self.reset_telemetry(self.mmu.gate_selected if self.mmu.mmu_machine.variable_bowden_lengths else None)
             self.mmu.log_always("Calibrated bowden length for gate %d has been reset" % self.mmu.gate_selected)
         else:
             length = round(length, 1)
             clog_updated = False
             self.save_bowden_length(self.mmu.gate_selected, length, endstop=self.mmu.gate_homing_endstop)
+            self.reset_telemetry(self.mmu.gate_selected if self.mmu.mmu_machine.variable_bowden_lengths else None)
             if self.mmu.has_encoder() and self.mmu.save_variables.allVariables.get(self.mmu.VARS_MMU_CALIB_CLOG_LENGTH, None) is None:
                 clog_detection_length = self.calc_clog_detection_length(length)
                 self.save_clog_detection_length(clog_detection_length)
@@ -8897,6 +9328,7 @@ class MmuCalibrationManager:
                     if save:
                         self.mmu.set_rotation_distance(new_rd)
                         self.mmu.save_rotation_distance(self.mmu.gate_selected, new_rd)
+                        self.reset_telemetry(self.mmu.gate_selected)
                 else:
                     self.mmu.log_always("Calibration ignored because it is not considered valid (>20% difference from gate 0)")
             self.mmu._unload_gate()
@@ -0,0 +1,121 @@
+# Happy Hare MMU Software
+# Persistent per-gate load/unload telemetry and robust estimation for calibration autotuning
+#
+# Goal: Rather than folding each load/unload observation into a fixed moving average (and throwing it away)
+#       keep a bounded history of observations per gate and let a robust estimator (median based outlier
+#       rejection, trimmed mean and a confidence interval) decide when the evidence justifies changing the
+#       calibrated gear rotation_distance or bowden length. Each observation records the calibration in
+#       effect at the time so the implied "true" value remains comparable after calibration changes
+#
+# Copyright (C) 2022-2025  moggieuk#6538 (discord)
+#                          moggieuk@hotmail.com
+#
+# (\_/)
+# ( *,*)
+# (")_(") Happy Hare Ready
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+import math
+
+# Observation record layout (persisted as list to keep mmu_vars.cfg compact)
+OBS_DIRECTION, OBS_RATIO, OBS_HOMING, OBS_DEFICIT, OBS_SPEED, OBS_RD, OBS_BOWDEN = range(7)
+
+# Two sided 95% Student-t critical values indexed by degrees of freedom (>30 uses normal approximation)
+T_95 = [0., 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+# Robust location estimate of 'values'. Outliers further than 'reject' scaled MADs from the median are discarded,
+# then a symmetric 'trim' fraction is removed from each end before averaging. Returns dict with estimate, median,
+# 95% confidence interval half width ('ci'), number of samples used and rejected, or None if no samples
+def robust_estimate(values, trim=0.1, reject=3.):
+    if not values:
+        return None
+    ordered = sorted(values)
+    median = _median(ordered)
+    mad = _median(sorted(abs(v - median) for v in ordered)) * 1.4826 # Consistent with stdev for normal data
+    if mad > 0:
+        kept = [v for v in ordered if abs(v - median) <= reject * mad]
+    else:
+        kept = [v for v in ordered if v == median] or ordered
+    k = int(len(kept) * trim)
+    trimmed = kept[k:len(kept) - k] if len(kept) - 2 * k >= 2 else kept
+    n = len(trimmed)
+    mean = sum(trimmed) / n
+    if n > 1:
+        stdev = math.sqrt(sum((v - mean) ** 2 for v in trimmed) / (n - 1))
+        ci = (T_95[n - 1] if n - 1 < len(T_95) else 1.96) * stdev / math.sqrt(n)
+    else:
+        ci = float('inf')
+    return {'estimate': mean, 'median': median, 'ci': ci, 'samples': n, 'rejected': len(ordered) - len(kept)}
+
+def _median(ordered):
+    n = len(ordered)
+    mid = n // 2
+    return ordered[mid] if n % 2 else (ordered[mid - 1] + ordered[mid]) / 2.
+
+
+class MmuCalibrationTelemetry:
+
+    def __init__(self, mmu, var_name, max_samples=20):
+        self.mmu = mmu
+        self.var_name = var_name
+        self.max_samples = max_samples
+        self._gates = None # Lazily loaded from mmu_vars.cfg
+
+    def _load(self):
+        if self._gates is None:
+            persisted = self.mmu.save_variables.allVariables.get(self.var_name, None)
+            self._gates = [[] for _ in range(self.mmu.num_gates)]
+            if isinstance(persisted, list):
+                for gate, observations in enumerate(persisted[:self.mmu.num_gates]):
+                    if isinstance(observations, list):
+                        self._gates[gate] = [o for o in observations if isinstance(o, list) and len(o) == 7][-self.max_samples:]
+        return self._gates
+
+    def _persist(self):
+        self.mmu.save_variable(self.var_name, self._gates, write=True)
+
+    def record(self, gate, direction, bowden_move_ratio, homing_movement, deficit, speed, rotation_distance, bowden_length):
+        gates = self._load()
+        if not 0 <= gate < len(gates):
+            return
+        observations = gates[gate]
+        observations.append([
+            direction,
+            round(bowden_move_ratio, 5),
+            None if homing_movement is None else round(homing_movement, 2),
+            round(deficit, 2),
+            round(speed, 1),
+            round(rotation_distance, 5),
+            round(bowden_length, 1)
+        ])
+        del observations[:-self.max_samples]
+        self._persist()
+
+    # Discard observations (e.g. after manual recalibration invalidates them). gate=None for all gates
+    def reset(self, gate=None):
+        gates = self._load()
+        if gate is None:
+            self._gates = [[] for _ in range(self.mmu.num_gates)]
+        elif 0 <= gate < len(gates):
+            gates[gate] = []
+        self._persist()
+
+    def observations(self, gate):
+        gates = self._load()
+        return list(gates[gate]) if 0 <= gate < len(gates) else []
+
+    # Rotation distance implied by each usable observation (encoder measured bowden move ratio)
+    def estimate_rotation_distance(self, gate):
+        values = [o[OBS_RATIO] * o[OBS_RD] for o in self.observations(gate)
+                  if o[OBS_RATIO] > 0 and o[OBS_RD] > 0 and o[OBS_HOMING] is not None and o[OBS_HOMING] > 0]
+        return robust_estimate(values)
+
+    # Bowden length implied by each usable observation (extra homing movement needed to reach endstop)
+    def estimate_bowden_length(self, gate, require_ratio=True):
+        values = [o[OBS_BOWDEN] + o[OBS_HOMING] for o in self.observations(gate)
+                  if o[OBS_BOWDEN] > 0 and o[OBS_HOMING] is not None and (not require_ratio or 0.9 < o[OBS_RATIO] < 1.1)]
+        return robust_estimate(values)
@@ -11,10 +11,10 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 #
-import logging
+import logging, contextlib, collections
 
 # Happy Hare imports
-from ..mmu_leds  import MmuLeds
+from ..mmu_leds  import MmuLeds, transmit_led_chains
 
 # MMU subcomponent clases
 from .mmu_shared import *
@@ -25,6 +25,15 @@ class MmuLedManager:
         self.mmu_machine = mmu.mmu_machine
         self.inside_timer = self.pending_update = False
         self.effect_state = {} # Current state used to minimise updates {unit: {segment: effect}}
+        self.led_effect_handler = None # Direct api to [mmu_led_effect] if animation is possible
+        self.pending_leds = collections.OrderedDict() # Coalesced led updates {(unit, segment, gate): (effect, fadetime)}
+        self.last_led_flush = 0.
+        self.led_flush_timer = None
+        self._batch_chains = None
+
+        # Updates are coalesced and applied at most once per interval
+        intervals = [mmu_unit.leds.update_interval for mmu_unit in self.mmu_machine.units if mmu_unit.leds]
+        self.led_update_interval = min(intervals) if intervals else 0.
 
         # Event handlers
         self.mmu.printer.register_event_handler("klippy:ready", self.handle_ready)
@@ -34,10 +43,35 @@ class MmuLedManager:
         self.mmu.gcode.register_command('MMU_LED', self.cmd_MMU_LED, desc = self.cmd_MMU_LED_help)
 
     def handle_ready(self):
+        self.led_effect_handler = self.mmu.printer.lookup_object('mmu_led_effect', None)
         self.setup_led_timer()
 
     def setup_led_timer(self):
         self.led_timer = self.mmu.reactor.register_timer(self.led_timer_handler, self.mmu.reactor.NEVER)
+        self.led_flush_timer = self.mmu.reactor.register_timer(self.led_flush_handler, self.mmu.reactor.NEVER)
+
+    def led_flush_handler(self, eventtime):
+        self.flush_led_updates()
+        return self.mmu.reactor.NEVER
+
+    # Arrange for pending updates to be applied, but no sooner than one interval after the last flush
+    def _schedule_led_flush(self):
+        if self.led_flush_timer is None or self.led_update_interval <= 0:
+            self.flush_led_updates()
+        else:
+            waketime = max(self.mmu.reactor.monotonic(), self.last_led_flush + self.led_update_interval)
+            self.mmu.reactor.update_timer(self.led_flush_timer, waketime)
+
+    # Apply all pending led updates (in the order requested) with single transmit per chain
+    def flush_led_updates(self):
+        if self.led_flush_timer is not None:
+            self.mmu.reactor.update_timer(self.led_flush_timer, self.mmu.reactor.NEVER)
+            self.last_led_flush = self.mmu.reactor.monotonic()
+        pending, self.pending_leds = self.pending_leds, collections.OrderedDict()
+        if pending:
+            with self._batch_update():
+                for (unit, segment, gate), (effect, fadetime) in pending.items():
+                    self._update_leds(unit, gate, fadetime, {segment: effect})
 
     def led_timer_handler(self, eventtime):
         self.inside_timer = True
@@ -94,7 +128,8 @@ class MmuLedManager:
             status_effect=status_effect,
             logo_effect=logo_effect,
             fadetime=fadetime,
-            duration=duration
+            duration=duration,
+            immediate=True
         )
 
     cmd_MMU_LED_help = "Manage mode of operation of optional MMU LED's"
@@ -148,7 +183,8 @@ class MmuLedManager:
                         exit_effect='off',
                         entry_effect='off',
                         status_effect='off',
-                        logo_effect='off'
+                        logo_effect='off',
+                        immediate=True
                     )
                 else:
                     if leds.animation and not animation:
@@ -159,7 +195,8 @@ class MmuLedManager:
                             entry_effect='off',
                             status_effect='off',
                             logo_effect='off',
-                            fadetime=0
+                            fadetime=0,
+                            immediate=True
                         )
 
                 if (leds.exit_effect != exit_effect or
@@ -183,7 +220,8 @@ class MmuLedManager:
                             exit_effect='default',
                             entry_effect='default',
                             status_effect='default',
-                            logo_effect='default'
+                            logo_effect='default',
+                            immediate=True
                         )
 
                 if not quiet:
@@ -430,6 +468,22 @@ class MmuLedManager:
                     status_effect=status_effect
                 )
 
+    # Batch all LED changes so that each chain is transmitted just once. Yields set to add changed chains to
+    @contextlib.contextmanager
+    def _batch_update(self):
+        if self.led_effect_handler:
+            with self.led_effect_handler.batch() as chains:
+                yield chains
+        elif self._batch_chains is not None:
+            yield self._batch_chains # Nested
+        else:
+            self._batch_chains = set()
+            try:
+                yield self._batch_chains
+            finally:
+                chains, self._batch_chains = self._batch_chains, None
+                transmit_led_chains(chains)
+
     def effect_name(self, unit, operation):
         leds = self.mmu_machine.get_mmu_unit_by_index(unit).leds
         if leds:
@@ -445,29 +499,53 @@ class MmuLedManager:
     #   "gate_status"     - indicate gate availability
     #   "filament_color"  - indicate filament color
     #   "slicer_color"    - display slicer defined color for each gate
-    def _set_led(self, unit, gate, duration=None, fadetime=1, exit_effect=None, entry_effect=None, status_effect=None, logo_effect=None):
-        effects = {
-            'entry': entry_effect,
-            'exit': exit_effect,
-            'status': status_effect,
-            'logo': logo_effect,
-        }
+    #
+    # Requests are queued per (unit, segment, gate) and coalesced so that noisy state changes result in at most
+    # one update per 'update_interval'. Use immediate=True to apply now (e.g. user commands)
+    def _set_led(self, unit, gate, duration=None, fadetime=1, exit_effect=None, entry_effect=None, status_effect=None, logo_effect=None, immediate=False):
+        mmu_unit = self.mmu_machine.get_mmu_unit_by_index(unit)
+        if (
+            not mmu_unit.leds or
+            not mmu_unit.leds.enabled or
+            (gate is not None and not mmu_unit.manages_gate(gate))
+        ):
+            # Ignore if unit doesn't have leds, is disabled for doesn't manage the specific gate
+            # (saves callers from checking)
+            return
+
+        if gate is not None and gate < 0:
+            return
+
+        # Don't allow changes to shortcut animations - important changes will be seen when update timer fires
+        if self.pending_update:
+            return
+
+        # Schedule a return to defaults after duration
+        if duration is not None:
+            self.schedule_led_command(duration, unit)
+
+        for segment, effect in [('exit', exit_effect), ('entry', entry_effect), ('status', status_effect), ('logo', logo_effect)]:
+            if effect is None:
+                continue
+            if gate is None:
+                # Whole segment update supersedes any pending update of individual gates
+                for key in [k for k in self.pending_leds if k[0] == unit and k[1] == segment and k[2] is not None]:
+                    del self.pending_leds[key]
+            self.pending_leds.pop((unit, segment, gate), None) # Latest request is applied last
+            self.pending_leds[(unit, segment, gate)] = (effect, fadetime)
+
+        if immediate:
+            self.flush_led_updates()
+        else:
+            self._schedule_led_flush()
+
+    # Render effects ({segment: effect}) on unit/gate leds
+    def _update_leds(self, unit, gate, fadetime, effects):
+        handler = self.led_effect_handler
 
         # Helper functions to make core logic simplier...
 
-        # Iteration wrapper to easily detect the last loop
-        def with_last(iterable):
-            it = iter(iterable)
-            try:
-                prev = next(it)
-            except StopIteration:
-                return  # Empty iterable
-            for item in it:
-                yield prev, False
-                prev = item
-            yield prev, True
-
-        # List of led indexes (1-based on led_chain_spec) for iteration
+        # List of led indexes (1-based like SET_LED INDEX) for iteration
         def led_indexes(unit, segment, gate):
             mmu_unit = self.mmu_machine.get_mmu_unit_by_index(unit)
             num_leds = mmu_unit.leds.get_status()[segment]
@@ -477,18 +555,11 @@ class MmuLedManager:
             index0 = (gate - mmu_unit.first_gate) * leds_per_gate + 1
             return list(range(index0, index0 + leds_per_gate))
 
-        # Get raw "LEDS=" spec to stop an effect on virtual chain for given segment
-        def led_chain_spec(unit, segment):
-            return 'unit%d_mmu_%s_leds' % (unit, segment)
-
-        # Get specific LEDS=" spec to stop an effect on whole segment or gate part of segment
-        def effect_leds_spec(unit, segment, gate):
-            if gate is not None and gate >= 0:
-                led_index_str = ','.join(map(str, led_indexes(unit, segment, gate)))
-                return "%s (%s)" % (led_chain_spec(unit, segment), led_index_str) # All leds for gate
-            return led_chain_spec(unit, segment) # All leds in segment
+        # Virtual led chain for given segment
+        def led_chain(unit, segment):
+            return self.mmu_machine.get_mmu_unit_by_index(unit).leds.virtual_chains[segment]
 
-        # Get "EFFECT=" spec Used for applying effects
+        # Get effect name used for applying effects
         def effect_spec(unit, gate, effect):
             if gate is not None and gate >= 0:
                 return "%s_%d" % (effect, gate)
@@ -502,40 +573,29 @@ class MmuLedManager:
                 return mmu_unit.leds.get_status()['%s_effect' % segment]
             return suggested
 
-        # Stop the current effect on the gate led(s)
+        # Stop the current effect on the whole segment or just the gate led(s)
         def stop_gate_effect(unit, segment, gate, fadetime=None):
-            if self.mmu_machine.get_mmu_unit_by_index(unit).leds.animation:
-                self.mmu.gcode.run_script_from_command(
-                    "_MMU_STOP_LED_EFFECTS LEDS='%s' %s" % (
-                        effect_leds_spec(unit, segment, gate),
-                        ('FADETIME=%d' % fadetime) if fadetime is not None else ''
-                    )
-                )
+            if handler and self.mmu_machine.get_mmu_unit_by_index(unit).leds.animation:
+                indices = [i - 1 for i in led_indexes(unit, segment, gate)] if gate is not None and gate >= 0 else None
+                handler.stopEffects(led_chain(unit, segment), indices, fadetime=fadetime or 0.)
 
         # Sets or replaces effect on the gate led(s)
         def set_gate_effect(base_effect, unit, segment, gate, fadetime=None):
             leds = self.mmu_machine.get_mmu_unit_by_index(unit).leds
-            if leds.animation:
-                self.mmu.gcode.run_script_from_command(
-                    "_MMU_SET_LED_EFFECT EFFECT='%s' REPLACE=1 %s" % (
-                        effect_spec(unit, gate, "%s_%s" % (base_effect, segment)),
-                        ('FADETIME=%d' % fadetime) if fadetime is not None else ''
-                    )
-                )
+            if handler and leds.animation:
+                name = effect_spec(unit, gate, "%s_%s" % (base_effect, segment))
+                if not handler.setEffect(name, fadetime=fadetime or 0., replace=True):
+                    raise MmuError("LED effect '%s' not defined" % name)
             else:
                 # Set all leds for effect to static rbg
                 rgb = leds.get_rgb_for_effect(base_effect)
                 set_gate_rgb(rgb, unit, segment, gate)
 
-        # Sets rgb value of gate led(s)
-        def set_gate_rgb(rgb, unit, segment, gate, transmit=True):
+        # Sets rgb value of gate led(s). Transmission is deferred until the end of the batch
+        def set_gate_rgb(rgb, unit, segment, gate):
             # Normally there is only a single led per gate but some designs have many
-            for index, is_last in with_last(led_indexes(unit, segment, gate)):
-                self.mmu.gcode.run_script_from_command(
-                    "SET_LED LED=%s INDEX=%d RED=%s GREEN=%s BLUE=%s TRANSMIT=%d" % (
-                        led_chain_spec(unit, segment), index, rgb[0], rgb[1], rgb[2], 1 if transmit and is_last else 0
-                    )
-                )
+            colors = dict((index - 1, rgb) for index in led_indexes(unit, segment, gate))
+            chains.update(led_chain(unit, segment).set_leds(colors, transmit=False))
 
         # Stop any previous effect before setting rgb else it won't have an effect
         def stop_effect_and_set_gate_rgb(rgb, unit, segment, gate, fadetime=None):
@@ -552,188 +612,173 @@ class MmuLedManager:
         #
         try:
             mmu_unit = self.mmu_machine.get_mmu_unit_by_index(unit)
-            if (
-                not mmu_unit.leds or
-                not mmu_unit.leds.enabled or
-                (gate is not None and not mmu_unit.manages_gate(gate))
-            ):
-                # Ignore if unit doesn't have leds, is disabled for doesn't manage the specific gate
-                # (saves callers from checking)
-                return
-
-            if gate is not None and gate < 0:
-                return
-
-            # Don't allow changes to shortcut animations - important changes will be seen when update timer fires
-            if self.pending_update:
-                return
-
-            # Schedule a return to defaults after duration
-            if duration is not None:
-                self.schedule_led_command(duration, unit)
-
-            #
-            # Entry and Exit
-            #
-            for segment in ['exit', 'entry']:
-                effect = get_effective_effect(mmu_unit, segment, effects[segment])
-
-                # effect will be None if leds not configured for no led chain for that segment
-                #if not effect or self.effect_state.get(unit, {}).get(segment) == effect:
-                if not effect:
-                    continue
+            if not mmu_unit.leds or not mmu_unit.leds.enabled:
+                return # Disabled since request was queued
 
-                elif effect == "off":
+            # All led changes are applied directly and transmitted once per chain at the end
+            with self._batch_update() as chains:
+                #
+                # Entry and Exit
+                #
+                for segment in ['exit', 'entry']:
+                    effect = get_effective_effect(mmu_unit, segment, effects.get(segment))
 
-                    stop_effect_and_set_gate_rgb((0,0,0), unit, segment, gate, fadetime=fadetime)
+                    # effect will be None if leds not configured for no led chain for that segment
+                    #if not effect or self.effect_state.get(unit, {}).get(segment) == effect:
+                    if not effect:
+                        continue
 
-                elif effect == "gate_status":  # Filament availability (gate_map)
+                    elif effect == "off":
 
-                    def _effect_for_gate(g):
-                        # Selected gate, with filament past extruder entry: force 'gate_selected'
-                        if g == self.mmu.gate_selected and self.mmu.filament_pos > self.mmu.FILAMENT_POS_EXTRUDER_ENTRY:
-                            return self.effect_name(unit, 'gate_selected')
+                        stop_effect_and_set_gate_rgb((0,0,0), unit, segment, gate, fadetime=fadetime)
 
-                        suffix = '_sel' if g == self.mmu.gate_selected else ''
-                        status = self.mmu.gate_status[g]
+                    elif effect == "gate_status":  # Filament availability (gate_map)
 
-                        if status == self.mmu.GATE_UNKNOWN:
-                            key = 'gate_unknown'
-                        elif status > self.mmu.GATE_EMPTY:
-                            key = 'gate_available'
-                        else:
-                            key = 'gate_empty'
+                        def _effect_for_gate(g):
+                            # Selected gate, with filament past extruder entry: force 'gate_selected'
+                            if g == self.mmu.gate_selected and self.mmu.filament_pos > self.mmu.FILAMENT_POS_EXTRUDER_ENTRY:
+                                return self.effect_name(unit, 'gate_selected')
 
-                        return self.effect_name(unit, '%s%s' % (key, suffix))
+                            suffix = '_sel' if g == self.mmu.gate_selected else ''
+                            status = self.mmu.gate_status[g]
 
-                    if gate is not None:
-                        set_gate_effect(_effect_for_gate(gate), unit, segment, gate, fadetime=fadetime)
-                    else:
-                        for g in range(mmu_unit.first_gate, mmu_unit.first_gate + mmu_unit.num_gates):
-                            set_gate_effect(_effect_for_gate(g), unit, segment, g, fadetime=fadetime)
-
-                elif effect == "filament_color":
-
-                    def _resolve_filament_rgb(g):
-                        rgb = self.mmu.gate_color_rgb[g]
-                        if self.mmu.gate_status[g] == self.mmu.GATE_EMPTY:
-                            return mmu_unit.leds.empty_light
-                        if self.mmu.gate_color[g] == "":
-                            return mmu_unit.leds.white_light
-                        if rgb == (0, 0, 0):
-                            return mmu_unit.leds.black_light
-                        return rgb
-
-                    if gate is not None:
-                        rgb = _resolve_filament_rgb(gate)
-                        stop_effect_and_set_gate_rgb(rgb, unit, segment, gate)
-                    else:
-                        stop_gate_effect(unit, segment, None)
-                        for g, is_last in with_last(range(mmu_unit.first_gate, mmu_unit.first_gate + mmu_unit.num_gates)):
-                            rgb = _resolve_filament_rgb(g)
-                            set_gate_rgb(rgb, unit, segment, g, transmit=is_last)
+                            if status == self.mmu.GATE_UNKNOWN:
+                                key = 'gate_unknown'
+                            elif status > self.mmu.GATE_EMPTY:
+                                key = 'gate_available'
+                            else:
+                                key = 'gate_empty'
 
-                elif effect == "slicer_color":
+                            return self.effect_name(unit, '%s%s' % (key, suffix))
 
-                    def _resolve_slicer_rgb(g):
-                        rgb = self.mmu.slicer_color_rgb[g]
-                        if self.mmu.gate_status[g] == self.mmu.GATE_EMPTY:
-                            return mmu_unit.leds.empty_light
-                        if rgb == (0, 0, 0):
-                            return mmu_unit.leds.black_light
-                        return rgb
-
-                    if gate is not None:
-                        rgb = _resolve_slicer_rgb(gate)
-                        stop_effect_and_set_gate_rgb(rgb, unit, segment, gate)
-                    else:
-                        stop_gate_effect(unit, segment, None) # Stop all gates
-                        for g, is_last in with_last(range(mmu_unit.first_gate, mmu_unit.first_gate + mmu_unit.num_gates)):
-                            rgb = _resolve_slicer_rgb(g)
-                            set_gate_rgb(rgb, unit, segment, g, transmit=is_last)
-
-                elif isinstance(effect, tuple) or ',' in effect: # RGB color
-                    rgb = MmuLeds.string_to_rgb(effect)
-                    if gate is not None:
-                        stop_effect_and_set_gate_rgb(rgb, unit, segment, gate)
-                    else:
-                        stop_gate_effect(unit, segment, None) # Stop all gates
-                        for g, is_last in with_last(range(mmu_unit.first_gate, mmu_unit.first_gate + mmu_unit.num_gates)):
-                            set_gate_rgb(rgb, unit, segment, g, transmit=is_last)
+                        if gate is not None:
+                            set_gate_effect(_effect_for_gate(gate), unit, segment, gate, fadetime=fadetime)
+                        else:
+                            for g in range(mmu_unit.first_gate, mmu_unit.first_gate + mmu_unit.num_gates):
+                                set_gate_effect(_effect_for_gate(g), unit, segment, g, fadetime=fadetime)
+
+                    elif effect == "filament_color":
+
+                        def _resolve_filament_rgb(g):
+                            rgb = self.mmu.gate_color_rgb[g]
+                            if self.mmu.gate_status[g] == self.mmu.GATE_EMPTY:
+                                return mmu_unit.leds.empty_light
+                            if self.mmu.gate_color[g] == "":
+                                return mmu_unit.leds.white_light
+                            if rgb == (0, 0, 0):
+                                return mmu_unit.leds.black_light
+                            return rgb
+
+                        if gate is not None:
+                            rgb = _resolve_filament_rgb(gate)
+                            stop_effect_and_set_gate_rgb(rgb, unit, segment, gate)
+                        else:
+                            stop_gate_effect(unit, segment, None)
+                            for g in range(mmu_unit.first_gate, mmu_unit.first_gate + mmu_unit.num_gates):
+                                rgb = _resolve_filament_rgb(g)
+                                set_gate_rgb(rgb, unit, segment, g)
+
+                    elif effect == "slicer_color":
+
+                        def _resolve_slicer_rgb(g):
+                            rgb = self.mmu.slicer_color_rgb[g]
+                            if self.mmu.gate_status[g] == self.mmu.GATE_EMPTY:
+                                return mmu_unit.leds.empty_light
+                            if rgb == (0, 0, 0):
+                                return mmu_unit.leds.black_light
+                            return rgb
+
+                        if gate is not None:
+                            rgb = _resolve_slicer_rgb(gate)
+                            stop_effect_and_set_gate_rgb(rgb, unit, segment, gate)
+                        else:
+                            stop_gate_effect(unit, segment, None) # Stop all gates
+                            for g in range(mmu_unit.first_gate, mmu_unit.first_gate + mmu_unit.num_gates):
+                                rgb = _resolve_slicer_rgb(g)
+                                set_gate_rgb(rgb, unit, segment, g)
+
+                    elif isinstance(effect, tuple) or ',' in effect: # RGB color
+                        rgb = MmuLeds.string_to_rgb(effect)
+                        if gate is not None:
+                            stop_effect_and_set_gate_rgb(rgb, unit, segment, gate)
+                        else:
+                            stop_gate_effect(unit, segment, None) # Stop all gates
+                            for g in range(mmu_unit.first_gate, mmu_unit.first_gate + mmu_unit.num_gates):
+                                set_gate_rgb(rgb, unit, segment, g)
 
-                elif effect != "": # Named effect
-                    set_gate_effect(effect, unit, segment, gate, fadetime=fadetime)
+                    elif effect != "": # Named effect
+                        set_gate_effect(effect, unit, segment, gate, fadetime=fadetime)
 
-                self.effect_state.setdefault(unit, {})[segment] = effect
+                    self.effect_state.setdefault(unit, {})[segment] = effect
 
 
-            #
-            # Status
-            #
-            segment = "status"
-            effect = get_effective_effect(mmu_unit, segment, effects[segment])
+                #
+                # Status
+                #
+                segment = "status"
+                effect = get_effective_effect(mmu_unit, segment, effects.get(segment))
 
-            #if not effect or self.effect_state.get(unit, {}).get(segment) == effect:
-            if not effect:
-                pass
+                #if not effect or self.effect_state.get(unit, {}).get(segment) == effect:
+                if not effect:
+                    pass
 
-            elif effect == "off":
+                elif effect == "off":
 
-                stop_effect_and_set_gate_rgb((0,0,0), unit, segment, gate, fadetime=fadetime)
+                    stop_effect_and_set_gate_rgb((0,0,0), unit, segment, gate, fadetime=fadetime)
     
-            elif effect in ["filament_color", "on"]:
-
-                stop_gate_effect(unit, segment, None)
-                rgb = mmu_unit.leds.white_light
-                if self.mmu.gate_selected >= 0 and self.mmu.filament_pos > self.mmu.FILAMENT_POS_UNLOADED:
-                    if effects[segment] != "on" and self.mmu.gate_color[self.mmu.gate_selected] != "":
-                        rgb = self.mmu.gate_color_rgb[self.mmu.gate_selected]
-                        if rgb == (0,0,0):
-                            rgb = mmu_unit.leds.black_light
-                else:
-                    rgb = mmu_unit.leds.black_light
-                set_gate_rgb(rgb, unit, segment, None)
+                elif effect in ["filament_color", "on"]:
+
+                    stop_gate_effect(unit, segment, None)
+                    rgb = mmu_unit.leds.white_light
+                    if self.mmu.gate_selected >= 0 and self.mmu.filament_pos > self.mmu.FILAMENT_POS_UNLOADED:
+                        if effects.get(segment) != "on" and self.mmu.gate_color[self.mmu.gate_selected] != "":
+                            rgb = self.mmu.gate_color_rgb[self.mmu.gate_selected]
+                            if rgb == (0,0,0):
+                                rgb = mmu_unit.leds.black_light
+                    else:
+                        rgb = mmu_unit.leds.black_light
+                    set_gate_rgb(rgb, unit, segment, None)
     
-            elif effect == "slicer_color":
+                elif effect == "slicer_color":
 
-                stop_gate_effect(unit, segment, None)
-                rgb = (0,0,0)
-                if self.mmu.gate_selected >= 0 and self.mmu.filament_pos > self.mmu.FILAMENT_POS_UNLOADED:
-                    rgb = self.mmu.slicer_color_rgb[self.mmu.gate_selected]
-                set_gate_rgb(rgb, unit, segment, None)
+                    stop_gate_effect(unit, segment, None)
+                    rgb = (0,0,0)
+                    if self.mmu.gate_selected >= 0 and self.mmu.filament_pos > self.mmu.FILAMENT_POS_UNLOADED:
+                        rgb = self.mmu.slicer_color_rgb[self.mmu.gate_selected]
+                    set_gate_rgb(rgb, unit, segment, None)
     
-            elif isinstance(effect, tuple) or ',' in effect: # RGB color
-                rgb = MmuLeds.string_to_rgb(effect)
-                stop_effect_and_set_gate_rgb(rgb, unit, segment, None)
+                elif isinstance(effect, tuple) or ',' in effect: # RGB color
+                    rgb = MmuLeds.string_to_rgb(effect)
+                    stop_effect_and_set_gate_rgb(rgb, unit, segment, None)
     
-            elif effect != "": # Named effect
-                set_gate_effect(effect, unit, segment, None, fadetime=fadetime)
+                elif effect != "": # Named effect
+                    set_gate_effect(effect, unit, segment, None, fadetime=fadetime)
 
-            self.effect_state.setdefault(unit, {})[segment] = effect
+                self.effect_state.setdefault(unit, {})[segment] = effect
     
-            #
-            # Logo
-            #
-            segment = "logo"
-            effect = get_effective_effect(mmu_unit, segment, effects[segment])
-
-            #if not effect or self.effect_state.get(unit, {}).get(segment) == effect:
-            if not effect:
-                pass
+                #
+                # Logo
+                #
+                segment = "logo"
+                effect = get_effective_effect(mmu_unit, segment, effects.get(segment))
 
-            elif effect == "off":
+                #if not effect or self.effect_state.get(unit, {}).get(segment) == effect:
+                if not effect:
+                    pass
+
+                elif effect == "off":
 
-                stop_effect_and_set_gate_rgb((0,0,0), unit, segment, None, fadetime=fadetime)
+                    stop_effect_and_set_gate_rgb((0,0,0), unit, segment, None, fadetime=fadetime)
 
-            elif isinstance(effect, tuple) or ',' in effect: # RGB color
-                rgb = MmuLeds.string_to_rgb(effect)
-                stop_effect_and_set_gate_rgb(rgb, unit, segment, None)
+                elif isinstance(effect, tuple) or ',' in effect: # RGB color
+                    rgb = MmuLeds.string_to_rgb(effect)
+                    stop_effect_and_set_gate_rgb(rgb, unit, segment, None)
 
-            elif effect != "": # Named effect
+                elif effect != "": # Named effect
 
-                set_gate_effect(effect, unit, segment, None, fadetime=fadetime)
+                    set_gate_effect(effect, unit, segment, None, fadetime=fadetime)
 
-            self.effect_state.setdefault(unit, {})[segment] = effect
+                self.effect_state.setdefault(unit, {})[segment] = effect
 
         except Exception as e:
             # Don't let a misconfiguration ruin a print!
@@ -10,7 +10,19 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 #
-import logging, logging.handlers, threading, os, queue, atexit
+import logging, logging.handlers, threading, os, queue, atexit, re
+
+# Substitutions for numbered color placeholders used in console messages
+COLOR_HTML = (
+    '</span>',                       # {0} COLOR OFF
+    '<span style="color:#C0C0C0">',  # {1} COLOR GREY
+    '<span style="color:#FF69B4">',  # {2} COLOR RED
+    '<span style="color:#90EE90">',  # {3} COLOR GREEN
+    '<span style="color:#87CEEB">',  # {4} COLOR CYAN
+    '<b>',                           # {5} BOLD ON
+    '</b>'                           # {6} BOLD OFF
+)
+COLOR_PLACEHOLDER = re.compile(r'\{\d\}')
 
 class MmuLogger:
     def __init__(self, logfile_path):
@@ -35,6 +47,36 @@ class MmuLogger:
         if self.queue_listener is not None:
             self.queue_listener.stop()
 
+# Caches the color substitution of message templates. Because format args are applied after substitution
+# a template such as "{3}Loaded %.1fmm{0}" is only compiled once no matter how many times it is logged
+class MmuColorCache:
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._cache = {}
+
+    # Return (html, plain) versions of template msg with color placeholders substituted or removed
+    def compile(self, msg):
+        compiled = self._cache.get(msg)
+        if compiled is None:
+            try:
+                html_msg = msg.format(*COLOR_HTML)
+            except (IndexError, KeyError, ValueError):
+                html_msg = msg
+            compiled = (html_msg, COLOR_PLACEHOLDER.sub('', msg)) # Remove numbered placeholders for plain msg
+            if len(self._cache) >= self.max_size:
+                self._cache.clear() # Pre-formatted messages are rarely repeated so don't bother with LRU
+            self._cache[msg] = compiled
+        return compiled
+
+    def color_message(self, msg, args=(), plain_html=False):
+        html_msg, msg = self.compile(msg)
+        if args:
+            msg = msg % args
+            html_msg = msg if plain_html else html_msg % args
+        elif plain_html:
+            html_msg = msg
+        return html_msg, msg
+
 # Poll log queue on background thread and log each message to logfile
 class QueueHandler(logging.Handler):
     def __init__(self, log_queue):
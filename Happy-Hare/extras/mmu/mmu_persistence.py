@@ -0,0 +1,209 @@
+# Happy Hare MMU Software
+# Batched persistence of mmu_vars.cfg
+#
+# Goal: Remove disk I/O from the gcode/reactor thread. Rather than issuing SAVE_VARIABLE (which rewrites
+#       the whole file synchronously) each write request is coalesced over a debounce window, the changed
+#       keys are serialized on the reactor thread and the file is written atomically (temp file, fsync,
+#       rename) on a background thread. flush() forces a synchronous write for shutdown and error paths.
+#       Changed keys must be reported with mark_dirty(). Any other change to the variables (including the
+#       initial load) is only seen by a full compare which happens when 'allVariables' has been replaced.
+#       Synchronous writes made by save_variables itself (SAVE_VARIABLE and, on klipper forks that have them,
+#       internal writers) are wrapped so that they are ordered with the background writes
+#
+# Copyright (C) 2022-2025  moggieuk#6538 (discord)
+#                          moggieuk@hotmail.com
+#
+# (\_/)
+# ( *,*)
+# (")_(") Happy Hare Ready
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+import logging, os, threading
+
+VARIABLES_SECTION = "Variables"
+
+
+class MmuVariablePersistence:
+
+    def __init__(self, mmu, save_variables, write_delay=1.):
+        self.mmu = mmu
+        self.reactor = mmu.reactor
+        self.save_variables = save_variables # Note: 'allVariables' is replaced on every SAVE_VARIABLE so always dereference
+        self.filename = os.path.realpath(save_variables.filename) # Don't replace symlink with file
+        self.write_delay = write_delay
+
+        self._written = None      # {key: repr} of last snapshot handed to writer (None forces full compare)
+        self._variables = None    # 'allVariables' object of last snapshot (replacement forces full compare)
+        self._dirty = set()       # Keys changed since last snapshot
+        self._rescan = False      # Set by writer thread after failed write
+        self._lines = {}          # {key: "key = repr\n"} cache of serialized lines
+        self._seq = 0             # Snapshot sequence number
+        self._written_seq = 0     # Last sequence number on disk
+        self._pending = None      # (seq, text) waiting for writer thread
+        self._stats = {'requests': 0, 'snapshots': 0, 'writes': 0, 'skipped': 0, 'errors': 0}
+
+        self._cond = threading.Condition()
+        self._file_lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._writer, name="mmu_persistence")
+        self._thread.daemon = True
+        self._thread.start()
+
+        self._timer = self.reactor.register_timer(self._snapshot_handler, self.reactor.NEVER)
+        self._timer_armed = False
+
+        # Wrap every synchronous writer of save_variables so that nothing it writes (e.g. from macros) can be
+        # overwritten by an older snapshot. Some forks funnel SAVE_VARIABLE and their own internal writes through
+        # _write_variables() so that is wrapped if present, otherwise the SAVE_VARIABLE command is wrapped
+        if hasattr(save_variables, '_write_variables'):
+            save_variables._write_variables = self._ordered_write(save_variables._write_variables)
+        else:
+            gcode = mmu.printer.lookup_object('gcode')
+            prev_save_variable = gcode.register_command('SAVE_VARIABLE', None)
+            if prev_save_variable is not None:
+                gcode.register_command('SAVE_VARIABLE', self._ordered_write(prev_save_variable), desc=self.cmd_SAVE_VARIABLE_help)
+        if hasattr(save_variables, 'save_variable'):
+            save_variables.save_variable = self._ordered_write(save_variables.save_variable)
+
+    # Record keys that have been changed (or deleted) in 'allVariables'
+    def mark_dirty(self, *names):
+        self._dirty.update(names)
+
+    # Request write of current variables. Called on reactor thread, never blocks on disk
+    def request_write(self):
+        self._stats['requests'] += 1
+        if not self._timer_armed:
+            self._timer_armed = True
+            self.reactor.update_timer(self._timer, self.reactor.monotonic() + self.write_delay)
+
+    # Synchronously write any changes (e.g. shutdown or error handling)
+    def flush(self):
+        self._cancel_timer()
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            self._write(*snapshot)
+
+    def stop(self):
+        self.flush()
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def get_stats(self):
+        return dict(self._stats)
+
+    cmd_SAVE_VARIABLE_help = "Save arbitrary variables to disk"
+
+    # Pending changes are written first and the original writer then writes synchronously under the file lock.
+    # Snapshots queued before it are older than the file so they are discarded
+    def _ordered_write(self, write):
+        def ordered_write(*args, **kwargs):
+            self.flush()
+            with self._file_lock:
+                try:
+                    result = write(*args, **kwargs)
+                except Exception:
+                    self._rescan = True # Unknown file contents so next snapshot writes everything
+                    raise
+                self._seq += 1
+                self._written_seq = self._seq
+                with self._cond:
+                    self._pending = None
+                self._update_lines() # File now matches variables
+            return result
+        return ordered_write
+
+    def _cancel_timer(self):
+        self._timer_armed = False
+        self.reactor.update_timer(self._timer, self.reactor.NEVER)
+
+    def _snapshot_handler(self, eventtime):
+        self._timer_armed = False
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            with self._cond:
+                self._pending = snapshot # Latest snapshot wins
+                self._cond.notify()
+        return self.reactor.NEVER
+
+    # Serialize variables on the calling (reactor) thread because values are mutated there. Returns (seq, text)
+    # or None if nothing changed since last snapshot
+    def _snapshot(self):
+        if not self._update_lines():
+            self._stats['skipped'] += 1
+            return None
+
+        # Replace (rather than mutate) so that save_variables status subscribers see the change
+        self._variables = self.save_variables.allVariables = dict(self.save_variables.allVariables)
+
+        self._seq += 1
+        self._stats['snapshots'] += 1
+        text = "[%s]\n%s\n" % (VARIABLES_SECTION, "".join(self._lines[name] for name in sorted(self._lines)))
+        return self._seq, text
+
+    # Re-serialize dirty keys (or all keys if a full compare is needed). Returns True if anything changed
+    def _update_lines(self):
+        variables = self.save_variables.allVariables
+        dirty, self._dirty = self._dirty, set()
+        changed = self._written is None or self._rescan
+        if changed or variables is not self._variables:
+            self._rescan = False
+            dirty = set(variables) | set(self._written or ())
+            written = dict(self._written or {})
+        else:
+            written = self._written
+
+        for name in dirty:
+            if name in variables:
+                value = repr(variables[name])
+                if written.get(name) != value or name not in self._lines:
+                    written[name] = value
+                    # Match ConfigParser output (option names are lowercased)
+                    self._lines[name] = "%s = %s\n" % (name.lower(), value)
+                    changed = True
+            elif name in written:
+                del written[name]
+                self._lines.pop(name, None)
+                changed = True
+        self._written = written
+        self._variables = variables
+        return changed
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopped:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                seq, text = self._pending
+                self._pending = None
+            self._write(seq, text)
+
+    # Atomic replacement of the variables file. Older snapshots are never written over newer ones
+    def _write(self, seq, text):
+        with self._file_lock:
+            if seq <= self._written_seq:
+                return
+            tmp_file = "%s.tmp" % self.filename
+            try:
+                with open(tmp_file, "w") as f:
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.rename(tmp_file, self.filename)
+                try:
+                    dir_fd = os.open(os.path.dirname(os.path.abspath(self.filename)), os.O_RDONLY)
+                    try:
+                        os.fsync(dir_fd)
+                    finally:
+                        os.close(dir_fd)
+                except OSError:
+                    pass
+                self._written_seq = seq
+                self._stats['writes'] += 1
+            except Exception:
+                self._stats['errors'] += 1
+                self._rescan = True # Force full rewrite next time
+                logging.exception("MMU: Unable to save variables to %s" % self.filename)
@@ -23,6 +23,8 @@ class MmuSensorManager:
         self.all_sensors = {}      # All sensors on mmu unit optionally with unit prefix and gate suffix
         self.sensors = {}          # All (presence detection) sensors on active unit stripped of unit prefix
         self.viewable_sensors = {} # Sensors of all types for current gate/unit renamed with simple names
+        self._status_key = self._status = None
+        self._status_cacheable = False
 
         # Assemble all possible switch sensors in desired display order
         sensor_names = []
@@ -292,9 +294,16 @@ class MmuSensorManager:
     def _get_all_sensors_for_gate(self,  gate):
         return self._get_sensors(-1, gate, lambda p, pc: pc is not None)
 
+    # Rebuilt only when a sensor changed state (MmuRunoutHelper.generation) or the viewable set was replaced.
+    # Sensors without our runout helper can't signal changes so their presence disables the cache
     def get_status(self):
-        result = {
+        if self._status_key is None or self._status_key[1] is not self.viewable_sensors:
+            self._status_cacheable = all(isinstance(s.runout_helper, MmuRunoutHelper) for s in self.viewable_sensors.values())
+        elif self._status_cacheable and self._status_key[0] == MmuRunoutHelper.generation:
+            return self._status
+        self._status_key = (MmuRunoutHelper.generation, self.viewable_sensors)
+        self._status = {
             name: bool(sensor.runout_helper.filament_present) if sensor.runout_helper.sensor_enabled else None
             for name, sensor in self.viewable_sensors.items()
         }
-        return result
+        return self._status
@@ -38,6 +38,20 @@ class MmuSyncFeedbackManager:
     MULTIPLIER_WHEN_GOOD   = 0.005   # Used to move off trigger when tuned rotation distance has been found (0.5%)
     AUTOTUNE_TOLERANCE     = 0.0025  # The desired accuracy of autotuned rotation distance (0.25% or 2.5mm per m)
 
+    # Proportional controller
+    PROPORTIONAL_MIN_INTERVAL = 2.   # Minimum time between rotation distance updates not caused by sensor change (seconds)
+    PROPORTIONAL_DEADBAND  = 0.001   # Ignore rotation distance changes smaller than this (0.1%)
+    PROPORTIONAL_RATE_LIMIT = 0.01   # Maximum change of rotation distance per update (1%)
+    PROPORTIONAL_DEADZONE  = 0.1     # Modelled bias treated as neutral (prevents limit cycling around modelled rd)
+    ESTIMATOR_GAIN         = 1.0     # Fraction of observed drift used to correct modelled rotation distance on sensor change
+    ESTIMATOR_GAIN_SINGLE  = 0.5     # Same for single sensor (trigger and release points are indistinguishable)
+    ESTIMATOR_SETTLED      = 3       # Consecutive corrections within AUTOTUNE_TOLERANCE before modelled rd is considered tuned
+    ESTIMATOR_MARGIN       = 0.1     # Assumed minimum displacement past single sensor trigger point (fraction of range)
+
+    CONTROLLER_CLAMP        = 'clamp'
+    CONTROLLER_PROPORTIONAL = 'proportional'
+    CONTROLLER_OPTIONS      = [CONTROLLER_CLAMP, CONTROLLER_PROPORTIONAL]
+
     SYNC_STATE_NEUTRAL     = 0
     SYNC_STATE_COMPRESSION = 1
     SYNC_STATE_TENSION     = -1
@@ -57,6 +71,7 @@ class MmuSyncFeedbackManager:
         self.sync_multiplier_high = self.mmu.config.getfloat('sync_multiplier_high', 1.05, minval=1., maxval=2.)
         self.sync_multiplier_low = self.mmu.config.getfloat('sync_multiplier_low', 0.95, minval=0.5, maxval=1.)
         self.sync_movement_threshold = self.mmu.config.getfloat('sync_movement_threshold', self.MOVEMENT_THRESHOLD, above=self.SIGNIFICANT_MOVEMENT) # Not yet exposed
+        self.sync_feedback_controller = self.mmu.config.getchoice('sync_feedback_controller', {o: o for o in self.CONTROLLER_OPTIONS}, self.CONTROLLER_CLAMP)
 
         # Setup events for managing motor synchronization
         self.mmu.printer.register_event_handler("mmu:synced", self._handle_mmu_synced)
@@ -73,6 +88,7 @@ class MmuSyncFeedbackManager:
     def reinit(self):
         self.rd_clamps = {}         # Autotune - Array of [slow_rd, current_rd, fast_rd, tuned_rd, original_rd] indexed by gate
         self._reset_extruder_watchdog()
+        self._reset_estimator()
 
     def set_test_config(self, gcmd):
         self.sync_feedback_enabled = gcmd.get_int('SYNC_FEEDBACK_ENABLED', self.sync_feedback_enabled)
@@ -80,6 +96,12 @@ class MmuSyncFeedbackManager:
         self.sync_feedback_buffer_maxrange = gcmd.get_float('SYNC_FEEDBACK_BUFFER_MAXRANGE', self.sync_feedback_buffer_maxrange, minval=0.)
         self.sync_multiplier_high = gcmd.get_float('SYNC_MULTIPLIER_HIGH', self.sync_multiplier_high, minval=1., maxval=2.)
         self.sync_multiplier_low = gcmd.get_float('SYNC_MULTIPLIER_LOW', self.sync_multiplier_low, minval=0.5, maxval=1.)
+        controller = gcmd.get('SYNC_FEEDBACK_CONTROLLER', self.sync_feedback_controller)
+        if controller not in self.CONTROLLER_OPTIONS:
+            raise gcmd.error("sync_feedback_controller must be one of: %s" % ", ".join(self.CONTROLLER_OPTIONS))
+        if controller != self.sync_feedback_controller:
+            self.sync_feedback_controller = controller
+            self._reset_estimator()
 
     def get_test_config(self):
         msg = "\nsync_feedback_enabled = %d" % self.sync_feedback_enabled
@@ -87,6 +109,7 @@ class MmuSyncFeedbackManager:
         msg += "\nsync_feedback_buffer_maxrange = %.1f" % self.sync_feedback_buffer_maxrange
         msg += "\nsync_multiplier_high = %.2f" % self.sync_multiplier_high
         msg += "\nsync_multiplier_low = %.2f" % self.sync_multiplier_low
+        msg += "\nsync_feedback_controller = %s" % self.sync_feedback_controller
         return msg
 
     def check_test_config(self, param):
@@ -107,8 +130,9 @@ class MmuSyncFeedbackManager:
 
             self._reset_extruder_watchdog()
             self._reset_current_sync_state()
+            self._reset_estimator(gate)
             if self.sync_feedback_enabled:
-                self.mmu.log_debug("MmuSyncFeedbackManager: Set initial sync feedback state to: %s" % self.get_sync_feedback_string(detail=True))
+                self.mmu.log_debug("MmuSyncFeedbackManager: Set initial sync feedback state to: %s", self.get_sync_feedback_string(detail=True))
 
             # Set initial rotation distance (may have been previously autotuned)
             if not self._adjust_gear_rotation_distance():
@@ -129,8 +153,14 @@ class MmuSyncFeedbackManager:
     def get_sync_bias_raw(self):
         return float(self.state) # TODO separate sensor_value(float) from state(int)
 
-    def get_sync_bias_modelled(self): # TODO to allow prediction for UI
-        return self.get_sync_bias_raw()
+    # Estimated buffer position (-1.0 tension to 1.0 compression). Only modelled with proportional controller
+    def get_sync_bias_modelled(self):
+        if self.sync_feedback_controller != self.CONTROLLER_PROPORTIONAL or self.estimated_position is None:
+            return self.get_sync_bias_raw()
+        half_range = self._half_range()
+        if half_range <= 0.:
+            return self.get_sync_bias_raw()
+        return round(max(-1., min(1., self.estimated_position / half_range)), 3)
 
     def get_sync_feedback_string(self, state=None, detail=False):
         if state is None:
@@ -155,14 +185,18 @@ class MmuSyncFeedbackManager:
         self.extruder_direction = 0 # Extruder not moving
         self.last_recorded_extruder_position = None
 
+    def _get_extruder_position(self, eventtime):
+        estimated_print_time = self.mmu.printer.lookup_object('mcu').estimated_print_time(eventtime)
+        return self.mmu.toolhead.get_extruder().find_past_position(estimated_print_time)
+
     # Called periodically to check extruder movement
     def _check_extruder_movement(self, eventtime):
         if self.mmu.is_enabled:
-            estimated_print_time = self.mmu.printer.lookup_object('mcu').estimated_print_time(eventtime)
-            extruder = self.mmu.toolhead.get_extruder()
-            pos = extruder.find_past_position(estimated_print_time)
+            pos = self._get_extruder_position(eventtime)
             if self.last_recorded_extruder_position is None:
                 self.last_recorded_extruder_position = pos
+            if self._is_proportional():
+                self._predict_buffer_position(pos) # Before any rotation_distance change
 
             # Have we changed direction?
             if abs(pos - self.last_recorded_extruder_position) >= self.SIGNIFICANT_MOVEMENT:
@@ -181,6 +215,9 @@ class MmuSyncFeedbackManager:
                 self._notify_hit_movement_marker(abs(pos - self.last_recorded_extruder_position))
                 self.last_recorded_extruder_position = pos # Move marker
 
+            if self._is_proportional():
+                self._adjust_gear_rotation_distance(eventtime)
+
         return eventtime + self.FEEDBACK_INTERVAL
 
     # Event indicating that gear stepper is now synced with extruder
@@ -197,6 +234,7 @@ class MmuSyncFeedbackManager:
             self.active = True
             self._reset_extruder_watchdog()
             self._reset_current_sync_state()
+            self._reset_estimator(self.mmu.gate_selected)
             self._adjust_gear_rotation_distance()
             self.mmu.reactor.update_timer(self.extruder_watchdog_timer, self.mmu.reactor.NOW)
 
@@ -223,11 +261,10 @@ class MmuSyncFeedbackManager:
             old_state = self.state
             self.state = float(state)
             self.mmu.log_trace(
-                "MmuSyncFeedbackManager(%s): Got sync force feedback update. State: %s (%s)" % (
-                    "active" if self.sync_feedback_enabled and self.active else "inactive",
-                    self.get_sync_feedback_string(detail=True),
-                    float(state)
-                )
+                "MmuSyncFeedbackManager(%s): Got sync force feedback update. State: %s (%s)",
+                "active" if self.sync_feedback_enabled and self.active else "inactive",
+                self.get_sync_feedback_string(detail=True),
+                float(state)
             )
             self.last_recorded_extruder_position = None # Reset extruder watchdog position
 
@@ -238,7 +275,9 @@ class MmuSyncFeedbackManager:
                     self.mmu.sensor_manager.has_sensor(self.mmu.SENSOR_TENSION) and
                     self.mmu.sensor_manager.has_sensor(self.mmu.SENSOR_COMPRESSION)
                 )
-                if state != old_state and has_dual_sensors and self.mmu.autotune_rotation_distance: # TODO could separate "autotune and save" from just autotune?
+                if self._is_proportional():
+                    self._correct_buffer_position(eventtime, self.state, old_state)
+                elif state != old_state and has_dual_sensors and self.mmu.autotune_rotation_distance: # TODO could separate "autotune and save" from just autotune?
                     self._adjust_clamps(state, old_state)
                 self._adjust_gear_rotation_distance()
         else:
@@ -251,10 +290,9 @@ class MmuSyncFeedbackManager:
     def _notify_direction_change(self, last_direction, new_direction):
         dir_str = lambda d: 'extrude' if d == self.mmu.DIRECTION_LOAD else 'retract' if d == self.mmu.DIRECTION_UNLOAD else 'static'
         self.mmu.log_trace(
-            "MmuSyncFeedbackManager: Sync direction changed from %s to %s" % (
-                dir_str(last_direction),
-                dir_str(new_direction)
-            )
+            "MmuSyncFeedbackManager: Sync direction changed from %s to %s",
+            dir_str(last_direction),
+            dir_str(new_direction)
         )
         self._adjust_gear_rotation_distance()
 
@@ -269,6 +307,7 @@ class MmuSyncFeedbackManager:
 
         # Currently we don't do anything if using fixed multipliers (single sensor case) TODO we could though!
         if not (has_dual_sensors and self.mmu.autotune_rotation_distance): return # TODO could separate "save autotune" from autotune?
+        if self.sync_feedback_controller == self.CONTROLLER_PROPORTIONAL: return # Estimator handles drift continuously
 
         # Report and limit runaway conditions which could occur with bad configuration
         # (like tension/compression sensor reversal or perhaps during a long clog)
@@ -302,12 +341,11 @@ class MmuSyncFeedbackManager:
 
                 if not check_clamp_runaway(rd_clamp):
                     self.mmu.log_trace(
-                        "MmuSyncFeedbackManager: Extruder moved too far in compressed state (%.1fmm). Increased slow_rd clamp value by %.1f%% from %.4f to %.4f" % (
-                            movement,
-                            self.MULTIPLIER_WHEN_STUCK * 100,
-                            old_clamp[0],
-                            rd_clamp[0]
-                        )
+                        "MmuSyncFeedbackManager: Extruder moved too far in compressed state (%.1fmm). Increased slow_rd clamp value by %.1f%% from %.4f to %.4f",
+                        movement,
+                        self.MULTIPLIER_WHEN_STUCK * 100,
+                        old_clamp[0],
+                        rd_clamp[0]
                     )
 
             # Switch to the new slow clamp value (to hopefully move towards tension state)
@@ -323,12 +361,11 @@ class MmuSyncFeedbackManager:
 
                 if not check_clamp_runaway(rd_clamp):
                     self.mmu.log_trace(
-                        "MmuSyncFeedbackManager: Extruder moved too far in tension state (%.1fmm). Decreased fast_rd clamp value by %.1f%% from %.4f to %.4f" % (
-                            movement,
-                            self.MULTIPLIER_WHEN_STUCK * 100,
-                            old_clamp[2],
-                            rd_clamp[2]
-                        )
+                        "MmuSyncFeedbackManager: Extruder moved too far in tension state (%.1fmm). Decreased fast_rd clamp value by %.1f%% from %.4f to %.4f",
+                        movement,
+                        self.MULTIPLIER_WHEN_STUCK * 100,
+                        old_clamp[2],
+                        rd_clamp[2]
                     )
 
             # Switch to the new fast clamp value (to hopefully move towards compressed state)
@@ -373,10 +410,9 @@ class MmuSyncFeedbackManager:
             rd_clamp[2] = rd_clamp[1]
             self.mmu.log_trace(
                 "MmuSyncFeedbackManager: Neutral -> Compressed. Going too fast. "
-                "Adjusted fast_rd clamp (%.4f -> %.4f)" % (
-                    old_clamp[2],
-                    rd_clamp[2]
-                )
+                "Adjusted fast_rd clamp (%.4f -> %.4f)",
+                old_clamp[2],
+                rd_clamp[2]
             )
 
             # If we have good calibration, adjust a little to move off trigger
@@ -385,10 +421,9 @@ class MmuSyncFeedbackManager:
                 rd_clamp[0] *= (1 + self.MULTIPLIER_WHEN_GOOD)
                 self.mmu.log_trace(
                     "MmuSyncFeedbackManager: Have good rotation_distance, adjusting current_rd and slow_rd clamp "
-                    "slightly (%.4f -> %.4f) to move off trigger" % (
-                        old_clamp[0],
-                        rd_clamp[0]
-                    )
+                    "slightly (%.4f -> %.4f) to move off trigger",
+                    old_clamp[0],
+                    rd_clamp[0]
                 )
             rd_clamp[1] = rd_clamp[0]  # Set current rd to slow setting
 
@@ -398,10 +433,9 @@ class MmuSyncFeedbackManager:
             rd_clamp[0] = rd_clamp[1]
             self.mmu.log_trace(
                 "MmuSyncFeedbackManager: Neutral -> Tension. Going too slow. "
-                "Adjusted slow_rd clamp (%.4f -> %.4f)" % (
-                    old_clamp[0],
-                    rd_clamp[0]
-                )
+                "Adjusted slow_rd clamp (%.4f -> %.4f)",
+                old_clamp[0],
+                rd_clamp[0]
             )
 
             # If we have good calibration, adjust a little to move off trigger
@@ -410,10 +444,9 @@ class MmuSyncFeedbackManager:
                 rd_clamp[2] *= (1 - self.MULTIPLIER_WHEN_GOOD)
                 self.mmu.log_trace(
                     "MmuSyncFeedbackManager: Have good rotation_distance, adjusting current_rd and fast_rd clamp "
-                    "slightly (%.4f -> %.4f) to move off trigger" % (
-                        old_clamp[2],
-                        rd_clamp[2]
-                    )
+                    "slightly (%.4f -> %.4f) to move off trigger",
+                    old_clamp[2],
+                    rd_clamp[2]
                 )
             rd_clamp[1] = rd_clamp[2] # Set current rd to fast setting
 
@@ -421,11 +454,10 @@ class MmuSyncFeedbackManager:
             # Test mid point of the clamping range
             rd_clamp[1] = (rd_clamp[0] + rd_clamp[2]) / 2.
             self.mmu.log_trace(
-                "MmuSyncFeedbackManager: %s -> Neutral. Averaging default rotation_distance (%.4f -> %.4f)" % (
-                    self.get_sync_feedback_string(old_state),
-                    old_clamp[1],
-                    rd_clamp[1]
-                )
+                "MmuSyncFeedbackManager: %s -> Neutral. Averaging default rotation_distance (%.4f -> %.4f)",
+                self.get_sync_feedback_string(old_state),
+                old_clamp[1],
+                rd_clamp[1]
             )
             _ = check_if_tuned(rd_clamp)
 
@@ -440,9 +472,12 @@ class MmuSyncFeedbackManager:
 
     # Update gear rotation_distance based on current state. This correctly handles
     # the direction of movement (although it will almost always be neutral or extruding)
-    # Return True if rotation_distance set/reset
-    def _adjust_gear_rotation_distance(self):
+    # Return True if rotation_distance set/reset. With proportional controller 'eventtime' signifies
+    # a periodic (rate limited) update rather than one caused by a sensor or sync change
+    def _adjust_gear_rotation_distance(self, eventtime=None):
         if not self.sync_feedback_enabled or not self.active: return False
+        if self.sync_feedback_controller == self.CONTROLLER_PROPORTIONAL:
+            return self._adjust_gear_rotation_distance_proportional(eventtime)
 
         rd_clamp = self.rd_clamps[self.mmu.gate_selected]
         if self.state == self.SYNC_STATE_NEUTRAL:
@@ -468,22 +503,200 @@ class MmuSyncFeedbackManager:
 
         rd_clamp[1] = start_rd
         self.mmu.log_trace(
-            "MmuSyncFeedbackManager: Adjusted gear rotation_distance: %.4f (slow:%.4f, current: %.4f, fast:%.4f, tuned:%s, initial:%.4f)" % (
-                start_rd,
-                rd_clamp[0],
-                rd_clamp[1],
-                rd_clamp[2],
-                ("%.4f" % rd_clamp[3]) if rd_clamp[3] else "None",
-                rd_clamp[4]
+            "MmuSyncFeedbackManager: Adjusted gear rotation_distance: %.4f (slow:%.4f, current: %.4f, fast:%.4f, tuned:%s, initial:%.4f)",
+            start_rd,
+            rd_clamp[0],
+            rd_clamp[1],
+            rd_clamp[2],
+            ("%.4f" % rd_clamp[3]) if rd_clamp[3] else "None",
+            rd_clamp[4]
+        )
+        self.mmu.set_rotation_distance(start_rd, deferred=True)
+        return True
+
+    #
+    # Proportional controller. Buffer position is estimated continuously from extruder movement and
+    # the modelled (ideal) rotation distance and corrected whenever a sensor changes state. The drift
+    # observed at each correction is used to refine the modelled rotation distance and the gear
+    # rotation distance is set proportionally to the estimated buffer position
+    #
+
+    def _is_proportional(self):
+        return self.sync_feedback_enabled and self.active and self.sync_feedback_controller == self.CONTROLLER_PROPORTIONAL
+
+    def _half_range(self):
+        return (self.sync_feedback_buffer_range or self.sync_feedback_buffer_maxrange) / 2.
+
+    def _reset_estimator(self, gate=None):
+        self.estimated_position = None  # Estimated buffer position limited by sensor state (mm, +ve compression)
+        self.estimator_position = None  # Unlimited model prediction since last correction
+        self.modelled_rd = None         # Rotation distance that would keep buffer stationary
+        self.estimator_extruder_pos = None
+        self.estimator_drift = 0.       # Sum of extruder movement / rotation_distance since last correction
+        self.estimator_settled = 0
+        self.last_rd_update = None
+        if gate is None or gate < 0 or not self.rd_clamps.get(gate):
+            return
+        rd_clamp = self.rd_clamps[gate]
+        self.modelled_rd = rd_clamp[3] or rd_clamp[4]
+        position = self._sensor_position(self.state)
+        self.estimated_position = self.estimator_position = position if position is not None else 0.
+
+    # Buffer position implied by entering sensor state if it represents an exact measurement (proportional
+    # value or switch trigger point), else None. Single sensor trigger point is considered the neutral position.
+    # Leaving a switch is not considered exact because of switch hysteresis
+    def _sensor_position(self, state):
+        half_range = self._half_range()
+        if state not in (self.SYNC_STATE_NEUTRAL, self.SYNC_STATE_COMPRESSION, self.SYNC_STATE_TENSION):
+            return state * half_range # Proportional sensor
+        has_dual_sensors = (
+            self.mmu.sensor_manager.has_sensor(self.mmu.SENSOR_TENSION) and
+            self.mmu.sensor_manager.has_sensor(self.mmu.SENSOR_COMPRESSION)
+        )
+        if not has_dual_sensors:
+            return 0.
+        if state == self.SYNC_STATE_NEUTRAL:
+            return None
+        return state * half_range
+
+    # Integrate buffer movement since last update and limit to range consistent with current sensor state
+    def _predict_buffer_position(self, extruder_pos):
+        if self.modelled_rd is None or self.estimated_position is None:
+            return
+        rd = self.rd_clamps[self.mmu.gate_selected][1]
+        if self.estimator_extruder_pos is not None and rd > 0.:
+            movement = extruder_pos - self.estimator_extruder_pos
+            self.estimator_position += movement * (self.modelled_rd / rd - 1.)
+            self.estimator_drift += movement / rd
+        self.estimator_extruder_pos = extruder_pos
+
+        # Limit to range consistent with sensor state. If the model disagrees with the sensor for a long time
+        # (e.g. sensor still compressed but model predicts tension) the difference is used to correct the model
+        half_range = self._half_range()
+        half_maxrange = max(self.sync_feedback_buffer_maxrange / 2., half_range)
+        edge = self._sensor_position(self.SYNC_STATE_COMPRESSION)
+        inner = edge if edge else self.ESTIMATOR_MARGIN * half_range
+        if self.state == self.SYNC_STATE_COMPRESSION:
+            lo, hi = inner, half_maxrange
+        elif self.state == self.SYNC_STATE_TENSION:
+            lo, hi = -half_maxrange, -inner
+        elif self.state == self.SYNC_STATE_NEUTRAL:
+            lo, hi = -edge, edge
+        else:
+            lo, hi = -half_maxrange, half_maxrange
+        self.estimated_position = max(lo, min(hi, self.estimator_position))
+        if self.estimated_position != self.estimator_position:
+            if self._learn(self.estimated_position - self.estimator_position, edge=False):
+                self.estimator_position = self.estimated_position
+
+    # Sensor changed state. Correct estimated position and learn from the drift since last correction
+    def _correct_buffer_position(self, eventtime, state, old_state):
+        if self.modelled_rd is None:
+            self._reset_estimator(self.mmu.gate_selected)
+            if self.modelled_rd is None:
+                return
+        self._predict_buffer_position(self._get_extruder_position(eventtime))
+        measured = self._sensor_position(state)
+        if measured is None:
+            return
+        if state == old_state and state in (self.SYNC_STATE_COMPRESSION, self.SYNC_STATE_TENSION):
+            return # Not an edge
+
+        self._learn(measured - self.estimator_position)
+        self.estimated_position = self.estimator_position = measured
+        self.estimator_drift = 0.
+
+    # Refine modelled rotation distance from error in estimated position. Position error accumulates
+    # as (error in modelled rd) * sum(movement / rd) so only learn after significant movement. Errors
+    # that are not exact measurements (sensor edges) are only used if stuck in one state for longer
+    # than the movement threshold and don't count towards deciding that the model has settled.
+    # Return True if model was updated
+    def _learn(self, innovation, edge=True):
+        min_movement = self.SIGNIFICANT_MOVEMENT if edge else self.sync_movement_threshold
+        if abs(self.estimator_drift) * self.modelled_rd >= min_movement:
+            rd_clamp = self.rd_clamps[self.mmu.gate_selected]
+            has_dual_sensors = (
+                self.mmu.sensor_manager.has_sensor(self.mmu.SENSOR_TENSION) and
+                self.mmu.sensor_manager.has_sensor(self.mmu.SENSOR_COMPRESSION)
             )
+            gain = self.ESTIMATOR_GAIN if has_dual_sensors else self.ESTIMATOR_GAIN_SINGLE
+            correction = gain * innovation / self.estimator_drift
+            old_rd = self.modelled_rd
+            self.modelled_rd = max(rd_clamp[4] * (1 - self.MULTIPLIER_RUNAWAY), min(rd_clamp[4] * (1 + self.MULTIPLIER_RUNAWAY), old_rd + correction))
+            self.mmu.log_trace(
+                "MmuSyncFeedbackManager: Buffer position error %.2fmm over %.1fmm. Modelled rotation_distance %.4f -> %.4f",
+                innovation,
+                self.estimator_drift * old_rd,
+                old_rd,
+                self.modelled_rd
+            )
+            if edge and self._math_isclose(self.modelled_rd, old_rd, rel_tol=self.AUTOTUNE_TOLERANCE):
+                self.estimator_settled += 1
+                if self.estimator_settled >= self.ESTIMATOR_SETTLED:
+                    self._check_if_modelled_rd_tuned()
+            elif edge:
+                self.estimator_settled = 0
+            self.estimator_drift = 0.
+            return True
+        return False
+
+    def _check_if_modelled_rd_tuned(self):
+        rd_clamp = self.rd_clamps[self.mmu.gate_selected]
+        if rd_clamp[3] and self._math_isclose(self.modelled_rd, rd_clamp[3], rel_tol=self.AUTOTUNE_TOLERANCE):
+            return
+        rd_clamp[3] = self.modelled_rd
+        self.mmu.log_always(
+            "MmuSyncFeedbackManager: New autotuned rotation_distance for gate %d: %.4f" % (
+                self.mmu.gate_selected,
+                rd_clamp[3]
+            )
+        )
+        if self.mmu.autotune_rotation_distance:
+            self.mmu.save_rotation_distance(self.mmu.gate_selected, rd_clamp[3])
+
+    # Set rotation distance proportional to estimated buffer position. Periodic updates (eventtime supplied)
+    # are rate limited and small changes ignored to minimize stepper updates
+    def _adjust_gear_rotation_distance_proportional(self, eventtime=None):
+        rd_clamp = self.rd_clamps[self.mmu.gate_selected]
+        if self.modelled_rd is None:
+            self._reset_estimator(self.mmu.gate_selected)
+
+        bias = self.get_sync_bias_modelled()
+        if abs(bias) < self.PROPORTIONAL_DEADZONE:
+            bias = 0.
+        elif self.extruder_direction == self.mmu.DIRECTION_UNLOAD:
+            bias = -bias # Compressed when retracting means gear must go faster
+        if bias >= 0:
+            multiplier = 1. + bias * (self.sync_multiplier_high - 1.)
+        else:
+            multiplier = 1. + bias * (1. - self.sync_multiplier_low)
+        new_rd = self.modelled_rd * multiplier
+        current_rd = rd_clamp[1]
+
+        if self._math_isclose(new_rd, current_rd, rel_tol=self.PROPORTIONAL_DEADBAND):
+            return False
+        if eventtime is not None:
+            if self.last_rd_update is not None and eventtime - self.last_rd_update < self.PROPORTIONAL_MIN_INTERVAL:
+                return False
+            new_rd = max(current_rd * (1 - self.PROPORTIONAL_RATE_LIMIT), min(current_rd * (1 + self.PROPORTIONAL_RATE_LIMIT), new_rd))
+            self.last_rd_update = eventtime
+
+        rd_clamp[1] = new_rd
+        self.mmu.log_trace(
+            "MmuSyncFeedbackManager: Proportional gear rotation_distance: %.4f (modelled: %.4f, bias: %.2f, tuned:%s, initial:%.4f)",
+            new_rd,
+            self.modelled_rd,
+            bias,
+            ("%.4f" % rd_clamp[3]) if rd_clamp[3] else "None",
+            rd_clamp[4]
         )
-        self.mmu.set_rotation_distance(start_rd)
+        self.mmu.set_rotation_distance(new_rd, deferred=True)
         return True
 
     # Reset rotation_distance to calibrated value of current gate (not necessarily current value if autotuning)
     def _reset_gear_rotation_distance(self):
         rd = self.mmu.get_rotation_distance(self.mmu.gate_selected)
-        self.mmu.log_trace("MmuSyncFeedbackManager: Reset rotation distance to last calibrated value (%.4f)" % rd)
+        self.mmu.log_trace("MmuSyncFeedbackManager: Reset rotation distance to last calibrated value (%.4f)", rd)
         self.mmu.set_rotation_distance(rd)
 
         # This is mostly for optics because value will be reset on next sync() event
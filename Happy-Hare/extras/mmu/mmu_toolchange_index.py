@@ -0,0 +1,142 @@
+# Happy Hare MMU Software
+# Reader for the tool change index written alongside gcode files by the moonraker file preprocessor
+#
+# Goal: Allow cheap lookup of upcoming tool changes from the current virtual_sdcard file position
+#       without rescanning the gcode file. The index is a small binary sidecar file of fixed size
+#       records sorted by byte offset so it can be binary searched in place (mmap) and loaded lazily
+#
+# This module is the only definition of the index layout. It has no klipper dependencies so the
+# moonraker file preprocessor (components/mmu_server.py) loads it to write the index. Any change to
+# the layout must bump TOOLCHANGE_INDEX_VERSION so that old index files are ignored
+#
+# Copyright (C) 2022-2025  moggieuk#6538 (discord)
+#                          moggieuk@hotmail.com
+#
+# (\_/)
+# ( *,*)
+# (")_(") Happy Hare Ready
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+import os, struct, mmap, math
+
+TOOLCHANGE_INDEX_SUFFIX = ".mmu_tc_index"
+TOOLCHANGE_INDEX_MAGIC = b"MMTI"
+TOOLCHANGE_INDEX_VERSION = 1
+TOOLCHANGE_INDEX_HEADER = struct.Struct("<4sHHQdI")  # magic, version, record size, gcode size, gcode mtime, count
+TOOLCHANGE_INDEX_RECORD = struct.Struct("<QIhhfff")  # offset, line, from_tool, to_tool, next_x, next_y, extruded
+
+
+# Hidden sidecar alongside gcode file so it isn't listed by moonraker
+def toolchange_index_file(gcode_file):
+    directory, fname = os.path.split(gcode_file)
+    return os.path.join(directory, "." + fname + TOOLCHANGE_INDEX_SUFFIX)
+
+# Write index of tool change records (tuples in TOOLCHANGE_INDEX_RECORD order) sorted by byte offset. The
+# header records the gcode size and mtime so a stale index is never used
+def write_toolchange_index(gcode_file, records):
+    index_file = toolchange_index_file(gcode_file)
+    stat = os.stat(gcode_file)
+    tmp_file = index_file + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(TOOLCHANGE_INDEX_HEADER.pack(TOOLCHANGE_INDEX_MAGIC, TOOLCHANGE_INDEX_VERSION, TOOLCHANGE_INDEX_RECORD.size,
+                                             stat.st_size, stat.st_mtime, len(records)))
+        for record in records:
+            f.write(TOOLCHANGE_INDEX_RECORD.pack(*record))
+    os.replace(tmp_file, index_file)
+
+# Read all records (tuples) of index file without checking it against gcode file. Returns None if the
+# index is missing or not of this version
+def read_toolchange_index(index_file):
+    try:
+        with open(index_file, 'rb') as f:
+            data = f.read()
+    except (OSError, IOError):
+        return None
+    if len(data) < TOOLCHANGE_INDEX_HEADER.size:
+        return None
+    magic, version, record_size, _, _, count = TOOLCHANGE_INDEX_HEADER.unpack_from(data, 0)
+    if (magic != TOOLCHANGE_INDEX_MAGIC or version != TOOLCHANGE_INDEX_VERSION or record_size != TOOLCHANGE_INDEX_RECORD.size or
+            len(data) < TOOLCHANGE_INDEX_HEADER.size + count * record_size):
+        return None
+    return [TOOLCHANGE_INDEX_RECORD.unpack_from(data, TOOLCHANGE_INDEX_HEADER.size + i * record_size) for i in range(count)]
+
+
+class MmuToolchangeIndex:
+
+    def __init__(self, gcode_file):
+        self.gcode_file = gcode_file
+        self.index_file = toolchange_index_file(gcode_file)
+        self._loaded = False
+        self._mm = None
+        self._count = 0
+
+    # Lazily map the index on first use. Missing, corrupt or stale (gcode changed) index is treated as empty
+    def _load(self):
+        self._loaded = True
+        try:
+            stat = os.stat(self.gcode_file)
+            with open(self.index_file, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < TOOLCHANGE_INDEX_HEADER.size:
+                    return
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, IOError, ValueError):
+            return
+        magic, version, record_size, gcode_size, gcode_mtime, count = TOOLCHANGE_INDEX_HEADER.unpack_from(mm, 0)
+        if (magic != TOOLCHANGE_INDEX_MAGIC or version != TOOLCHANGE_INDEX_VERSION or record_size != TOOLCHANGE_INDEX_RECORD.size or
+                gcode_size != stat.st_size or gcode_mtime != stat.st_mtime or
+                size < TOOLCHANGE_INDEX_HEADER.size + count * record_size):
+            mm.close()
+            return
+        self._mm = mm
+        self._count = count
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = None
+        self._count = 0
+        self._loaded = False
+
+    def is_valid(self):
+        if not self._loaded:
+            self._load()
+        return self._mm is not None
+
+    def __len__(self):
+        if not self._loaded:
+            self._load()
+        return self._count
+
+    def _record(self, i):
+        offset, line, from_tool, to_tool, next_x, next_y, extruded = TOOLCHANGE_INDEX_RECORD.unpack_from(
+            self._mm, TOOLCHANGE_INDEX_HEADER.size + i * TOOLCHANGE_INDEX_RECORD.size)
+        next_pos = None if math.isnan(next_x) or math.isnan(next_y) else (round(next_x, 3), round(next_y, 3))
+        return {
+            'offset': offset,
+            'line': line,
+            'from_tool': from_tool,
+            'to_tool': to_tool,
+            'next_pos': next_pos,
+            'extruded': round(extruded, 2),
+        }
+
+    def _offset(self, i):
+        return struct.unpack_from("<Q", self._mm, TOOLCHANGE_INDEX_HEADER.size + i * TOOLCHANGE_INDEX_RECORD.size)[0]
+
+    # Index of first tool change at or after file_position (binary search)
+    def bisect(self, file_position):
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._offset(mid) < file_position:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # Return list of the next 'count' tool changes (dicts) at or after file_position
+    def upcoming(self, file_position, count=1):
+        start = self.bisect(file_position)
+        return [self._record(i) for i in range(start, min(start + count, self._count))]
@@ -15,13 +15,127 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 #
-import logging, time
+import logging, time, math
+from array import array
 
 # Klipper imports
+import chelper
 from . import pulse_counter
 
+
+# Fixed size ring buffer of (print_time, encoder_counts, extruder_pos) samples. Windowed flow rate, slip
+# ratio and jitter are maintained incrementally: every sample stores its interval deltas (encoder counts,
+# absolute extruder movement) and running sums of the last 'window' intervals are updated on push/evict.
+# Sums are kept in counts (not mm) so a change of encoder resolution does not invalidate them
+class EncoderTelemetry:
+
+    def __init__(self, size, window):
+        self.size = size
+        self.window = max(1, min(window, size - 1))
+        self.print_times = array('d', [0.]) * size
+        self.counts = array('d', [0.]) * size
+        self.extruder_pos = array('d', [0.]) * size
+        self._enc = array('d', [0.]) * size # Encoder counts moved in interval ending at sample
+        self._ext = array('d', [0.]) * size # Extruder movement (mm, absolute) in interval ending at sample
+        self.reset()
+
+    def reset(self):
+        self.head = 0      # Slot of next sample
+        self.length = 0    # Valid samples in ring
+        self.total = 0     # Samples ever recorded (since reset)
+        self._rebase = True
+        self._sum_enc = self._sum_ext = 0.
+        self._sum_ext2 = self._sum_enc2 = self._sum_encext = 0.
+
+    # Next sample starts a new baseline (e.g. encoder counts were reset)
+    def rebase(self):
+        self._rebase = True
+
+    def last_print_time(self):
+        return self.print_times[(self.head - 1) % self.size] if self.length else 0.
+
+    def last_extruder_pos(self):
+        return self.extruder_pos[(self.head - 1) % self.size] if self.length else 0.
+
+    def last_counts(self):
+        return self.counts[(self.head - 1) % self.size] if self.length else 0.
+
+    def push(self, print_time, counts, extruder_pos):
+        i = self.head
+        if self._rebase or not self.length:
+            enc = ext = 0.
+            self._rebase = False
+        else:
+            prev = (i - 1) % self.size
+            enc = max(counts - self.counts[prev], 0.)
+            ext = abs(extruder_pos - self.extruder_pos[prev]) # Encoder can't tell direction
+        self.print_times[i] = print_time
+        self.counts[i] = counts
+        self.extruder_pos[i] = extruder_pos
+        self._enc[i] = enc
+        self._ext[i] = ext
+        self._add(enc, ext, 1.)
+        if self.total >= self.window:
+            j = (i - self.window) % self.size
+            self._add(self._enc[j], self._ext[j], -1.)
+        self.head = (i + 1) % self.size
+        self.length = min(self.length + 1, self.size)
+        self.total += 1
+        if self.head == 0:
+            self._resum() # Bound floating point drift (amortized O(1))
+
+    def _add(self, enc, ext, sign):
+        self._sum_enc += sign * enc
+        self._sum_ext += sign * ext
+        self._sum_enc2 += sign * enc * enc
+        self._sum_ext2 += sign * ext * ext
+        self._sum_encext += sign * enc * ext
+
+    def _resum(self):
+        self._sum_enc = self._sum_ext = 0.
+        self._sum_ext2 = self._sum_enc2 = self._sum_encext = 0.
+        for n in range(1, self.window_length() + 1):
+            j = (self.head - n) % self.size
+            self._add(self._enc[j], self._ext[j], 1.)
+
+    def window_length(self):
+        return min(self.total, self.window)
+
+    # Encoder / extruder movement over window (None if extruder hasn't moved)
+    def flow_rate(self, resolution):
+        if self._sum_ext <= 0.:
+            return None
+        return self._sum_enc * resolution / self._sum_ext
+
+    # Fraction of extruder movement not seen by the encoder over window
+    def slip_ratio(self, resolution):
+        flow = self.flow_rate(resolution)
+        return 0. if flow is None else 1. - flow
+
+    # Standard deviation (mm) of per-sample difference between extruder and encoder movement over window
+    def jitter(self, resolution):
+        n = self.window_length()
+        if n < 2:
+            return 0.
+        mean = (self._sum_ext - resolution * self._sum_enc) / n
+        mean_sq = (self._sum_ext2 - 2. * resolution * self._sum_encext + resolution * resolution * self._sum_enc2) / n
+        return math.sqrt(max(mean_sq - mean * mean, 0.))
+
+    # Most recent 'count' samples (oldest first)
+    def get_samples(self, count=None):
+        count = self.length if count is None else min(count, self.length)
+        samples = []
+        for n in range(count, 0, -1):
+            j = (self.head - n) % self.size
+            samples.append((self.print_times[j], int(self.counts[j]), self.extruder_pos[j]))
+        return samples
+
+
 class MmuEncoder:
-    CHECK_MOVEMENT_TIMEOUT = 0.250
+    CHECK_MOVEMENT_TIMEOUT = 0.250 # Poll interval used if extruder motion cannot be predicted
+    MIN_CHECK_INTERVAL = 0.050
+    MAX_CHECK_INTERVAL = 0.500     # Longest sleep when no extrusion is queued (new moves appear as they are flushed)
+    TRAPQ_MOVES = 256              # Extruder moves examined (covers MAX_CHECK_INTERVAL of short segments)
 
     RUNOUT_DISABLED = 0
     RUNOUT_STATIC = 1
@@ -41,6 +155,7 @@ class MmuEncoder:
         self.set_resolution(config.getfloat('encoder_resolution', 1., above=0.)) # Must be calibrated by user in Happy Hare
         self._last_time = None
         self._counts = self._last_count = 0
+        self._last_sample = None # (count_time, counts) published by counter callback for telemetry
         self._counter = pulse_counter.MCU_counter(self.printer, encoder_pin, self.sample_time, self.poll_time)
         self._counter.setup_callback(self._counter_callback)
         self._movement = False
@@ -55,6 +170,8 @@ class MmuEncoder:
         self.next_calibration_point = self.calibration_length = config.getfloat('calibration_length', 10000., minval=50.) # 10m
         # Detection length will be set by MMU calibration
         self.detection_length = self.min_headroom = config.getfloat('detection_length', 10., above=2.)
+        # Extruder movement between clog/runout checks (limited by headroom so runout is detected on time)
+        self.check_distance = config.getfloat('check_distance', 1., above=0.) # Not exposed
         self.event_delay = config.getfloat('event_delay', 2., above=0.)
         self.pause_delay = config.getfloat('pause_delay', 0, above=0.)
         self.runout_gcode = '__MMU_ENCODER_RUNOUT'
@@ -62,15 +179,20 @@ class MmuEncoder:
         self._enabled = True # Runout/Clog functionality
         self.min_event_systime = self.reactor.NEVER
         self.extruder = self.estimated_print_time = None
+        self._trapq_moves = None
         self.filament_detected = False
         self.detection_mode = self.RUNOUT_STATIC
         self.last_extruder_pos = self.filament_runout_pos = 0.
 
         # For flowrate functionality
-        self.flowrate_last_encoder_pos = 0.
         self.extrusion_flowrate = 0.
-        self.samples = []
         self.flowrate_samples = config.getint('flowrate_samples', 20, minval=5)
+        self.telemetry_samples = config.getint('telemetry_samples', 1024, minval=self.flowrate_samples + 1) # Not exposed
+        self.telemetry = EncoderTelemetry(self.telemetry_samples, self.flowrate_samples)
+        self._status_inputs = self._status = None
+
+        self.gcode.register_mux_command('_MMU_DUMP_ENCODER', 'ENCODER', self.name,
+                                        self.cmd_DUMP_ENCODER, desc=self.cmd_DUMP_ENCODER_help)
 
         # Register event handlers
         self.printer.register_event_handler('klippy:ready', self._handle_ready)
@@ -108,7 +230,65 @@ class MmuEncoder:
         else:
             return 0.
 
-    # Called periodically to check filament movement
+    # Fastest possible extruder movement (mm/s) within klipper limits or None if not known
+    def _get_peak_e_velocity(self):
+        try:
+            max_velocity = self.printer.lookup_object('toolhead').get_max_velocity()[0]
+            return max(self.extruder.max_e_velocity, max_velocity * self.extruder.max_extrude_ratio)
+        except Exception:
+            return None
+
+    # Predict when the extruder will next have moved 'distance' mm from the queued (already flushed) moves
+    # in the extruder trapq. Travel moves and pauses have no extruder moves so the check sleeps through them.
+    # Sleep is limited so that no more than 'headroom' can be extruded at peak flow before next check
+    def _next_check_time(self, eventtime, extruder_pos, distance, headroom):
+        try:
+            trapq = self.extruder.get_trapq() if self.extruder else None
+        except Exception:
+            trapq = None
+        if trapq is None:
+            return eventtime + self.CHECK_MOVEMENT_TIMEOUT
+        print_time = self.estimated_print_time(eventtime)
+        ffi_main, ffi_lib = chelper.get_ffi()
+        if self._trapq_moves is None:
+            self._trapq_moves = ffi_main.new('struct pull_move[%d]' % self.TRAPQ_MOVES)
+        moves = self._trapq_moves
+        # History is newest first so limit to moves that can influence this check else buffer fills with the
+        # furthest moves and those close to print_time are missed
+        end_time = print_time + self.MAX_CHECK_INTERVAL
+        count = ffi_lib.trapq_extract_old(trapq, moves, self.TRAPQ_MOVES, print_time, end_time)
+        while count == self.TRAPQ_MOVES and moves[count - 1].print_time > print_time:
+            # Still too many moves to see all of them. Closest moves matter so step back through window
+            count = ffi_lib.trapq_extract_old(trapq, moves, self.TRAPQ_MOVES, print_time, moves[count - 1].print_time)
+        target = extruder_pos + distance
+        wake_time = None
+        for i in range(count - 1, -1, -1):
+            m = moves[i]
+            t0 = max(print_time - m.print_time, 0.)
+            v = m.start_v * m.x_r
+            a = m.accel * m.x_r
+            if m.start_x + (v + .5 * a * m.move_t) * m.move_t < target:
+                continue
+            d = target - m.start_x
+            if abs(a) < 1e-9:
+                t = d / v if v > 0. else 0.
+            else:
+                t = (-v + math.sqrt(max(v * v + 2. * a * d, 0.))) / a
+            wake_time = m.print_time + max(t, t0)
+            break
+        if wake_time is None:
+            # Target not reached by known moves so wake at end of known moves to look again
+            wake_time = moves[0].print_time + moves[0].move_t if count else print_time
+            if wake_time <= print_time:
+                wake_time = end_time
+        max_interval = self.MAX_CHECK_INTERVAL
+        peak_velocity = self._get_peak_e_velocity()
+        if peak_velocity and headroom > 0.:
+            max_interval = min(max_interval, headroom / peak_velocity)
+        return eventtime + max(min(wake_time - print_time, max_interval), self.MIN_CHECK_INTERVAL)
+
+    # Called to check filament movement. Next check is scheduled for when extruder will have moved
+    # 'check_distance' (or the remaining headroom if less)
     def _extruder_pos_update_event(self, eventtime):
         if self._enabled:
             extruder_pos = self._get_extruder_pos(eventtime)
@@ -131,23 +311,25 @@ class MmuEncoder:
                         self._logger("Warning: Only %.1fmm of headroom to clog/runout" % self.min_headroom)
             self._handle_filament_event(extruder_pos < self.filament_runout_pos)
 
-            # Flowrate calc. Depends of calibration accuracy of encoder
-            encoder_pos = self.get_distance()
-            # If encoder has moved, record the extruder and encoder movement for flow rate calcs
-            if encoder_pos > self.flowrate_last_encoder_pos:
-                self._record(encoder_pos, extruder_pos)
-                self.flowrate_last_encoder_pos = encoder_pos
+            # Record telemetry here rather than in counter callback (which runs on serial thread). Extruder
+            # movement is recorded even without encoder counts so that lack of flow is visible. Sample is
+            # taken at time of last counter report so that encoder counts and extruder position agree
+            sample = self._last_sample
+            if sample is not None and (sample[1] != self.telemetry.last_counts() or extruder_pos != self.telemetry.last_extruder_pos()):
+                self._record(sample[0], sample[1], self.extruder.find_past_position(sample[0]) if self.extruder else 0.)
 
             self.last_extruder_pos = extruder_pos
-        return eventtime + self.CHECK_MOVEMENT_TIMEOUT
+            headroom = self.filament_runout_pos - extruder_pos
+            distance = min(self.check_distance, headroom) if headroom > 0. else self.check_distance
+            return self._next_check_time(eventtime, extruder_pos, distance, headroom)
+        return eventtime + self.MAX_CHECK_INTERVAL
 
     def _reset_filament_runout_params(self, eventtime=None):
         if eventtime is None:
             eventtime = self.reactor.monotonic()
         self.last_extruder_pos = self._get_extruder_pos(eventtime)
-        self.flowrate_last_encoder_pos = self.get_distance()
         self.extrusion_flowrate = 0.
-        self.samples = []
+        self.telemetry.reset()
         self.filament_runout_pos = self.last_extruder_pos + self.detection_length + self.desired_headroom # Add headroom to decrease sensitivity on startup
         self.next_calibration_point = self.last_extruder_pos + self.calibration_length
         self.min_headroom = self.detection_length
@@ -255,16 +437,17 @@ class MmuEncoder:
     def is_enabled(self):
         return self._enabled
 
-    def _record(self, encoder_pos, extruder_pos):
-        self.samples.append((encoder_pos, extruder_pos))
-        if len(self.samples) > self.flowrate_samples:
-            self.samples = self.samples[-self.flowrate_samples:]
-        encoder_movement = encoder_pos - self.samples[0][0]
-        extruder_movement = extruder_pos - self.samples[0][1]
-        new_extrusion_flowrate = (encoder_movement / extruder_movement) if extruder_movement > 0. else 1.
-        self.extrusion_flowrate = (self.extrusion_flowrate + new_extrusion_flowrate) / 2.
-
-    # Callback for MCU_counter
+    # Record telemetry sample. Flowrate calc depends on calibration accuracy of encoder
+    def _record(self, print_time, counts, extruder_pos):
+        if self.telemetry.length and print_time <= self.telemetry.last_print_time():
+            return # Counts/position are cumulative so nothing is lost by skipping out of order sample
+        self.telemetry.push(print_time, counts, extruder_pos)
+        flowrate = self.telemetry.flow_rate(self.resolution)
+        if flowrate is not None:
+            self.extrusion_flowrate = flowrate
+
+    # Callback for MCU_counter. Runs on serial thread so only counters are updated here, telemetry is
+    # recorded from reactor timer
     def _counter_callback(self, print_time, count, count_time):
         if self._last_time is None:  # First sample
             self._last_time = print_time
@@ -273,6 +456,7 @@ class MmuEncoder:
             new_counts = count - self._last_count
             self._counts += new_counts
             self._movement = new_counts > 0
+            self._last_sample = (count_time, self._counts) # Single assignment so reader sees consistent pair
         else:  # No counts since last sample
             self._last_time = print_time
         self._last_count = count
@@ -291,12 +475,23 @@ class MmuEncoder:
 
     def set_distance(self, new_distance):
         self._counts = int(round(new_distance / self.resolution))
+        self._last_sample = None
+        self.telemetry.rebase()
 
     def reset_counts(self):
         self._counts = 0
+        self._last_sample = None
+        self.telemetry.rebase()
 
+    # Status is only rebuilt when one of its inputs has changed (telemetry.total acts as generation of the windowed
+    # statistics) so the same object is returned while idle and consumers can short circuit on identity
     def get_status(self, eventtime):
-        return {
+        inputs = (self._counts, self.resolution, self.detection_length, self.min_headroom, self.filament_runout_pos, self.last_extruder_pos,
+                  self.desired_headroom, self.detection_mode, self._enabled, self.extrusion_flowrate, self.telemetry.total)
+        if inputs == self._status_inputs:
+            return self._status
+        self._status_inputs = inputs
+        self._status = {
                 'encoder_pos': round(self.get_distance(), 1),
                 'detection_length': round(self.detection_length, 1),
                 'min_headroom': round(self.min_headroom, 1),
@@ -304,8 +499,26 @@ class MmuEncoder:
                 'desired_headroom': round(self.desired_headroom, 1),
                 'detection_mode': self.detection_mode,
                 'enabled': self._enabled,
-                'flow_rate': int(round(min(self.extrusion_flowrate, 1.) * 100))
+                'flow_rate': int(round(min(self.extrusion_flowrate, 1.) * 100)),
+                'slip_ratio': round(self.telemetry.slip_ratio(self.resolution), 3),
+                'jitter': round(self.telemetry.jitter(self.resolution), 2),
+                'telemetry_samples': self.telemetry.window_length(),
         }
+        return self._status
+
+    cmd_DUMP_ENCODER_help = "Dump encoder telemetry samples and windowed flow statistics"
+    def cmd_DUMP_ENCODER(self, gcmd):
+        count = gcmd.get_int('SAMPLES', self.telemetry.window + 1, minval=1, maxval=self.telemetry.size)
+        flowrate = self.telemetry.flow_rate(self.resolution)
+        msg = "Encoder telemetry: %d samples recorded, window %d/%d" % (self.telemetry.total, self.telemetry.window_length(), self.telemetry.window)
+        msg += "\nFlow rate: %s, slip ratio: %.3f, jitter: %.2fmm" % (
+            "%.1f%%" % (flowrate * 100.) if flowrate is not None else "n/a",
+            self.telemetry.slip_ratio(self.resolution), self.telemetry.jitter(self.resolution))
+        msg += "\nprint_time, counts, encoder_pos, extruder_pos"
+        for print_time, counts, extruder_pos in self.telemetry.get_samples(count):
+            msg += "\n%.3f, %d, %.1f, %.2f" % (print_time, counts, counts * self.resolution, extruder_pos)
+        logging.info("MMU: %s" % msg)
+        gcmd.respond_info(msg)
 
 def load_config_prefix(config):
     return MmuEncoder(config)
@@ -227,8 +227,7 @@ class MmuESpooler:
     def set_operation(self, gate, value, operation):
         from .mmu import Mmu # For operation names
 
-        if self.mmu.log_enabled(Mmu.LOG_TRACE):
-            self.mmu.log_trace("ESPOOLER: set_operation(gate=%s, value=%s, operation=%s)" % (gate, value, operation))
+        self.mmu.log_trace("ESPOOLER: set_operation(gate=%s, value=%s, operation=%s)", gate, value, operation)
 
         # Turn off assist for all gates except specified gate if still wanted
         for g in range(self.first_gate, self.first_gate + self.num_gates):
@@ -243,16 +242,14 @@ class MmuESpooler:
                     self.enable_burst_trigger(g, False)
                 if self.extruder_monitor:
                     self.extruder_monitor.watch(False)
-                if self.mmu.log_enabled(Mmu.LOG_TRACE):
-                    self.mmu.log_trace("ESPOOLER: In-print assist for gate %d canceled" % g)
+                self.mmu.log_trace("ESPOOLER: In-print assist for gate %d canceled", g)
 
         if gate is not None and gate >= 0:
-            self.mmu.log_debug("Espooler for gate %d set to %s (pwm: %.2f)" % (gate, operation, value))
+            self.mmu.log_debug("Espooler for gate %d set to %s (pwm: %.2f)", gate, operation, value)
             self._update(gate, value, operation)
 
             if operation == Mmu.ESPOOLER_PRINT and value == 0:
-                if self.mmu.log_enabled(Mmu.LOG_TRACE):
-                    self.mmu.log_trace("ESPOOLER: Entering in-print assist mode for gate %d" % gate)
+                self.mmu.log_trace("ESPOOLER: Entering in-print assist mode for gate %d", gate)
 
                 # Enable appropriate trigger
                 if self.mmu.espooler_assist_burst_trigger:
@@ -267,15 +264,13 @@ class MmuESpooler:
     def _update(self, gate, value, operation):
         from .mmu import Mmu # For operation names
 
-        if self.mmu.log_enabled(Mmu.LOG_STEPPER):
-            self.mmu.log_stepper("ESPOOLER: _update(%s, %s, %s)" % (gate, value, operation))
+        self.mmu.log_stepper("ESPOOLER: _update(%s, %s, %s)", gate, value, operation)
 
         def _schedule_set_pin(name, value):
             mcu_pin = self.motor_mcu_pins.get(name, None)
             if mcu_pin:
                 estimated_print_time = mcu_pin.get_mcu().estimated_print_time(self.printer.reactor.monotonic())
-                if self.mmu.log_enabled(Mmu.LOG_STEPPER):
-                    self.mmu.log_stepper("ESPOOLER: --> _schedule_set_pin(name=%s, value=%s) @ print_time: %.8f" % (name, value, estimated_print_time))
+                self.mmu.log_stepper("ESPOOLER: --> _schedule_set_pin(name=%s, value=%s) @ print_time: %.8f", name, value, estimated_print_time)
                 self.gcrqs[mcu_pin.get_mcu()].send_async_request((name, value))
 
         if operation == Mmu.ESPOOLER_OFF:
@@ -307,15 +302,12 @@ class MmuESpooler:
 
     # This is the actual callback method to update pin signal (pwm or digital)
     def _set_pin(self, print_time, action):
-        from .mmu import Mmu # For operation names
-
         name, value = action
         mcu_pin = self.motor_mcu_pins.get(name, None)
         if mcu_pin:
             if value == self.last_value.get(name, None):
                 return
-            if self.mmu.log_enabled(Mmu.LOG_STEPPER):
-                self.mmu.log_stepper("ESPOOLER: -----> _set_pin(name=%s, value=%s) @ print_time: %.8f" % (name, value, print_time))
+            self.mmu.log_stepper("ESPOOLER: -----> _set_pin(name=%s, value=%s) @ print_time: %.8f", name, value, print_time)
             if self.is_pwm and not name.startswith('enable_'):
                 mcu_pin.set_pwm(print_time, value)
             else:
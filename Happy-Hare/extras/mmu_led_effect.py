@@ -12,7 +12,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 #
-import logging
+import logging, contextlib
 
 # Klipper imports
 from .mmu_leds import MmuLeds
@@ -128,7 +128,17 @@ def load_config_prefix(config):
 # This file may be distributed under the terms of the GNU GPLv3 license.
 
 from math import cos, exp, pi
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
 from random import randint
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 ANALOG_SAMPLE_TIME  = 0.001
 ANALOG_SAMPLE_COUNT = 5
@@ -136,6 +146,179 @@ ANALOG_REPORT_TIME  = 0.05
 
 COLORS = 4
 
+FRAME_TABLE_MAX_SIZE = 65536 # Max floats in precomputed (blended) frame table of periodic effect
+
+######################################################################
+# Frame buffers and whole buffer blending (Happy Hare). Frames are kept
+# in preallocated flat float32 buffers (numpy if available, otherwise
+# array('f')). Blend functions write result into the bottom buffer
+######################################################################
+
+def _newFrame(size):
+    if numpy is not None:
+        return numpy.zeros(size, dtype=numpy.float32)
+    return array('f', [0.0]) * size
+
+def _func(method):
+    return getattr(method, '__func__', method)
+
+# Convert layer frame (list) to buffer of exactly 'size' elements (short frames are zero padded)
+def _toFrame(data, size):
+    if numpy is not None:
+        frame = numpy.asarray(data, dtype=numpy.float32)
+        if len(frame) != size:
+            frame = numpy.resize(frame, size) if len(frame) > size else \
+                numpy.concatenate((frame, numpy.zeros(size - len(frame), dtype=numpy.float32)))
+        return frame
+    if len(data) != size:
+        data = list(data[:size]) + [0.0] * (size - len(data))
+    return data
+
+if numpy is not None:
+    def _divide(n, d, out):
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            numpy.copyto(out, numpy.where(d > 0, n / numpy.where(d > 0, d, 1.), 0.))
+
+    def _overlay(t, b):
+        numpy.copyto(b, numpy.where(t > 0.5, 2.0 * t * b, 1.0 - (2.0 * (1.0-t) * (1.0-b))))
+
+    def _difference(t, b):
+        numpy.subtract(t, b, out=b)
+        numpy.absolute(b, out=b)
+
+    def _subtract(t, b):
+        numpy.subtract(b, t, out=b)
+        numpy.maximum(b, 0., out=b)
+
+    def _subtract_b(t, b):
+        numpy.subtract(t, b, out=b)
+        numpy.maximum(b, 0., out=b)
+
+    def _average(t, b):
+        numpy.add(t, b, out=b)
+        numpy.multiply(b, 0.5, out=b)
+
+    def _screen(t, b):
+        numpy.copyto(b, 1.0 - (1.0-t)*(1.0-b))
+
+    BLENDING_MODES = {
+        'top'       : (lambda t, b: numpy.copyto(b, t)),
+        'bottom'    : (lambda t, b: None),
+        'add'       : (lambda t, b: numpy.add(t, b, out=b)),
+        'subtract'  : _subtract,
+        'subtract_b': _subtract_b,
+        'difference': _difference,
+        'average'   : _average,
+        'multiply'  : (lambda t, b: numpy.multiply(t, b, out=b)),
+        'divide'    : (lambda t, b: _divide(t, b, b)),
+        'divide_inv': (lambda t, b: _divide(b, t, b)),
+        'screen'    : _screen,
+        'lighten'   : (lambda t, b: numpy.maximum(t, b, out=b)),
+        'darken'    : (lambda t, b: numpy.minimum(t, b, out=b)),
+        'overlay'   : _overlay,
+    }
+
+    # Apply fade and clamp to 0..1 in one pass
+    def _fadeClamp(frame, fade, out):
+        numpy.multiply(frame, fade, out=out)
+        numpy.clip(out, 0., 1., out=out)
+
+    def _clearFrame(frame):
+        frame.fill(0.)
+
+    def _sameFrame(a, b):
+        return numpy.array_equal(a, b)
+
+    def _ledMap(positions, indices):
+        return numpy.array(positions, dtype=numpy.intp), numpy.array(indices, dtype=numpy.intp)
+
+    # Per chain composite is (summed colors, mask of LEDs touched by an updating effect)
+    def _newComposite(chain):
+        count = chain.led_helper.led_count
+        return numpy.zeros((count, COLORS), dtype=numpy.float32), numpy.zeros(count, dtype=bool)
+
+    def _accumulate(composite, frame, positions, indices):
+        sums, touched = composite
+        sums[indices] += frame.reshape(-1, COLORS)[positions]
+        touched[indices] = True
+
+    # Write composite to chain. Returns True only if the LED state actually changed
+    def _applyComposite(chain, composite):
+        sums, touched = composite
+        numpy.minimum(sums, 1., out=sums)
+        state = chain.led_helper.led_state
+        changed = numpy.flatnonzero(touched & (sums != numpy.array(state, dtype=numpy.float32)).any(axis=1))
+        if not len(changed):
+            return False
+        state = list(state)
+        for i in changed.tolist():
+            state[i] = tuple(sums[i].tolist())
+        chain.led_helper.led_state = state
+        return True
+
+else:
+    def _assign(b, values):
+        b[:] = array('f', values)
+
+    BLENDING_MODES = {
+        'top'       : (lambda t, b: _assign(b, t)),
+        'bottom'    : (lambda t, b: None),
+        'add'       : (lambda t, b: _assign(b, [x + y for x, y in zip(t, b)])),
+        'subtract'  : (lambda t, b: _assign(b, [y - x if y > x else 0. for x, y in zip(t, b)])),
+        'subtract_b': (lambda t, b: _assign(b, [x - y if x > y else 0. for x, y in zip(t, b)])),
+        'difference': (lambda t, b: _assign(b, [x - y if x > y else y - x for x, y in zip(t, b)])),
+        'average'   : (lambda t, b: _assign(b, [0.5 * (x + y) for x, y in zip(t, b)])),
+        'multiply'  : (lambda t, b: _assign(b, [x * y for x, y in zip(t, b)])),
+        'divide'    : (lambda t, b: _assign(b, [x / y if y > 0 else 0. for x, y in zip(t, b)])),
+        'divide_inv': (lambda t, b: _assign(b, [y / x if x > 0 else 0. for x, y in zip(t, b)])),
+        'screen'    : (lambda t, b: _assign(b, [1.0 - (1.0-x)*(1.0-y) for x, y in zip(t, b)])),
+        'lighten'   : (lambda t, b: _assign(b, [x if x > y else y for x, y in zip(t, b)])),
+        'darken'    : (lambda t, b: _assign(b, [x if x < y else y for x, y in zip(t, b)])),
+        'overlay'   : (lambda t, b: _assign(b, [2.0 * x * y if x > 0.5 else 1.0 - (2.0 * (1.0-x) * (1.0-y)) for x, y in zip(t, b)])),
+    }
+
+    # Apply fade and clamp to 0..1 in one pass
+    def _fadeClamp(frame, fade, out):
+        out[:] = array('f', [0. if x < 0. else 1. if x > 1. else x for x in (c * fade for c in frame)])
+
+    def _clearFrame(frame):
+        frame[:] = array('f', [0.0]) * len(frame)
+
+    def _sameFrame(a, b):
+        return a == b
+
+    def _ledMap(positions, indices):
+        return positions, indices
+
+    # Per chain composite is {led index: summed color} of LEDs touched by an updating effect
+    def _newComposite(chain):
+        return {}
+
+    def _accumulate(composite, frame, positions, indices):
+        for p, i in zip(positions, indices):
+            o = p * COLORS
+            c = composite.get(i)
+            if c is None:
+                composite[i] = list(frame[o:o+COLORS])
+            else:
+                for k in range(COLORS):
+                    c[k] += frame[o+k]
+
+    # Write composite to chain. Returns True only if the LED state actually changed
+    def _applyComposite(chain, composite):
+        state = chain.led_helper.led_state
+        new_state = None
+        for i, c in composite.items():
+            color = tuple([x if x < 1.0 else 1.0 for x in c])
+            if state[i] != color:
+                if new_state is None:
+                    new_state = list(state)
+                new_state[i] = color
+        if new_state is None:
+            return False
+        chain.led_helper.led_state = new_state
+        return True
+
 ######################################################################
 # Custom color value list, returns lists of [r, g ,b] values
 # from a one dimensional list
@@ -203,6 +386,9 @@ class ledFrameHandler:
         self.printer.register_event_handler("homing:homing_move_end",
                                             self._handle_homing_move_end)
         self.ledChains=[]
+        self.frameTimer = None
+        self.effectsByName = {}
+        self.batchChains = None # Chains awaiting transmit when batching updates
         self.gcode.register_command('_MMU_STOP_LED_EFFECTS',
                                     self.cmd_STOP_LED_EFFECTS,
                                     desc=self.cmd_STOP_LED_EFFECTS_help)
@@ -283,6 +469,7 @@ class ledFrameHandler:
                                                 self.reactor.NOW)
 
         self.effects.append(effect)
+        self.effectsByName[effect.name] = effect
 
     def _pollHeater(self, eventtime):
         for heater in self.heaters.keys():
@@ -315,44 +502,56 @@ class ledFrameHandler:
             self.printProgress = int(p * 100)
         return eventtime + 1
 
-    def _getColorData(self, colors, fade):
-        clamp = (lambda x : 0.0 if x < 0.0 else 1.0 if x > 1.0 else x)
-        colors = [x*clamp(fade) for x in colors]
-        colors=colors + [0.0] * (4 - len(colors))
-        colors=colors[:4]
-        colors = [clamp(x) for x in colors]
-        return tuple(colors)
+    # Immediately update frames and reschedule the (possibly idle) frame timer
+    def updateFrames(self):
+        if self.frameTimer is not None:
+            next_eventtime = self._getFrames(self.reactor.monotonic())
+            self.reactor.update_timer(self.frameTimer, next_eventtime)
 
     def _getFrames(self, eventtime):
         chainsToUpdate = set()
 
         frames = [(effect, effect.getFrame(eventtime)) for effect in self.effects]
 
-        #first set all LEDs to 0, that should be updated
+        # Only chains with an effect whose frame has changed need to be composited
+        changedChains = set()
         for effect, (frame, update) in frames:
-            if update:
-                for i in range(effect.ledCount):
-                    chain,index=effect.leds[i]
-                    chain.led_helper.led_state[index] = (0.0, 0.0, 0.0, 0.0)
-                    chainsToUpdate.add(chain)
+            if update and effect.frameChanged:
+                changedChains.update(effect.ledChains)
 
-        #then sum up all effects for that LEDs
+        # Sum up all updating effects (already faded and clamped) for their LEDs. LEDs
+        # not driven by an updating effect are left untouched
+        composites = {}
         for effect, (frame, update) in frames:
             if update:
-                for i in range(effect.ledCount):
-                    chain,index=effect.leds[i]
-                    
-                    current_state=list(chain.led_helper.led_state[index])
-                    effect_state=self._getColorData(frame[i*COLORS:i*COLORS+COLORS], 
-                                                    effect.fadeValue)
-
-                    next_state=[min(1.0,a+b) for a,b in \
-                                 zip(current_state, effect_state)]
-
-                    chain.led_helper.led_state[index] = tuple(next_state)
-                    chainsToUpdate.add(chain)
+                for chain, positions, indices in effect.chainLeds:
+                    if chain not in changedChains:
+                        continue
+                    composite = composites.get(chain)
+                    if composite is None:
+                        composite = composites[chain] = _newComposite(chain)
+                    _accumulate(composite, frame, positions, indices)
+
+        # Only chains whose LED state has actually changed need transmitting
+        for chain, composite in composites.items():
+            if _applyComposite(chain, composite):
+                chainsToUpdate.add(chain)
+
+        if self.batchChains is not None:
+            self.batchChains.update(chainsToUpdate)
+        else:
+            self._transmit(chainsToUpdate)
 
-        for chain in chainsToUpdate:
+        # Sleep until next animated frame is due (or forever if all effects are idle or static)
+        if self.effects:
+            next_eventtime=min(self.effects, key=lambda x: x.nextEventTime)\
+                            .nextEventTime
+        else:
+            next_eventtime = self.reactor.NEVER
+        return next_eventtime
+    
+    def _transmit(self, chains):
+        for chain in chains:
             if hasattr(chain,"prev_data"):
                 chain.prev_data = None # workaround to force update of dotstars
             if not self.shutdown: 
@@ -361,15 +560,49 @@ class ledFrameHandler:
                     chain.led_helper._check_transmit() # New klipper
                 else:
                     chain.led_helper.check_transmit(None)  # Older klipper / Kalico
-        if self.effects:
-            next_eventtime=min(self.effects, key=lambda x: x.nextEventTime)\
-                            .nextEventTime
-        else:
-            next_eventtime = eventtime
-        # run at least with 10Hz
-        next_eventtime=min(next_eventtime, eventtime + 0.1) 
-        return next_eventtime
-    
+
+    ######################################################################
+    # Programmatic API (Happy Hare). Alternative to _MMU_SET_LED_EFFECT and
+    # _MMU_STOP_LED_EFFECTS that avoids synthesizing and parsing gcode
+    ######################################################################
+
+    # Group many effect (and direct LED) changes so each chain is transmitted once.
+    # Yields set that callers can add any other changed chains to
+    @contextlib.contextmanager
+    def batch(self):
+        if self.batchChains is not None:
+            yield self.batchChains # Nested
+            return
+        self.batchChains = set()
+        try:
+            yield self.batchChains
+        finally:
+            chains, self.batchChains = self.batchChains, None
+            self._transmit(chains)
+
+    def lookupEffect(self, name):
+        return self.effectsByName.get(name)
+
+    # Start effect by name. Returns False if the effect doesn't exist
+    def setEffect(self, name, fadetime=0.0, replace=False, restart=False):
+        effect = self.lookupEffect(name)
+        if effect is None:
+            return False
+        effect.start(fadetime, replace=replace, restart=restart)
+        return True
+
+    # Stop all effects on the chain (or just those using specific 0-based led indices)
+    def stopEffects(self, chain=None, indices=None, fadetime=0.0):
+        for effect in self.effects:
+            if chain is None:
+                stopEffect = True
+            elif not indices:
+                stopEffect = chain in effect.ledChains
+            else:
+                stopEffect = any((chain, index) in effect.leds for index in indices)
+            if stopEffect:
+                effect.stop(fadetime)
+
     def parse_chain(self, chain):
         chain = chain.strip()
         leds=[]
@@ -419,9 +652,7 @@ class ledFrameHandler:
                             stopEffect=True
 
             if stopEffect:
-                if effect.enabled:
-                    effect.set_fade_time(gcmd.get_float('FADETIME', 0.0))
-                effect.set_enabled(False)
+                effect.stop(gcmd.get_float('FADETIME', 0.0))
 
 def load_config(config):
     return ledFrameHandler(config)
@@ -447,26 +678,11 @@ class _ledEffect:
         self.fadeValue    = 0.0
         self.fadeTime     = 0.0
         self.fadeEndTime  = 0
+        self.frameChanged = False
+        self.frameTable   = None
 
-        #Basic functions for layering colors. t=top and b=bottom color
-        self.blendingModes  = {
-            'top'       : (lambda t, b: t ),
-            'bottom'    : (lambda t, b: b ),
-            'add'       : (lambda t, b: t + b ),
-            'subtract'  : (lambda t, b: (b - t) * (b - t > 0)),
-            'subtract_b': (lambda t, b: (t - b) * (t - b > 0)),
-            'difference': (lambda t, b: (t - b) * (t > b) + (b - t) * (t <= b)),
-            'average'   : (lambda t, b: 0.5 * (t + b)),
-            'multiply'  : (lambda t, b: t * b),
-            'divide'    : (lambda t, b: t / b if b > 0 else 0 ),
-            'divide_inv': (lambda t, b: b / t if t > 0 else 0 ),
-            'screen'    : (lambda t, b: 1.0 - (1.0-t)*(1.0-b) ),
-            'lighten'   : (lambda t, b: t * (t > b) +  b * (t <= b)),
-            'darken'    : (lambda t, b: t * (t < b) +  b * (t >= b)),
-            'overlay'   : (lambda t, b: \
-                                2.0 * t * b if t > 0.5 else \
-                                1.0 - (2.0 * (1.0-t) * (1.0-b)))
-           }
+        #Whole buffer functions for layering colors. t=top and b=bottom frame
+        self.blendingModes  = BLENDING_MODES
 
         self.name         = config.get_name().split()[1]
 
@@ -529,7 +745,20 @@ class _ledEffect:
                         self.leds.append((ledChain, led))
 
         self.ledCount = len(self.leds)
-        self.frame = [0.0] * COLORS * self.ledCount
+        self.frameSize = COLORS * self.ledCount
+        self.frame = _newFrame(self.frameSize)  # Blended layers
+        self.outputs = (_newFrame(self.frameSize), _newFrame(self.frameSize))
+        self.output = self.outputs[0]           # Faded and clamped frame
+        self.source = None                      # Periodic table frame that 'output' was built from
+        self.sourceFade = None
+
+        #map the effect "pixels" onto the LEDs of each chain
+        chainLeds = {}
+        for pos, (chain, index) in enumerate(self.leds):
+            positions, indices = chainLeds.setdefault(chain, ([], []))
+            positions.append(pos)
+            indices.append(index)
+        self.chainLeds = [(chain,) + _ledMap(*chainLeds[chain]) for chain in self.ledChains]
 
         #enumerate all effects from the subclasses of _layerBase...
         self.availableLayers = {str(c).rpartition('.layer')[2]\
@@ -592,48 +821,140 @@ class _ledEffect:
                                         ledCount      = len(self.leds),
                                         blendingMode  = parms[3]))
 
+        self._buildFrameTable()
         self.handler.addEffect(self)
 
+    # Effects built only from layers that cycle through precomputed frames are periodic. The
+    # blended frames for one full period are built up front so each tick is just a lookup and
+    # runs of identical frames (e.g. static effects) are skipped rather than recalculated
+    def _buildFrameTable(self):
+        self.frameTable = None
+        self.tick = 0
+        if not self.layers or not all(layer.isPeriodic() for layer in self.layers):
+            return
+
+        period = 1
+        for layer in self.layers:
+            count = max(1, layer.frameCount)
+            period = period * count // gcd(period, count)
+            if period * self.frameSize > FRAME_TABLE_MAX_SIZE:
+                return
+
+        # Tick 'n' corresponds to the n+1'th call of nextFrame() on each layer
+        table = []
+        for n in range(period):
+            frame = _newFrame(self.frameSize)
+            for layer in self.layers:
+                self.blendingModes[layer.blendingMode](layer.periodicFrame(n + 1, self.frameSize), frame)
+            if table and _sameFrame(frame, table[-1]):
+                frame = table[-1]
+            table.append(frame)
+        last = table[-1]
+        for i in range(len(table) - 1, 0, -1):
+            if table[i] is not last or not _sameFrame(last, table[0]):
+                break
+            table[i] = table[0]
+
+        # Number of ticks each frame is held (None if the effect is static)
+        holds = [None] * period
+        changes = [i for i in range(period) if table[i] is not table[(i + 1) % period]]
+        if changes:
+            k = changes[0]
+            holds[k] = 1
+            for m in range(1, period):
+                i, j = (k - m) % period, (k - m + 1) % period
+                holds[i] = holds[j] + 1 if table[i] is table[j] else 1
+
+        clamped = {}
+        for frame in table:
+            if id(frame) not in clamped:
+                clamped[id(frame)] = _newFrame(self.frameSize)
+                _fadeClamp(frame, 1.0, clamped[id(frame)])
+        self.frameTable = table
+        self.frameHolds = holds
+        self.clampedTable = [clamped[id(frame)] for frame in table]
+
     def getFrame(self, eventtime):
+        self.frameChanged = False
         if not self.enabled and self.fadeValue <= 0.0:
             if self.nextEventTime < self.handler.reactor.NEVER:
                 # Effect has just been disabled. Set colors to 0 and update once.
                 self.nextEventTime = self.handler.reactor.NEVER
-                self.frame = [0.0] * COLORS * self.ledCount
+                _clearFrame(self.frame)
+                self.output = self.outputs[0]
+                _clearFrame(self.output)
+                self.source = None
+                self.frameChanged = True
                 update = True
             else:
                 update = False
         else:
             update = True
             if eventtime >= self.nextEventTime:
-                self.nextEventTime = eventtime + self.frameRate
-
-                self.frame = [0.0] * COLORS * self.ledCount
-                for layer in self.layers:
-                    layerFrame = layer.nextFrame(eventtime)
-
-                    if layerFrame:
-                        blend = self.blendingModes[layer.blendingMode]
-                        self.frame = [blend(t, b) for t, b in zip(layerFrame, self.frame)]
-
-                if (self.fadeEndTime > eventtime) and (self.fadeTime > 0.0):
+                fading = (self.fadeEndTime > eventtime) and (self.fadeTime > 0.0)
+                if fading:
                     remainingFade = ((self.fadeEndTime - eventtime) / self.fadeTime)
                 else:
                     remainingFade = 0.0    
 
                 self.fadeValue = 1.0-remainingFade if self.enabled else remainingFade
+                fade = min(1.0, max(0.0, self.fadeValue))
+                output = self.outputs[1] if self.output is self.outputs[0] else self.outputs[0]
+
+                if self.frameTable is not None:
+                    # Periodic effect. Hold the frame for as long as it (and fade) doesn't change
+                    idx = self.tick % len(self.frameTable)
+                    frame = self.frameTable[idx]
+                    hold = 1 if fading else self.frameHolds[idx]
+                    if hold is None:
+                        self.nextEventTime = self.handler.reactor.NEVER
+                        self.tick += 1
+                    else:
+                        self.nextEventTime = eventtime + hold * self.frameRate
+                        self.tick += hold
+                    if frame is not self.source or fade != self.sourceFade:
+                        self.source, self.sourceFade = frame, fade
+                        if fade == 1.0:
+                            self.output = self.clampedTable[idx]
+                        else:
+                            _fadeClamp(frame, fade, output)
+                            self.output = output
+                        self.frameChanged = True
+                else:
+                    self.nextEventTime = eventtime + self.frameRate
+
+                    frame = self.frame
+                    _clearFrame(frame)
+                    for layer in self.layers:
+                        layerFrame = layer.nextFrame(eventtime)
+
+                        if len(layerFrame):
+                            blend = self.blendingModes[layer.blendingMode]
+                            blend(_toFrame(layerFrame, self.frameSize), frame)
 
-        return self.frame, update
+                    _fadeClamp(frame, fade, output)
+                    self.frameChanged = not _sameFrame(output, self.output)
+                    self.output = output
+
+        return self.output, update
 
     def set_enabled(self, state):
         if self.enabled != state:
             self.enabled = state
-            self.nextEventTime = self.handler.reactor.NOW
-            self.handler._getFrames(self.handler.reactor.NOW)
+            self._refresh()
+
+    # Force recalculation of frame and wake the (possibly idle) frame handler
+    def _refresh(self):
+        self.nextEventTime = self.handler.reactor.NOW
+        self.source = None
+        self.handler.updateFrames()
     
     def reset_frame(self):
         for layer in self.layers:
             layer.frameNumber = 0
+        self.tick = 0
+        if self.enabled:
+            self._refresh()
 
     def set_fade_time(self, fadetime):
         self.fadeTime = fadetime
@@ -641,32 +962,40 @@ class _ledEffect:
         if self.fadeTime == 0.0:
             self.fadeValue = 0.0
 
+    def start(self, fadetime=0.0, replace=False, restart=False):
+        if replace:
+            for led in self.leds:
+                for effect in self.handler.effects:
+                    if effect is not self and led in effect.leds:
+                        effect.stop(fadetime)
+
+        if not self.enabled:
+            self.set_fade_time(fadetime)
+        if restart:
+            self.reset_frame()
+        self.set_enabled(True)
+
+    def stop(self, fadetime=0.0):
+        if self.enabled:
+            self.set_fade_time(fadetime)
+        self.set_enabled(False)
+
     def cmd_SET_LED_EFFECT(self, gcmd):
         parmFadeTime = gcmd.get_float('FADETIME', 0.0)
 
         if gcmd.get_int('STOP', 0) >= 1:
-            if self.enabled:
-                self.set_fade_time(parmFadeTime)
-            self.set_enabled(False)
+            self.stop(parmFadeTime)
         else:
             if self.recalculate:
                 kwargs = self.layerTempl.create_template_context()
                 kwargs['params'] = gcmd.get_command_parameters()
                 kwargs['rawparams'] = gcmd.get_raw_command_parameters()
                 self._generateLayers(kwargs)
-            if gcmd.get_int('REPLACE',0) >= 1:
-                for led in self.leds:
-                    for effect in self.handler.effects:
-                        if effect is not self and led in effect.leds:
-                            if effect.enabled:
-                                effect.set_fade_time(parmFadeTime)
-                            effect.set_enabled(False)
-
-            if not self.enabled:
-                self.set_fade_time(parmFadeTime)
-            if gcmd.get_int('RESTART', 0) >= 1:
-                self.reset_frame()
-            self.set_enabled(True)
+                if self.enabled:
+                    self._refresh()
+            self.start(parmFadeTime,
+                       replace=gcmd.get_int('REPLACE',0) >= 1,
+                       restart=gcmd.get_int('RESTART', 0) >= 1)
 
     def _handle_shutdown(self):
         self.set_enabled(self.runOnShutown)
@@ -698,6 +1027,19 @@ class _ledEffect:
             self.thisFrame       = []
             self.frameCount      = 1
             self.lastAnalog      = 0
+            self.frameTable      = None
+
+        # Layers that just cycle through precomputed 'thisFrame' are periodic
+        def isPeriodic(self):
+            return _func(type(self).nextFrame) is _func(_ledEffect._layerBase.nextFrame)
+
+        # Frame buffer returned by the n'th call to nextFrame() of a periodic layer
+        def periodicFrame(self, n, size):
+            if not self.frameCount:
+                return _newFrame(size)
+            if self.frameTable is None:
+                self.frameTable = [_toFrame(f, size) for f in self.thisFrame]
+            return self.frameTable[n % self.frameCount]
 
         def nextFrame(self, eventtime):
             if not self.frameCount:
@@ -50,12 +50,21 @@ class VirtualMmuLedChain:
         for color, (chain, led) in zip(led_state, self.leds):
             chain.led_helper.led_state[led] = color
             chains_to_update.add(chain)
-        for chain in chains_to_update:
-            chain.led_helper.need_transmit = True
-            if hasattr(chain.led_helper, '_check_transmit'):
-                chain.led_helper._check_transmit() # New klipper
-            else:
-                chain.led_helper.check_transmit(None)  # Older klipper / Kalico
+        transmit_led_chains(chains_to_update)
+
+    # Programmatic alternative to SET_LED. Set many leds ({0-based index: (r,g,b[,w])}) in one call.
+    # Returns the set of chains needing transmit (this chain if changed). These are transmitted now
+    # unless transmit=False in which case the caller is responsible for calling transmit_led_chains()
+    def set_leds(self, colors, transmit=True):
+        led_state = list(self.led_helper.led_state) # Replace so webhooks sees the change
+        for index, color in colors.items():
+            led_state[index] = tuple(color[:4]) + (0.,) * (4 - len(color))
+        if led_state == self.led_helper.led_state:
+            return set()
+        self.led_helper.led_state = led_state
+        if transmit:
+            transmit_led_chains([self])
+        return set([self])
 
     def get_status(self, eventtime=None):
         state = []
@@ -68,6 +77,15 @@ class VirtualMmuLedChain:
         return {"color_data": state}
 
 
+def transmit_led_chains(chains):
+    for chain in chains:
+        chain.led_helper.need_transmit = True
+        if hasattr(chain.led_helper, '_check_transmit'):
+            chain.led_helper._check_transmit() # New klipper
+        else:
+            chain.led_helper.check_transmit(None)  # Older klipper / Kalico
+
+
 class MmuLeds:
 
     PER_GATE_SEGMENTS = ['exit', 'entry']
@@ -80,6 +98,7 @@ class MmuLeds:
         self.name = config.get_name().split()[-1]
         self.printer = config.get_printer()
         self.frame_rate = config.getint('frame_rate', 24)
+        self.update_interval = config.getfloat('update_interval', 0.1, minval=0.) # Min time between led updates (coalesced)
 
         # Create virtual led chains
         self.virtual_chains = {}
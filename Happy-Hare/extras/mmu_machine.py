@@ -656,7 +656,7 @@ class MmuToolHead(toolhead.ToolHead, object):
             for th in ths:
                 th.flush_step_generation()
 
-        self.mmu.log_stepper("_quiesce_align_get_tcut(full=%s, wait=%s) Elapsed:%.6f" % (full, wait, time.time() - start))
+        self.mmu.log_stepper("_quiesce_align_get_tcut(full=%s, wait=%s) Elapsed:%.6f", full, wait, time.time() - start)
         return t_future + EPS
 
     def is_synced(self):
@@ -694,7 +694,7 @@ class MmuToolHead(toolhead.ToolHead, object):
             if tq is not None and tq != ffi_main.NULL:
                 self.trapq_finalize_moves(tq, t, t - MOVE_HISTORY_EXPIRE)
 
-        self.mmu.log_stepper("resync(%s --> %s)" % (self.sync_mode_to_string(self.sync_mode), self.sync_mode_to_string(new_sync_mode)))
+        self.mmu.log_stepper("resync(%s --> %s)", self.sync_mode_to_string(self.sync_mode), self.sync_mode_to_string(new_sync_mode))
 
         # ---------------- Phase A: FENCE if messing with extruder -----------
 
@@ -715,7 +715,7 @@ class MmuToolHead(toolhead.ToolHead, object):
 
             # ---------------- Phase B: UNSYNC current mode at t0 ----------------
 
-            self.mmu.log_stepper("unsync(%s)" % ("mode=gear_only" if new_sync_mode == self.GEAR_ONLY  else ""))
+            self.mmu.log_stepper("unsync(%s)", "mode=gear_only" if new_sync_mode == self.GEAR_ONLY  else "")
 
             # Figure out who is CURRENTLY driving (old owner) and who will receive (new owner)
             if self.sync_mode in [self.EXTRUDER_SYNCED_TO_GEAR, self.EXTRUDER_ONLY_ON_GEAR]:
@@ -788,7 +788,7 @@ class MmuToolHead(toolhead.ToolHead, object):
 
         # ---------------- Phase C: SYNC into new mode at t1 -----------------
 
-        self.mmu.log_stepper("sync(mode=%d %s)" % (new_sync_mode, ("gear+extruder" if new_sync_mode == self.EXTRUDER_SYNCED_TO_GEAR  else "extruder" if new_sync_mode == self.EXTRUDER_ONLY_ON_GEAR else "extruder+gear")))
+        self.mmu.log_stepper("sync(mode=%d %s)", new_sync_mode, ("gear+extruder" if new_sync_mode == self.EXTRUDER_SYNCED_TO_GEAR  else "extruder" if new_sync_mode == self.EXTRUDER_ONLY_ON_GEAR else "extruder+gear"))
 
         t1 = t0 + EPS  # Later fence for the second cut over (t1 = t0 + EPS)
 
@@ -46,6 +46,10 @@ RUNOUT_GCODE = "__MMU_SENSOR_RUNOUT"
 # Enhanced "runout helper" that gives greater control of when filament sensor events are fired and
 # direct access to button events in addition to creating a "remove" / "runout" distinction
 class MmuRunoutHelper:
+
+    # Bumped whenever presence or enabled state of any sensor changes so status can be cached (see MmuSensorManager)
+    generation = 0
+
     def __init__(self, printer, name, event_delay, insert_gcode, remove_gcode, runout_gcode, insert_remove_in_print, button_handler, switch_pin):
 
         self.printer, self.name = printer, name
@@ -58,8 +62,8 @@ class MmuRunoutHelper:
 
         self.min_event_systime = self.reactor.NEVER
         self.event_delay = event_delay # Time between generated events
-        self.filament_present = False
-        self.sensor_enabled = True
+        self._filament_present = False
+        self._sensor_enabled = True
         self.runout_suspended = None
         self.button_handler_suspended = False
 
@@ -74,6 +78,26 @@ class MmuRunoutHelper:
         _, prev_values = prev
         prev_values[self.name] = self.cmd_SET_FILAMENT_SENSOR
 
+    @property
+    def filament_present(self):
+        return self._filament_present
+
+    @filament_present.setter
+    def filament_present(self, value):
+        if value != self._filament_present:
+            MmuRunoutHelper.generation += 1
+        self._filament_present = value
+
+    @property
+    def sensor_enabled(self):
+        return self._sensor_enabled
+
+    @sensor_enabled.setter
+    def sensor_enabled(self, value):
+        if value != self._sensor_enabled:
+            MmuRunoutHelper.generation += 1
+        self._sensor_enabled = value
+
     def _handle_ready(self):
         self.min_event_systime = self.reactor.monotonic() + 2. # Time to wait before first events are processed
 
@@ -1433,7 +1433,12 @@ uninstall_update_manager() {
                 /\[mmu_server\]/,+1 d; \
                 /enable_file_preprocessor/ d; \
                 /enable_toolchange_next_pos/ d; \
+                /enable_parallel_preprocessor/ d; \
+                /preprocess_workers/ d; \
                 /update_spoolman_location/ d; \
+                /spoolman_incremental_sync/ d; \
+                /spoolman_page_size/ d; \
+                /spoolman_max_concurrency/ d; \
                     " > "${file}.new" && mv "${file}.new" "${file}"
             restart=1
         fi
@@ -1,8 +1,18 @@
 import os
+import json
 import shutil
+import tempfile
+import threading
+import http.server
+import urllib.error
+import urllib.parse
+import urllib.request
+import importlib.util
+import asyncio
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
+from components import mmu_server
 from components.mmu_server import MmuServer
 
 class TestMmuServerFileProcessor(unittest.TestCase):
@@ -86,3 +96,611 @@ class TestMmuServerFileProcessor(unittest.TestCase):
         self.subject._write_mmu_metadata(self.TOOLCHANGE_FILEPATH)
 
         self.subject._inject_tool_usage.assert_not_called()
+
+
+class TestMmuServerPreprocessor(unittest.TestCase):
+    HEADER = "; generated by PrusaSlicer 2.7.1+linux-x64-GTK3 on 2024-01-01 at 00:00:00 UTC\n"
+    START = "PRINT_START MMU_TOOLS_USED=!referenced_tools! TOOLCHANGES=!total_toolchanges! COLORS=!colors! TEMPS=!temperatures!\n"
+    CONFIG = [
+        "; extruder_colour = #FF0000;#00FF00;;#0000FF\n",
+        "; filament_colour = #111111;#222222;#333333;#444444\n",
+        "; filament_type = PLA;PETG;ABS;PLA\n",
+        "; temperature = 210,230,240,215\n",
+        "; start_gcode = PRINT_START MMU_TOOLS_USED=!referenced_tools!\n",
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.tmp_dir.name, 'in.gcode')
+        self.output = os.path.join(self.tmp_dir.name, 'out.gcode')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write_input(self, toolchanges=20, body_padding=0):
+        with open(self.input, 'w') as f:
+            f.write(self.HEADER)
+            f.write(self.START)
+            for i in range(toolchanges):
+                f.write("T%d\n" % (i % 3 + (i % 2) * 10))
+                f.write("G1 E2 F1200\n")
+                f.write("G1 X%d.5 Y-%d E.1\n" % (i, i))
+                f.write("; filler\n" * body_padding)
+            f.writelines(self.CONFIG)
+
+    def _read_output(self):
+        with open(self.output, 'r') as f:
+            return f.read()
+
+    def test_single_pass_matches_legacy_two_pass(self):
+        self._write_input()
+        legacy = mmu_server.parse_gcode_file(self.input)
+        legacy_output = os.path.join(self.tmp_dir.name, 'legacy.gcode')
+        mmu_server.process_file(self.input, legacy_output, True, *legacy[1:-1])
+
+        metadata = mmu_server.preprocess_file(self.input, self.output, True)
+
+        self.assertEqual(metadata.slicer, legacy[-1])
+        self.assertEqual(sorted(metadata.tools_used), legacy[1])
+        self.assertEqual(metadata.total_toolchanges, legacy[2])
+        self.assertEqual(metadata.colors, legacy[3])
+        with open(legacy_output, 'r') as f:
+            legacy_lines = f.read().splitlines()
+        lines = self._read_output().splitlines()
+        self.assertEqual(len(lines), len(legacy_lines))
+        for line, legacy_line in zip(lines, legacy_lines):
+            self.assertEqual(line.rstrip(' '), legacy_line)
+
+    def test_deferred_placeholders_back_patched(self):
+        self._write_input()
+        mmu_server.preprocess_file(self.input, self.output, True)
+
+        output = self._read_output()
+        self.assertIn('PRINT_START MMU_TOOLS_USED=0,1,2,10,11,12 TOOLCHANGES=20 COLORS=FF0000,00FF00,333333,0000FF TEMPS=210,230,240,215', output)
+        self.assertIn('MMU_CHANGE_TOOL TOOL=0 NEXT_POS="0.5,-0" ; T0\n', output)
+        self.assertIn('; start_gcode = PRINT_START MMU_TOOLS_USED=!referenced_tools!\n', output)
+
+    def test_deferred_placeholder_overflow_rewrites_file(self):
+        self._write_input()
+        widths = mmu_server.DEFERRED_PLACEHOLDER_WIDTHS
+        mmu_server.DEFERRED_PLACEHOLDER_WIDTHS = dict((p, 1) for p in widths)
+        try:
+            metadata = mmu_server.preprocess_file(self.input, self.output, True)
+        finally:
+            mmu_server.DEFERRED_PLACEHOLDER_WIDTHS = widths
+
+        output = self._read_output()
+        lines = output.splitlines()
+        self.assertEqual(lines[2], 'PRINT_START MMU_TOOLS_USED=0,1,2,10,11,12 TOOLCHANGES=20 COLORS=FF0000,00FF00,333333,0000FF TEMPS=210,230,240,215')
+        self.assertEqual(lines[3], 'MMU_CHANGE_TOOL TOOL=0 NEXT_POS="0.5,-0" ; T0')
+        self.assertEqual(len(metadata.toolchanges), 20)
+        data = output.encode()
+        for offset, line_no, _, to_tool, _, _, _ in metadata.toolchanges:
+            self.assertTrue(data[offset:].startswith(b'MMU_CHANGE_TOOL TOOL=%d ' % to_tool))
+            self.assertTrue(lines[line_no - 1].startswith('MMU_CHANGE_TOOL TOOL=%d ' % to_tool))
+
+    def test_unsupported_slicer_not_processed(self):
+        self.HEADER = "; generated by UnknownSlicer 1.0\n"
+        self._write_input()
+        metadata = mmu_server.preprocess_file(self.input, self.output, True)
+
+        self.assertEqual(metadata.slicer, 'UnknownSlicer')
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_metadata_regions_are_bounded(self):
+        self._write_input(body_padding=100)
+        header_lines, config_lines = mmu_server.read_metadata_regions(self.input, window=1024)
+
+        self.assertLessEqual(sum(len(l) for l in header_lines), 1024)
+        self.assertLessEqual(sum(len(l) for l in config_lines), 2 * 1024)
+        self.assertEqual(header_lines[0], self.HEADER)
+        self.assertEqual(config_lines[-len(self.CONFIG):], self.CONFIG)
+
+    def test_config_block_found_at_tail(self):
+        self.CONFIG = ["; prusaslicer_config = begin\n"] + self.CONFIG + ["; prusaslicer_config = end\n"]
+        self._write_input(body_padding=100)
+        _, config_lines = mmu_server.read_metadata_regions(self.input, window=1024)
+
+        self.assertEqual(config_lines, self.CONFIG[:-1])
+
+    def test_config_block_found_at_head(self):
+        self.HEADER = "; HEADER_BLOCK_START\n; BambuStudio 01.09.00.70\n; HEADER_BLOCK_END\n; CONFIG_BLOCK_START\n; filament_colour = #AABBCC;#DDEEFF\n; CONFIG_BLOCK_END\n"
+        self.CONFIG = []
+        self._write_input(body_padding=100)
+        metadata = mmu_server.preprocess_file(self.input, self.output, False)
+
+        self.assertEqual(metadata.slicer, 'BambuStudio')
+        self.assertEqual(metadata.colors, ['AABBCC', 'DDEEFF'])
+
+
+class TestMmuServerMetadataCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = mmu_server.GcodeMetadataCache(os.path.join(self.tmp_dir.name, 'cache.json'), max_entries=3, max_bytes=100000)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _metadata(self, tools):
+        gcode_metadata = mmu_server.GcodeMetadata('PrusaSlicer')
+        gcode_metadata.tools_used = set(tools)
+        gcode_metadata.total_toolchanges = len(tools)
+        gcode_metadata.colors = ['FF0000'] * len(tools)
+        return gcode_metadata
+
+    def test_round_trip(self):
+        self.cache.put(['a', 'b'], self._metadata([0, 2]))
+
+        for key in ('a', 'b'):
+            cached = self.cache.get(key)
+            self.assertEqual(cached.tools_used, {0, 2})
+            self.assertEqual(cached.colors, ['FF0000', 'FF0000'])
+        self.assertIsNone(self.cache.get('c'))
+
+    def test_lru_eviction_by_entries(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.put([key], self._metadata([0]))
+        self.cache.get('a') # 'b' is now least recently used
+        self.cache.put(['d'], self._metadata([1]))
+
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('d'))
+
+    def test_get_does_not_write_cache_file(self):
+        self.cache.put(['a', 'b'], self._metadata([0]))
+        mtime = os.stat(self.cache.cache_file).st_mtime_ns
+        with open(self.cache.cache_file) as f:
+            before = f.read()
+
+        self.assertIsNotNone(self.cache.get('a'))
+        with open(self.cache.cache_file) as f:
+            self.assertEqual(f.read(), before)
+        self.assertEqual(os.stat(self.cache.cache_file).st_mtime_ns, mtime)
+
+    def test_lru_eviction_by_bytes(self):
+        self.cache.max_bytes = 400
+        self.cache.put(['a'], self._metadata(range(10)))
+        self.cache.put(['b'], self._metadata(range(10)))
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+
+    def test_file_key_depends_on_head_and_tail(self):
+        path = os.path.join(self.tmp_dir.name, 'f.gcode')
+        with open(path, 'w') as f:
+            f.write("G1 X1\n" * 100000)
+        key = self.cache.file_key(path)
+        with open(path, 'r+') as f:
+            f.seek(600000 - 60)
+            f.write("G1 X2\n")
+
+        self.assertNotEqual(key, self.cache.file_key(path))
+
+    def test_preprocess_with_cached_metadata(self):
+        input_file = os.path.join(self.tmp_dir.name, 'in.gcode')
+        with open(input_file, 'w') as f:
+            f.write("; generated by PrusaSlicer 2.7.1\nPRINT_START TOOLS=!referenced_tools! COLORS=!colors!\nT1\nG1 X1 Y2\nT3\nG1 X3 Y4\n")
+        output_file = os.path.join(self.tmp_dir.name, 'out.gcode')
+        cached = self._metadata([5]) # e.g. sampled cache key collision
+
+        gcode_metadata = mmu_server.preprocess_file(input_file, output_file, True, cached_metadata=cached)
+
+        with open(output_file, 'r') as f:
+            lines = [l.rstrip(' ') for l in f.read().splitlines()]
+        self.assertIn("PRINT_START TOOLS=1,3 COLORS=FF0000", lines) # Body values from this pass, config from cache
+        self.assertEqual(lines[-1], "; referenced_tools = 1,3")
+        self.assertEqual(gcode_metadata.tools_used, {1, 3})
+        self.assertEqual(gcode_metadata.total_toolchanges, 2)
+
+
+class TestMmuServerParallelPreprocessor(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.gcode_dir = os.path.join(self.tmp_dir.name, 'gcodes')
+        os.mkdir(self.gcode_dir)
+        self.input = os.path.join(self.gcode_dir, 'in.gcode')
+        self.tools = [(i * 7) % 12 for i in range(500)]
+        with open(self.input, 'w') as f:
+            f.write("; generated by OrcaSlicer 2.1.0\nPRINT_START TOOLS=!referenced_tools! COUNT=!total_toolchanges!\n")
+            for i, tool in enumerate(self.tools):
+                f.write("T%d\nG1 X%d Y1 E1\n" % (tool, i))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_preprocess_in_place(self):
+        mmu_server.preprocess_in_place(self.gcode_dir, 'in.gcode', True, True)
+
+        with open(self.input, 'r') as f:
+            contents = f.read()
+        self.assertTrue(contents.startswith(mmu_server.HAPPY_HARE_FINGERPRINT))
+        self.assertIn("PRINT_START TOOLS=0,1,2,3,4,5,6,7,8,9,10,11 COUNT=500", [l.rstrip(' ') for l in contents.splitlines()])
+
+    def test_preprocess_in_place_only_once(self):
+        mmu_server.preprocess_in_place(self.gcode_dir, 'in.gcode', True, True)
+        with open(self.input, 'r') as f:
+            first = f.read()
+        msgs = mmu_server.preprocess_in_place(self.gcode_dir, 'in.gcode', True, True)
+
+        self.assertEqual(msgs, [])
+        with open(self.input, 'r') as f:
+            self.assertEqual(f.read(), first)
+
+
+class TestMmuServerToolchangeIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.gcode_dir = self.tmp_dir.name
+        self.input = os.path.join(self.gcode_dir, 'in.gcode')
+        self.tools = [(i * 5) % 8 for i in range(200)]
+        with open(self.input, 'w') as f:
+            f.write("; generated by OrcaSlicer 2.1.0\nM83\nPRINT_START TOOLS=!referenced_tools!\n")
+            for i, tool in enumerate(self.tools):
+                f.write("; CP TOOLCHANGE WIPE\nT%d\nG1 E-.5\n; CP TOOLCHANGE END\nG1 X%d Y2 E1.5\n" % (tool, i))
+            f.write("T3\nG1 E1\n")
+        self.tools.append(3)
+
+        # Klippy side reader has no klipper dependencies so load it standalone
+        path = os.path.join(os.path.dirname(__file__), '..', '..', 'extras', 'mmu', 'mmu_toolchange_index.py')
+        spec = importlib.util.spec_from_file_location('mmu_toolchange_index', path)
+        self.reader = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.reader)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_index_records_match_processed_file(self):
+        mmu_server.preprocess_in_place(self.gcode_dir, 'in.gcode', True, True)
+        with open(self.input, 'rb') as f:
+            contents = f.read()
+        lines = contents.split(b"\n")
+
+        index = self.reader.MmuToolchangeIndex(self.input)
+        self.assertEqual(len(index), len(self.tools))
+        records = index.upcoming(0, len(self.tools))
+        from_tool = -1
+        for i, (record, tool) in enumerate(zip(records, self.tools)):
+            self.assertTrue(contents[record['offset']:].startswith(b"MMU_CHANGE_TOOL TOOL=%d " % tool))
+            self.assertTrue(lines[record['line'] - 1].startswith(b"MMU_CHANGE_TOOL TOOL=%d " % tool))
+            self.assertEqual((record['from_tool'], record['to_tool']), (from_tool, tool))
+            self.assertAlmostEqual(record['extruded'], i * 1.0, places=2) # Net of retracts
+            from_tool = tool
+        self.assertEqual(records[10]['next_pos'], (10., 2.))
+        self.assertIsNone(records[-1]['next_pos'])
+        index.close()
+
+    def test_upcoming_lookup_from_file_position(self):
+        mmu_server.preprocess_in_place(self.gcode_dir, 'in.gcode', True, True)
+        index = self.reader.MmuToolchangeIndex(self.input)
+        records = index.upcoming(0, len(self.tools))
+
+        # Just past a tool change the next ones are returned
+        upcoming = index.upcoming(records[5]['offset'] + 1, 3)
+        self.assertEqual([r['to_tool'] for r in upcoming], self.tools[6:9])
+        self.assertEqual(index.upcoming(records[-1]['offset'] + 1, 3), [])
+        index.close()
+
+    def test_stale_index_is_ignored(self):
+        mmu_server.preprocess_in_place(self.gcode_dir, 'in.gcode', True, True)
+        with open(self.input, 'a') as f:
+            f.write("G1 X1\n")
+        index = self.reader.MmuToolchangeIndex(self.input)
+        self.assertFalse(index.is_valid())
+        self.assertEqual(index.upcoming(0, 5), [])
+
+    def test_index_realigned_after_object_processing(self):
+        mmu_server.preprocess_in_place(self.gcode_dir, 'in.gcode', True, True)
+        records = self.reader.MmuToolchangeIndex(self.input).upcoming(0, len(self.tools))
+
+        # Emulate moonraker object processing which runs after us and adds lines
+        with open(self.input, 'rb') as f:
+            contents = f.read()
+        with open(self.input, 'wb') as f:
+            f.write(b"EXCLUDE_OBJECT_DEFINE NAME=part\n" + contents.replace(b"\nG1 X", b"\nEXCLUDE_OBJECT_START NAME=part\nG1 X"))
+        self.assertFalse(self.reader.MmuToolchangeIndex(self.input).is_valid())
+
+        mmu_server.refresh_toolchange_index(self.input)
+        with open(self.input, 'rb') as f:
+            contents = f.read()
+        lines = contents.split(b"\n")
+        index = self.reader.MmuToolchangeIndex(self.input)
+        relocated = index.upcoming(0, len(self.tools))
+        self.assertEqual(len(relocated), len(records))
+        for record, orig in zip(relocated, records):
+            self.assertTrue(contents[record['offset']:].startswith(b"MMU_CHANGE_TOOL TOOL=%d " % record['to_tool']))
+            self.assertTrue(lines[record['line'] - 1].startswith(b"MMU_CHANGE_TOOL TOOL=%d " % record['to_tool']))
+            self.assertGreater(record['offset'], orig['offset'])
+            self.assertEqual([record[k] for k in ('from_tool', 'to_tool', 'next_pos', 'extruded')],
+                             [orig[k] for k in ('from_tool', 'to_tool', 'next_pos', 'extruded')])
+        index.close()
+
+    def test_index_removed_if_tool_changes_differ(self):
+        mmu_server.preprocess_in_place(self.gcode_dir, 'in.gcode', True, True)
+        with open(self.input, 'rb') as f:
+            contents = f.read()
+        with open(self.input, 'wb') as f:
+            f.write(contents.replace(b"MMU_CHANGE_TOOL TOOL=3 ", b"MMU_CHANGE_TOOL TOOL=4 "))
+        mmu_server.refresh_toolchange_index(self.input)
+        self.assertFalse(os.path.exists(self.reader.toolchange_index_file(self.input)))
+
+    def test_layout_is_shared_with_reader(self):
+        self.assertIsNotNone(mmu_server.toolchange_index)
+        self.assertFalse(hasattr(mmu_server, 'TOOLCHANGE_INDEX_RECORD'))
+
+
+class TestMmuServerSpoolLocationCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = mmu_server.SpoolLocationCache()
+        for sid in range(1, 3001):
+            printer = 'printer%d' % (sid % 20) if sid % 3 else ''
+            self.cache[sid] = (printer, sid % 8 if printer else -1, {'material': 'PLA'})
+
+    def _scan(self, printer, gate):
+        return sorted(sid for sid, (p, g, _) in self.cache.items() if (printer is None or p == printer) and (gate is None or g == gate))
+
+    def test_lookups_match_full_scan(self):
+        for printer, gate in [('printer1', 1), ('printer1', None), (None, 5), ('printer7', 7), ('nobody', 0), ('', -1)]:
+            self.assertEqual(sorted(self.cache.spool_ids(printer, gate)), self._scan(printer, gate))
+        self.assertEqual(self.cache.check_consistency(), [])
+
+    def test_index_follows_reassignment(self):
+        self.cache[1] = ('printer9', 2, self.cache[1][2])
+        self.cache[2] = ('', -1, self.cache[2][2])
+        del self.cache[4]
+        self.assertIn(1, self.cache.spool_ids('printer9', 2))
+        self.assertNotIn(1, self.cache.spool_ids('printer1', 1))
+        self.assertNotIn(2, self.cache.spool_ids('printer2', None))
+        self.assertNotIn(4, self.cache.spool_ids(None, 4))
+        self.assertEqual(self.cache.check_consistency(), [])
+
+    def test_consistency_check_detects_corruption(self):
+        self.cache._by_gate[('printer1', 1)].pop(1)
+        self.assertTrue(self.cache.check_consistency())
+
+    def test_set_and_unset_update_cache(self):
+        subject = MmuServer.__new__(MmuServer)
+        subject.spool_location = self.cache
+        subject.spoolman = MagicMock(spoolman_url='http://spoolman')
+        subject.http_client = MagicMock()
+        subject.http_client.request = AsyncMock(return_value=MagicMock(status_code=200, has_error=MagicMock(return_value=False)))
+        subject.update_location = True
+        subject._check_init_spoolman = AsyncMock(return_value=True)
+        subject.spool_writer = mmu_server.SpoolmanWriteQueue(subject._send_spool_write)
+
+        self.assertTrue(asyncio.run(subject._set_spool_gate(3, 'printer5', 6, silent=True)))
+        self.assertEqual(subject._find_first_spool_id('printer5', 6), 3)
+        self.assertTrue(asyncio.run(subject._unset_spool_gate(3, silent=True)))
+        self.assertNotIn(3, subject._find_all_spool_ids('printer5', None))
+        self.assertEqual(subject._check_spool_location_cache(), [])
+
+
+
+class TestMmuServerSpoolmanWriteQueue(unittest.TestCase):
+    def setUp(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.sent = []
+        self.responses = {}
+
+    async def _send(self, spool_id, write):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001 * (10 - spool_id % 10))
+        self.in_flight -= 1
+        self.sent.append((spool_id, write))
+        responses = self.responses.get(spool_id)
+        return responses.pop(0) if responses else mmu_server.WRITE_OK
+
+    def test_concurrency_is_bounded_and_results_stream(self):
+        async def run():
+            queue = mmu_server.SpoolmanWriteQueue(self._send, max_concurrency=3)
+            futures = {sid: queue.submit(sid, ('BigRed', sid % 4)) for sid in range(20)}
+            return [sid async for sid, result in mmu_server.SpoolmanWriteQueue.as_completed(futures) if result == mmu_server.WRITE_OK]
+        completed = asyncio.run(run())
+        self.assertEqual(sorted(completed), list(range(20)))
+        self.assertNotEqual(completed, list(range(20))) # Streamed in completion order
+        self.assertEqual(self.max_in_flight, 3)
+
+    def test_pending_writes_are_coalesced(self):
+        async def run():
+            queue = mmu_server.SpoolmanWriteQueue(self._send, max_concurrency=1)
+            first = queue.submit(1, ('BigRed', 0))
+            await asyncio.sleep(0)                  # Let first write start
+            second = queue.submit(1, ('BigRed', 1)) # Queued behind first
+            third = queue.submit(1, ('BigRed', 1))  # Identical to second so shares its write
+            return await asyncio.gather(first, second, third), queue.stats
+        results, stats = asyncio.run(run())
+        self.assertEqual(results, [mmu_server.WRITE_OK] * 3)
+        self.assertEqual(self.sent, [(1, ('BigRed', 0)), (1, ('BigRed', 1))])
+        self.assertEqual(stats['coalesced'], 1)
+        self.assertEqual(stats['superseded'], 0)
+
+    def test_different_pending_write_is_superseded(self):
+        async def run():
+            queue = mmu_server.SpoolmanWriteQueue(self._send, max_concurrency=1)
+            first = queue.submit(1, ('BigRed', 0))
+            await asyncio.sleep(0)                  # Let first write start
+            second = queue.submit(1, ('BigRed', 1)) # Queued behind first
+            third = queue.submit(1, ('', -1))       # Replaces second
+            return await asyncio.gather(first, second, third), queue.stats
+        results, stats = asyncio.run(run())
+        self.assertEqual(results, [mmu_server.WRITE_OK, mmu_server.WRITE_SUPERSEDED, mmu_server.WRITE_OK])
+        self.assertEqual(self.sent, [(1, ('BigRed', 0)), (1, ('', -1))])
+        self.assertEqual(stats['coalesced'], 0)
+        self.assertEqual(stats['superseded'], 1)
+        self.assertEqual(stats['failed'], 0)
+
+    def test_transient_errors_are_retried(self):
+        self.responses = {1: [mmu_server.WRITE_TRANSIENT, mmu_server.WRITE_TRANSIENT], 2: [mmu_server.WRITE_NOT_FOUND], 3: [mmu_server.WRITE_TRANSIENT] * 5}
+        async def run():
+            queue = mmu_server.SpoolmanWriteQueue(self._send, retries=2, backoff=0.001)
+            return await asyncio.gather(*(queue.submit(sid, ('BigRed', 0)) for sid in (1, 2, 3)))
+        results = asyncio.run(run())
+        self.assertEqual(results, [mmu_server.WRITE_OK, mmu_server.WRITE_NOT_FOUND, mmu_server.WRITE_ERROR])
+        self.assertEqual([sid for sid, _ in self.sent].count(1), 3)
+        self.assertEqual([sid for sid, _ in self.sent].count(3), 3)
+
+
+class FakeSpoolmanHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path != '/api/v1/spool':
+            self.send_error(404)
+            return
+        self.server.requests.append(self.path)
+        offset = int(query.get('offset', ['0'])[0])
+        limit = int(query.get('limit', [str(len(self.server.spools))])[0])
+        body = json.dumps(self.server.spools[offset:offset + limit]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeHttpClient:
+    '''
+    Minimal stand in for moonraker's http_client used against the fake Spoolman server
+    '''
+    def __init__(self, on_get=None):
+        self.on_get = on_get
+
+    async def get(self, url):
+        response = await asyncio.get_running_loop().run_in_executor(None, self._get, url)
+        if self.on_get:
+            self.on_get(url)
+        return response
+
+    def _get(self, url):
+        try:
+            with urllib.request.urlopen(url) as r:
+                status, body = r.status, r.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, b'{}'
+        return MagicMock(status_code=status, json=MagicMock(return_value=json.loads(body)), has_error=MagicMock(return_value=status >= 400))
+
+
+class TestMmuServerSpoolmanSync(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeSpoolmanHandler)
+        self.server.spools = [self._spool(sid, 'BigRed' if sid % 2 else '', sid % 4 if sid % 2 else -1) for sid in range(1, 51)]
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.subject = MmuServer.__new__(MmuServer)
+        self.subject.spool_location = mmu_server.SpoolLocationCache()
+        self.subject.spoolman = MagicMock(spoolman_url='http://127.0.0.1:%d/api' % self.server.server_address[1])
+        self.subject.http_client = FakeHttpClient()
+        self.subject.spoolman_page_size = 7
+        self.subject.spool_cache_synced = False
+        self.subject.spool_watch_connected = True
+        self.subject.spool_rebuilding = False
+        self.subject.spool_events = []
+        self.subject.cache_lock = asyncio.Lock()
+        self.subject._log_n_send = AsyncMock()
+        self.subject._check_init_spoolman = AsyncMock(return_value=True)
+        self.subject._initialize_mmu = AsyncMock()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _spool(self, sid, printer, gate):
+        return {'id': sid, 'filament': {'name': 'F%d' % sid, 'material': 'PLA'},
+                'extra': {mmu_server.MMU_NAME_FIELD: json.dumps(printer), mmu_server.MMU_GATE_FIELD: str(gate)}}
+
+    def _event(self, event_type, sid, printer, gate):
+        return json.dumps({'type': event_type, 'resource': 'spool', 'payload': self._spool(sid, printer, gate)})
+
+    def test_paged_full_rebuild(self):
+        self.assertTrue(asyncio.run(self.subject._build_spool_location_cache(silent=True)))
+        self.assertEqual(len(self.subject.spool_location), 50)
+        self.assertEqual(len(self.server.requests), 8) # 7 full pages and final partial page
+        self.assertEqual(self.subject._find_all_spool_ids('BigRed', 1), [1, 5, 9, 13, 17, 21, 25, 29, 33, 37, 41, 45, 49])
+        self.assertTrue(self.subject.spool_cache_synced)
+
+    def test_failed_rebuild_keeps_cache(self):
+        asyncio.run(self.subject._build_spool_location_cache(silent=True))
+        self.subject.spoolman.spoolman_url += '/missing'
+        self.assertFalse(asyncio.run(self.subject._build_spool_location_cache(silent=True)))
+        self.assertEqual(len(self.subject.spool_location), 50)
+        self.assertFalse(self.subject.spool_cache_synced)
+
+    def test_notifications_apply_deltas(self):
+        asyncio.run(self.subject._build_spool_location_cache(silent=True))
+        self.subject._handle_spool_event(self._event('updated', 2, 'BigRed', 3))
+        self.subject._handle_spool_event(self._event('deleted', 1, 'BigRed', 1))
+        self.subject._handle_spool_event(self._event('added', 51, 'Other', 0))
+        self.subject._handle_spool_event(json.dumps({'type': 'updated', 'resource': 'filament', 'payload': {'id': 3}}))
+
+        self.assertEqual(self.subject.spool_location.get(2)[:2], ('BigRed', 3))
+        self.assertNotIn(1, self.subject.spool_location)
+        self.assertEqual(self.subject._find_first_spool_id('Other', 0), 51)
+        self.assertEqual(self.subject._check_spool_location_cache(), [])
+
+    def test_notifications_during_rebuild_are_replayed(self):
+        self.subject.http_client.on_get = lambda url: self.subject._handle_spool_event(self._event('updated', 40, 'BigRed', 2))
+        asyncio.run(self.subject._build_spool_location_cache(silent=True))
+        self.assertEqual(self.subject.spool_location.get(40)[:2], ('BigRed', 2))
+
+    def test_refresh_uses_synced_cache(self):
+        asyncio.run(self.subject.refresh_cache(silent=True))
+        asyncio.run(self.subject.refresh_cache(silent=True))
+        self.assertEqual(len(self.server.requests), 8)
+
+        self.subject.spool_watch_connected = self.subject.spool_cache_synced = False # Notifications lost
+        asyncio.run(self.subject.refresh_cache(silent=True))
+        self.assertEqual(len(self.server.requests), 16)
+
+class TestMmuServerGateMapUpdate(unittest.TestCase):
+    def setUp(self):
+        self.subject = MmuServer.__new__(MmuServer)
+        self.subject.mmu_backend_present = self.subject.mmu_enabled = True
+        self.subject.gate_map_endpoint = None
+        self.subject.spool_location = mmu_server.SpoolLocationCache()
+        self.subject.spool_location[7] = ('BigRed', 2, {'spool_id': 7, 'material': 'PLA'})
+        self.subject.klippy_apis = MagicMock()
+        self.subject.klippy_apis._send_klippy_request = AsyncMock()
+        self.subject.klippy_apis.run_gcode = AsyncMock()
+        self.subject.klippy_apis.list_endpoints = AsyncMock(return_value={'endpoints': ['info', 'mmu/gate_map']})
+        self.subject._log_n_send = AsyncMock()
+
+    def test_update_sent_as_json(self):
+        self.assertTrue(asyncio.run(self.subject._send_gate_map_update([(2, 7), (3, -1)], replace=True)))
+        self.subject.klippy_apis._send_klippy_request.assert_awaited_once_with(
+            "mmu/gate_map", {'map': {2: {'spool_id': 7, 'material': 'PLA'}, 3: {'spool_id': -1}}, 'replace': True, 'from_spoolman': True})
+        self.subject.klippy_apis.run_gcode.assert_not_awaited()
+        self.assertTrue(self.subject.gate_map_endpoint)
+
+    def test_fallback_to_gcode(self):
+        self.subject.klippy_apis.list_endpoints.return_value = {'endpoints': ['info']}
+        self.assertTrue(asyncio.run(self.subject._send_gate_map_update([(2, 7)])))
+        self.assertTrue(asyncio.run(self.subject._send_gate_map_update([(2, 7)])))
+        self.subject.klippy_apis.list_endpoints.assert_awaited_once() # Not checked again until Klippy restarts
+        self.subject.klippy_apis._send_klippy_request.assert_not_awaited()
+        self.assertEqual(self.subject.klippy_apis.run_gcode.await_count, 2)
+        self.assertIn("FROM_SPOOLMAN=1", self.subject.klippy_apis.run_gcode.await_args[0][0])
+        self.assertIs(self.subject.gate_map_endpoint, False)
+
+    def test_endpoint_rechecked_on_klippy_ready(self):
+        self.subject.klippy_apis.list_endpoints.return_value = {'endpoints': ['info']}
+        asyncio.run(self.subject._check_gate_map_endpoint())
+        self.assertIs(self.subject.gate_map_endpoint, False)
+
+        self.subject.klippy_apis.list_endpoints.return_value = {'endpoints': ['info', 'mmu/gate_map']} # Happy Hare updated
+        asyncio.run(self.subject._reset_gate_map_endpoint())
+        asyncio.run(self.subject._check_gate_map_endpoint())
+        self.assertTrue(asyncio.run(self.subject._send_gate_map_update([(2, 7)])))
+        self.subject.klippy_apis._send_klippy_request.assert_awaited_once()
+        self.subject.klippy_apis.run_gcode.assert_not_awaited()
+
+    def test_endpoint_error_is_reported(self):
+        self.subject.klippy_apis._send_klippy_request.side_effect = Exception("Invalid gate 99")
+        self.assertFalse(asyncio.run(self.subject._send_gate_map_update([(2, 7)])))
+        self.subject.klippy_apis.run_gcode.assert_not_awaited()
+        self.subject._log_n_send.assert_awaited_once()
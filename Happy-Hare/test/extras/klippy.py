@@ -0,0 +1,36 @@
+# Happy Hare MMU Software
+# Test support for klippy side modules
+#
+# The klippy modules are loaded from a klipper checkout (KLIPPER_DIR, sibling of Happy-Hare or ~/klipper)
+# with Happy Hare extras overlaid on klipper's extras package, as install.sh links them. Tests using Mmu
+# are skipped if klipper or its python requirements are not available
+#
+import os, sys, unittest
+
+HH_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+KLIPPER_DIRS = [os.environ.get('KLIPPER_DIR', ''), os.path.join(HH_DIR, '..', 'klipper'), os.path.expanduser('~/klipper')]
+
+
+def _load_mmu():
+    for klipper_dir in KLIPPER_DIRS:
+        klippy_dir = os.path.join(klipper_dir, 'klippy')
+        if klipper_dir and os.path.isfile(os.path.join(klippy_dir, 'klippy.py')):
+            break
+    else:
+        return (None, None), "klipper not found"
+    if klippy_dir not in sys.path:
+        sys.path.insert(0, klippy_dir)
+    try:
+        import extras
+        hh_extras = os.path.join(HH_DIR, 'extras')
+        if hh_extras not in extras.__path__:
+            extras.__path__.insert(0, hh_extras)
+        from extras.mmu import mmu
+        from extras import mmu_encoder
+        return (mmu, mmu_encoder), None
+    except Exception as e:
+        return (None, None), "cannot import klippy modules: %s" % str(e)
+
+(mmu, mmu_encoder), skip_reason = _load_mmu()
+
+requires_klippy = unittest.skipIf(mmu is None, skip_reason)
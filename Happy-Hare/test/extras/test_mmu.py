@@ -0,0 +1,281 @@
+import unittest
+from unittest.mock import MagicMock
+
+from test.extras.klippy import mmu, requires_klippy
+
+
+def make_mmu(**attrs):
+    subject = mmu.Mmu.__new__(mmu.Mmu)
+    subject.printer = MagicMock()
+    subject.printer.command_error = type('CommandError', (Exception,), {})
+    subject.log_debug = subject.log_trace = subject.log_info = subject.log_always = MagicMock()
+    subject.log_warning = MagicMock()
+    subject.log_error = MagicMock()
+    for k, v in attrs.items():
+        setattr(subject, k, v)
+    return subject
+
+
+@requires_klippy
+class TestMmuPrestage(unittest.TestCase):
+    def setUp(self):
+        self.subject = make_mmu(
+            num_gates=4,
+            gate_selected=0,
+            gate_status=[1, 1, 1, 0],
+            gate_speed_override=[100] * 4,
+            gear_homing_speed=50.,
+            gate_homing_max=100.,
+            gate_parking_distance=23.,
+            gate_homing_endstop=mmu.Mmu.SENSOR_GEAR_PREFIX,
+            lookahead_prestage=1,
+            prestaged_gates=set(),
+            _prestaging_gate=None,
+            _next_tool=mmu.Mmu.TOOL_GATE_UNKNOWN,
+            mmu_machine=MagicMock(multigear=True),
+            mmu_toolhead=MagicMock(),
+            sensor_manager=MagicMock(),
+        )
+        self.subject.mmu_toolhead.is_gear_synced_to_extruder.return_value = False
+        self.subject.is_printing = MagicMock(return_value=True)
+        self.subject.is_paused = MagicMock(return_value=False)
+        self.subject._get_prestage_candidate = MagicMock(return_value=2)
+        self.subject.trace_filament_move = MagicMock(return_value=(10., True, 10., 0.))
+        self.gear_sensor = {}
+        self.subject.sensor_manager.check_gate_sensor.side_effect = lambda prefix, gate: self.gear_sensor.get(gate, False)
+        self.subject.sensor_manager.get_gate_sensor_name.side_effect = lambda prefix, gate: "mmu_gear_%d" % gate
+
+    def test_not_prestaged_by_command_while_printing_or_during_toolchange(self):
+        self.assertIn("after tool change", self.subject._check_can_prestage(2))
+        self.assertIsNone(self.subject._check_can_prestage(2, in_print=True))
+        self.subject._next_tool = 1
+        self.assertIn("tool change in progress", self.subject._check_can_prestage(2, in_print=True))
+        self.subject.trace_filament_move.assert_not_called()
+
+    def test_prestage_scheduled_after_toolchange(self):
+        self.subject.reactor = MagicMock()
+        self.subject._schedule_prestage()
+        self.subject.reactor.register_callback.assert_called_once_with(self.subject._prestage_next_gate)
+        self.subject.trace_filament_move.assert_not_called()
+
+    def test_prestage_while_printing(self):
+        self.subject._prestage_next_gate(1.)
+        self.assertEqual(self.subject.prestaged_gates, {2})
+        args, kwargs = self.subject.trace_filament_move.call_args
+        self.assertEqual(kwargs['homing_move'], 1)
+        self.assertEqual(kwargs['endstop_name'], "mmu_gear_2")
+        self.subject.mmu_toolhead.select_gear_stepper.assert_called_with(0) # Selected gate restored
+        self.assertIsNone(self.subject._prestaging_gate)
+
+    def test_prestage_skipped_when_synced(self):
+        self.subject.mmu_toolhead.is_gear_synced_to_extruder.return_value = True
+        self.subject._prestage_next_gate(1.)
+        self.assertEqual(self.subject.prestaged_gates, set())
+        self.subject.trace_filament_move.assert_not_called()
+
+    def test_prestage_gcode_error_is_not_fatal(self):
+        self.subject.trace_filament_move.side_effect = self.subject.printer.command_error("Move out of range")
+        self.subject._prestage_next_gate(1.)
+        self.assertEqual(self.subject.prestaged_gates, set())
+        self.subject.log_warning.assert_called_once()
+
+    def test_prestaged_gates_reparked(self):
+        self.subject.prestaged_gates = {1, 2}
+        self.gear_sensor = {2: True}
+        self.subject._unstage_gates()
+        self.assertEqual(self.subject.prestaged_gates, set())
+        moves = [c for c in self.subject.trace_filament_move.call_args_list]
+        self.assertEqual(len(moves), 2) # Gate 1 already behind sensor
+        self.assertEqual(moves[0][1]['homing_move'], -1)
+        self.assertEqual(moves[0][1]['endstop_name'], "mmu_gear_2")
+        self.assertEqual(moves[1][0][1], -23.)
+        self.subject.mmu_toolhead.select_gear_stepper.assert_called_with(0)
+
+    def test_reparking_failure_is_not_fatal(self):
+        self.subject.prestaged_gates = {1, 2}
+        self.gear_sensor = {1: True, 2: True}
+        self.subject.trace_filament_move.return_value = (100., False, 100., 0.)
+        self.subject._unstage_gates()
+        self.assertEqual(self.subject.prestaged_gates, set())
+        self.assertEqual(self.subject.log_warning.call_count, 2)
+
+
+@requires_klippy
+class TestMmuGateMapEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.subject = make_mmu(
+            is_enabled=True,
+            gcode=MagicMock(),
+            _gate_map_requests={},
+            _gate_map_request_id=0,
+        )
+        self.subject._renew_gate_map = MagicMock()
+        self.subject._apply_gate_map_update = MagicMock(return_value=[1])
+        self.subject._update_gate_color_rgb = MagicMock()
+        self.subject._persist_gate_map = MagicMock()
+        self.web_request = MagicMock()
+        self.web_request.error = type('WebRequestError', (Exception,), {})
+        self.web_request.get_dict.return_value = {'1': {'material': 'PLA'}}
+        self.web_request.get.side_effect = lambda name, default=None: default
+
+        def run_script(script):
+            gcmd = MagicMock()
+            gcmd.get_int.return_value = int(script.split('=')[1])
+            gcmd.error = self.subject.printer.command_error
+            self.subject.cmd_MMU_GATE_MAP_UPDATE(gcmd)
+        self.subject.gcode.run_script.side_effect = run_script
+
+    def test_update_applied_in_command_under_gcode_mutex(self):
+        self.subject._handle_gate_map_request(self.web_request)
+        self.subject.gcode.run_script.assert_called_once_with("__MMU_GATE_MAP_UPDATE ID=1")
+        self.subject.gcode.run_script_from_command.assert_not_called()
+        self.subject._apply_gate_map_update.assert_called_once_with({1: {'material': 'PLA'}}, False, False)
+        self.subject._persist_gate_map.assert_called_once_with(spoolman_sync=True, gate_ids=[1])
+        self.web_request.send.assert_called_once_with({'changed_gate_ids': [1]})
+        self.assertEqual(self.subject._gate_map_requests, {})
+
+    def test_invalid_update_reported_to_caller(self):
+        self.subject._apply_gate_map_update.side_effect = ValueError("bad gate")
+        with self.assertRaises(self.web_request.error):
+            self.subject._handle_gate_map_request(self.web_request)
+        self.subject._persist_gate_map.assert_not_called()
+        self.web_request.send.assert_not_called()
+        self.assertEqual(self.subject._gate_map_requests, {})
+
+
+@requires_klippy
+class TestMmuStatusGroups(unittest.TestCase):
+    def setUp(self):
+        self.subject = make_mmu(
+            _status_generations=dict((group, 0) for group in mmu.Mmu.STATUS_GROUPS),
+            _status_groups={},
+            tool_extrusion_multipliers=[1., 1.],
+            tool_speed_multipliers=[1., 1.],
+            slicer_tool_map={'tools': {}, 'referenced_tools': [], 'purge_volumes': []},
+        )
+
+    def test_unchanged_group_is_reused(self):
+        values, built = self.subject._get_status_group('tool_map')
+        self.assertTrue(built)
+        self.assertIs(self.subject._get_status_group('tool_map')[0], values)
+        self.assertEqual(self.subject._get_status_group('tool_map'), (values, False))
+
+    def test_in_place_mutation_seen_after_bump(self):
+        values = self.subject._get_status_group('tool_map')[0]
+        self.subject.tool_speed_multipliers[1] = 0.5
+        self.subject.slicer_tool_map['tools']['0'] = {'color': 'ff0000'}
+        self.subject._bump_status_generation('tool_map')
+        new_values, built = self.subject._get_status_group('tool_map')
+        self.assertTrue(built)
+        self.assertEqual(new_values['tool_speed_multipliers'], [1., 0.5])
+        self.assertEqual(new_values['slicer_tool_map']['tools'], {'0': {'color': 'ff0000'}})
+        # Previously returned status is a snapshot so webhooks comparison sees the change
+        self.assertEqual(values['tool_speed_multipliers'], [1., 1.])
+        self.assertEqual(values['slicer_tool_map']['tools'], {})
+        self.assertNotEqual(values, new_values)
+
+    def test_replaced_attribute_rebuilds_group(self):
+        values = self.subject._get_status_group('tool_map')[0]
+        self.subject.tool_extrusion_multipliers = [2., 2.]
+        new_values, built = self.subject._get_status_group('tool_map')
+        self.assertTrue(built)
+        self.assertEqual(new_values['tool_extrusion_multipliers'], [2., 2.])
+        self.assertEqual(values['tool_extrusion_multipliers'], [1., 1.])
+
+    def test_status_delta_reports_changed_keys(self):
+        statuses = [{'tool': 1, 'gate': 1, 'sensors': {'a': True}}, {'tool': 2, 'gate': 1, 'sensors': {'a': True}}]
+        self.subject._status_last, self.subject._status_changed, self.subject._status_serial = {}, {}, 0
+        self.subject._build_status = MagicMock(side_effect=statuses)
+        serial, status = self.subject.get_status_delta(0., None)
+        self.assertEqual(status, statuses[0])
+        serial, delta = self.subject.get_status_delta(1., serial)
+        self.assertEqual(delta, {'tool': 2})
+        self.assertEqual(serial, 2)
+
+    def test_sensor_status_cached_until_sensor_changes(self):
+        helper = mmu.MmuRunoutHelper.__new__(mmu.MmuRunoutHelper)
+        helper._filament_present, helper._sensor_enabled = False, True
+        manager = mmu.MmuSensorManager.__new__(mmu.MmuSensorManager)
+        manager._status_key = manager._status = None
+        manager.viewable_sensors = {'toolhead': MagicMock(runout_helper=helper)}
+        status = manager.get_status()
+        self.assertIs(manager.get_status(), status)
+        helper.filament_present = True
+        self.assertEqual(manager.get_status(), {'toolhead': True})
+        helper.sensor_enabled = False
+        self.assertEqual(manager.get_status(), {'toolhead': None})
+
+    def test_assign_spool_id_bumps_gate_map(self):
+        self.subject.gate_spool_id = [5, -1]
+        self.subject.assign_spool_id(1, 5)
+        self.assertEqual(self.subject.gate_spool_id, [-1, 5])
+        self.assertEqual(self.subject._status_generations['gate_map'], 1)
+
+
+@requires_klippy
+class TestMmuRotationDistance(unittest.TestCase):
+    def setUp(self):
+        self.steppers = [MagicMock(), MagicMock()]
+        self.subject = make_mmu(
+            _pending_rd=None,
+            mmu_toolhead=MagicMock(selected_gear_steppers=self.steppers),
+            gear_rail=MagicMock(steppers=self.steppers[:1]),
+        )
+
+    def test_immediate_update_applied_to_all_selected_gear_steppers(self):
+        self.subject._pending_rd = (22.5, self.steppers)
+        self.subject.set_rotation_distance(23.)
+        for s in self.steppers:
+            s.set_rotation_distance.assert_called_once_with(23.)
+        self.assertIsNone(self.subject._pending_rd)
+
+
+@requires_klippy
+class TestMmuCalibrationAutotune(unittest.TestCase):
+    def setUp(self):
+        stepper = MagicMock()
+        stepper.get_rotation_distance.return_value = (22.5, 200)
+        self.mmu = make_mmu(
+            gate_selected=1,
+            DIRECTION_LOAD=mmu.Mmu.DIRECTION_LOAD,
+            DIRECTION_UNLOAD=mmu.Mmu.DIRECTION_UNLOAD,
+            gear_rail=MagicMock(steppers=[stepper]),
+            rotation_distances=[22.5, 22.5],
+            default_rotation_distance=22.5,
+            autotune_rotation_distance=True,
+            autotune_bowden_length=False,
+            calibrating=False,
+            mmu_machine=MagicMock(variable_rotation_distances=True),
+        )
+        self.mmu._get_bowden_length = MagicMock(return_value=500.)
+        self.mmu.save_rotation_distance = MagicMock()
+        self.subject = mmu.MmuCalibrationManager.__new__(mmu.MmuCalibrationManager)
+        self.subject.mmu = self.mmu
+        self.subject.telemetry = MagicMock()
+        self.subject.telemetry.estimate_rotation_distance.return_value = None
+
+    def test_sample_recorded_when_sane(self):
+        self.subject._autotune(mmu.Mmu.DIRECTION_LOAD, 1.01, 5., 0., 100.)
+        self.subject.telemetry.record.assert_called_once()
+
+    def test_sample_failing_sanity_check_not_recorded(self):
+        self.subject._autotune(mmu.Mmu.DIRECTION_LOAD, 1.5, 5., 0., 100.)
+        self.subject.telemetry.record.assert_not_called()
+        self.mmu.save_rotation_distance.assert_not_called()
+        self.assertIn("failed sanity check", self.mmu.log_debug.call_args[0][0])
+
+    def test_sanity_check_uses_default_when_gate_0_uncalibrated(self):
+        self.mmu.rotation_distances = [-1, 22.5]
+        self.subject._autotune(mmu.Mmu.DIRECTION_LOAD, 1.01, 5., 0., 100.)
+        self.subject.telemetry.record.assert_called_once()
+
+    def test_sanity_check_uses_gate_calibration(self):
+        self.mmu.rotation_distances = [22.5, 30.]
+        self.subject._autotune(mmu.Mmu.DIRECTION_LOAD, 1.3, 5., 0., 100.)
+        self.subject.telemetry.record.assert_called_once()
+
+    def test_sanity_check_skipped_without_reference(self):
+        self.mmu.rotation_distances = [-1, -1]
+        self.mmu.default_rotation_distance = 0
+        self.subject._autotune(mmu.Mmu.DIRECTION_LOAD, 1.5, 5., 0., 100.)
+        self.subject.telemetry.record.assert_called_once()
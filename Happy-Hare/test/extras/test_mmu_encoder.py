@@ -0,0 +1,113 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from test.extras.klippy import mmu_encoder, requires_klippy
+
+
+def make_encoder(**attrs):
+    subject = mmu_encoder.MmuEncoder.__new__(mmu_encoder.MmuEncoder)
+    subject.reactor = MagicMock()
+    subject.extruder = MagicMock()
+    subject.resolution = 1.
+    subject._enabled = True
+    subject._last_time = None
+    subject._counts = subject._last_count = 0
+    subject._last_sample = None
+    subject._movement = False
+    subject.extrusion_flowrate = 0.
+    subject.telemetry = mmu_encoder.EncoderTelemetry(64, 5)
+    for k, v in attrs.items():
+        setattr(subject, k, v)
+    return subject
+
+
+@requires_klippy
+class TestMmuEncoderCounterCallback(unittest.TestCase):
+    def test_callback_only_updates_counters(self):
+        subject = make_encoder()
+        subject._counter_callback(1., 0, 1.)
+        subject._counter_callback(1.1, 10, 1.05)
+        self.assertEqual(subject._counts, 10)
+        self.assertTrue(subject._movement)
+        self.assertEqual(subject._last_sample, (1.05, 10))
+        subject.extruder.find_past_position.assert_not_called()
+        self.assertEqual(subject.telemetry.total, 0)
+
+    def test_reset_counts_discards_published_sample(self):
+        subject = make_encoder()
+        subject._counter_callback(1., 0, 1.)
+        subject._counter_callback(1.1, 10, 1.05)
+        subject.reset_counts()
+        self.assertIsNone(subject._last_sample)
+
+
+@requires_klippy
+class TestMmuEncoderStatus(unittest.TestCase):
+    def test_status_rebuilt_only_when_inputs_change(self):
+        subject = make_encoder(detection_length=10., min_headroom=10., filament_runout_pos=10., last_extruder_pos=0.,
+                               desired_headroom=6., detection_mode=1, _status_inputs=None, _status=None)
+        status = subject.get_status(0.)
+        self.assertIs(subject.get_status(1.), status)
+        subject._counts = 5
+        new_status = subject.get_status(2.)
+        self.assertIsNot(new_status, status)
+        self.assertEqual(new_status['encoder_pos'], 5.)
+        self.assertEqual(status['encoder_pos'], 0.)
+
+
+# Emulates klipper chelper trapq_extract_old() on a history list (newest first) of pull_move like objects
+class FakeTrapq:
+    def __init__(self, history):
+        self.history = history
+
+    def get_ffi(self):
+        ffi_main = SimpleNamespace(new=lambda decl: [None] * int(decl.split('[')[1].rstrip(']')))
+        ffi_lib = SimpleNamespace(trapq_extract_old=self.trapq_extract_old)
+        return ffi_main, ffi_lib
+
+    def trapq_extract_old(self, trapq, p, max_moves, start_time, end_time):
+        res = 0
+        for m in self.history:
+            if start_time >= m.print_time + m.move_t or res >= max_moves:
+                break
+            if end_time <= m.print_time:
+                continue
+            p[res] = m
+            res += 1
+        return res
+
+
+def extrude_moves(start_time, count, move_t, velocity, start_x=0.):
+    moves = [SimpleNamespace(print_time=start_time + i * move_t, move_t=move_t, start_v=velocity, accel=0.,
+                             start_x=start_x + i * move_t * velocity, x_r=1.) for i in range(count)]
+    return moves[::-1] # Newest first
+
+
+@requires_klippy
+class TestMmuEncoderNextCheckTime(unittest.TestCase):
+    def setUp(self):
+        self.subject = make_encoder(_trapq_moves=None, estimated_print_time=lambda eventtime: eventtime)
+        self.subject.reactor.NEVER = 9999999999999999.
+        self.subject.extruder.max_e_velocity = 10.
+        self.subject.extruder.max_extrude_ratio = 0.
+        self.subject.printer = MagicMock()
+        self.subject.printer.lookup_object.return_value.get_max_velocity.return_value = (300., 3000.)
+
+    def next_check(self, history, distance, headroom):
+        with patch.object(mmu_encoder.chelper, 'get_ffi', FakeTrapq(history).get_ffi):
+            return self.subject._next_check_time(10., 0., distance, headroom) - 10.
+
+    def test_wakes_when_distance_extruded(self):
+        # 5mm/s from print time so 1mm takes 0.2s
+        self.assertAlmostEqual(self.next_check(extrude_moves(10., 100, 0.1, 5.), 1., 20.), 0.2)
+
+    def test_many_future_moves_do_not_hide_current_moves(self):
+        # Thousands of short moves queued well beyond the check window
+        history = extrude_moves(10., 5000, 0.001, 2.)
+        self.assertAlmostEqual(self.next_check(history, 0.1, 20.), 0.05)
+
+    def test_sleep_limited_by_headroom_at_peak_flow(self):
+        # No extrusion queued so sleep would be MAX_CHECK_INTERVAL but 2mm at 10mm/s takes 0.2s
+        self.assertAlmostEqual(self.next_check([], 1., 20.), mmu_encoder.MmuEncoder.MAX_CHECK_INTERVAL)
+        self.assertAlmostEqual(self.next_check([], 1., 2.), 0.2)
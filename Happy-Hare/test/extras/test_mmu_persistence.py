@@ -0,0 +1,152 @@
+import os
+import tempfile
+import importlib.util
+import unittest
+from unittest.mock import MagicMock
+
+# Persistence has no klipper dependencies so load it standalone
+path = os.path.join(os.path.dirname(__file__), '..', '..', 'extras', 'mmu', 'mmu_persistence.py')
+spec = importlib.util.spec_from_file_location('mmu_persistence', path)
+mmu_persistence = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mmu_persistence)
+
+
+class CountingRepr:
+    calls = 0
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        CountingRepr.calls += 1
+        return repr(self.value)
+
+
+# Minimal stand-in for klipper save_variables: SAVE_VARIABLE writes synchronously and replaces allVariables
+class FakeSaveVariables:
+    def __init__(self, filename):
+        self.filename = filename
+        self.allVariables = {}
+
+    def cmd_SAVE_VARIABLE(self, gcmd):
+        newvars = dict(self.allVariables)
+        newvars[gcmd.get('VARIABLE')] = gcmd.get('VALUE')
+        with open(self.filename, 'w') as f:
+            f.write("[Variables]\n%s\n" % "".join("%s = %r\n" % (k, v) for k, v in sorted(newvars.items())))
+        self.allVariables = newvars
+
+
+# Stand-in for forks where SAVE_VARIABLE and internal writers (e.g. error codes) share _write_variables()
+class FakeForkSaveVariables(FakeSaveVariables):
+    def cmd_SAVE_VARIABLE(self, gcmd):
+        newvars = dict(self.allVariables)
+        newvars[gcmd.get('VARIABLE')] = gcmd.get('VALUE')
+        self._write_variables(newvars)
+
+    def save_error_code(self, code):
+        newvars = dict(self.allVariables)
+        newvars['error_code'] = code
+        self._write_variables(newvars)
+
+    def _write_variables(self, newvars):
+        with open(self.filename, 'w') as f:
+            f.write("[Variables]\n%s\n" % "".join("%s = %r\n" % (k, v) for k, v in sorted(newvars.items())))
+        self.allVariables = newvars
+
+
+class TestMmuVariablePersistence(unittest.TestCase):
+    save_variables_class = FakeSaveVariables
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.save_variables = self.save_variables_class(os.path.join(self.tmp_dir.name, 'mmu_vars.cfg'))
+        self.save_variables.allVariables = {'mmu__revision': 0, 'a': 1, 'b': [1, 2]}
+        self.commands = {'SAVE_VARIABLE': self.save_variables.cmd_SAVE_VARIABLE}
+        gcode = MagicMock()
+        gcode.register_command.side_effect = lambda cmd, func, desc=None: (
+            self.commands.pop(cmd, None) if func is None else self.commands.__setitem__(cmd, func))
+        mmu = MagicMock()
+        mmu.printer.lookup_object.return_value = gcode
+        self.subject = mmu_persistence.MmuVariablePersistence(mmu, self.save_variables)
+
+    def tearDown(self):
+        self.subject.stop()
+        self.tmp_dir.cleanup()
+
+    def save(self, name, value):
+        self.save_variables.allVariables[name] = value
+        self.subject.mark_dirty(name)
+
+    def read(self):
+        with open(self.save_variables.filename) as f:
+            return f.read()
+
+    def test_only_dirty_keys_are_serialized(self):
+        self.save('c', CountingRepr(3))
+        self.subject.flush() # First snapshot compares everything
+        self.assertIn("c = 3\n", self.read())
+
+        CountingRepr.calls = 0
+        self.save('d', CountingRepr(4))
+        self.subject.flush()
+        self.assertEqual(CountingRepr.calls, 1)
+        self.assertIn("c = 3\n", self.read())
+        self.assertIn("d = 4\n", self.read())
+
+        self.subject.flush() # Nothing dirty
+        self.assertEqual(CountingRepr.calls, 1)
+
+    def test_deleted_key_is_removed(self):
+        self.subject.flush()
+        self.save_variables.allVariables.pop('a')
+        self.subject.mark_dirty('a')
+        self.subject.flush()
+        self.assertNotIn("a = ", self.read())
+        self.assertIn("b = [1, 2]\n", self.read())
+
+    def test_save_variable_not_overwritten_by_older_snapshot(self):
+        self.subject.flush()
+        self.save('a', 2)
+        older = self.subject._snapshot() # Snapshot queued for writer but not yet written
+
+        gcmd = MagicMock()
+        gcmd.get.side_effect = lambda name: {'VARIABLE': 'macro_var', 'VALUE': 7}[name]
+        self.commands['SAVE_VARIABLE'](gcmd)
+        self.assertIn("macro_var = 7\n", self.read())
+
+        self.subject._write(*older)
+        self.assertIn("macro_var = 7\n", self.read())
+
+        # Later changes are written on top of the SAVE_VARIABLE change
+        self.save('a', 3)
+        self.subject.flush()
+        self.assertIn("macro_var = 7\n", self.read())
+        self.assertIn("a = 3\n", self.read())
+
+    def test_save_variable_writes_pending_changes_first(self):
+        self.subject.flush()
+        self.save('a', 5)
+        gcmd = MagicMock()
+        gcmd.get.side_effect = lambda name: {'VARIABLE': 'macro_var', 'VALUE': 7}[name]
+        self.commands['SAVE_VARIABLE'](gcmd)
+        self.assertIn("a = 5\n", self.read())
+        self.assertIn("macro_var = 7\n", self.read())
+        self.assertEqual(self.subject.get_stats()['writes'], 2)
+
+
+class TestMmuVariablePersistenceFork(TestMmuVariablePersistence):
+    save_variables_class = FakeForkSaveVariables
+
+    def test_internal_write_not_overwritten_by_older_snapshot(self):
+        self.subject.flush()
+        self.save('a', 2)
+        older = self.subject._snapshot()
+        self.subject._pending = older # Queued for writer but not yet written
+
+        self.save_variables.save_error_code(42)
+        self.assertIn("error_code = 42\n", self.read())
+        self.assertIn("a = 2\n", self.read())
+        self.assertIsNone(self.subject._pending)
+
+        self.subject._write(*older)
+        self.assertIn("error_code = 42\n", self.read())
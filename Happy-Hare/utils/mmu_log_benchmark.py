@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# mmu_log_benchmark.py
+# Times the legacy eager logging path (caller % formats, level checked inside log_*(), color substitution
+# with str.format() + re.sub() on every message) against the lazy, level-gated logging facade of Mmu
+# (format + args, level checked first, cached color substitution) inside a simulated toolchange loop.
+#
+# Usage:
+#   python3 utils/mmu_log_benchmark.py [--toolchanges 20000] [--log-level 1] [--log-file-level 2]
+#
+# The facade methods are extracted from extras/mmu/mmu.py so the real implementation is measured
+# without klipper. Console and logfile output is only digested to check that both paths match. Each
+# toolchange logs a mix of messages similar to a real load/unload: info messages with color, debug,
+# trace (trace_filament_move and sync feedback) and stepper messages.
+#
+import argparse, ast, importlib.util, os, re, sys, time
+
+HH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+UI_SEPARATOR = ' '
+FACADE_METHODS = ['_update_log_threshold', '_color_message', '_plain_message', '_log_at_level',
+                  'log_always', 'log_info', 'log_debug', 'log_trace', 'log_stepper', 'log_enabled']
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+mmu_logger = load_module("mmu_logger", os.path.join(HH_DIR, "extras", "mmu", "mmu_logger.py"))
+
+
+# Output sinks keep a digest of messages so legacy and facade output can be compared
+class NullLogger:
+    def __init__(self):
+        self.digest = 0
+    def log(self, msg):
+        self.digest = hash((self.digest, msg))
+
+class NullGcode:
+    def __init__(self):
+        self.digest = 0
+    def respond_info(self, msg):
+        self.digest = hash((self.digest, msg))
+    def respond_raw(self, msg):
+        self.digest = hash((self.digest, "!! " + msg))
+
+
+class BaseMmu:
+    LOG_ESSENTIAL, LOG_INFO, LOG_DEBUG, LOG_TRACE, LOG_STEPPER = range(5)
+
+    def __init__(self, log_level, log_file_level):
+        self.log_level = log_level
+        self.log_file_level = log_file_level
+        self.mmu_logger = NullLogger() if log_file_level >= 0 else None
+        self.gcode = NullGcode()
+        self.serious = 0
+
+
+# Logging as it was before the facade (copied for reference)
+class LegacyMmu(BaseMmu):
+    def _color_message(self, msg):
+        try:
+            html_msg = msg.format(*mmu_logger.COLOR_HTML)
+        except (IndexError, KeyError, ValueError) as e:
+            html_msg = msg
+        msg = re.sub(r'\{\d\}', '', msg) # Remove numbered placeholders for plain msg
+        if self.serious:
+            html_msg = msg
+        return html_msg, msg
+
+    def log_always(self, msg, color=False):
+        html_msg, msg = self._color_message(msg) if color else (msg, msg)
+        if self.mmu_logger:
+            self.mmu_logger.log(msg)
+        self.gcode.respond_info(html_msg)
+
+    def log_info(self, msg, color=False):
+        html_msg, msg = self._color_message(msg) if color else (msg, msg)
+        if self.mmu_logger and self.log_file_level > 0:
+            self.mmu_logger.log(msg)
+        if self.log_level > 0:
+            self.gcode.respond_info(html_msg)
+
+    def log_debug(self, msg):
+        msg = "%s DEBUG: %s" % (UI_SEPARATOR, msg)
+        if self.mmu_logger and self.log_file_level > 1:
+            self.mmu_logger.log(msg)
+        if self.log_level > 1:
+            self.gcode.respond_info(msg)
+
+    def log_trace(self, msg):
+        msg = "%s %s TRACE: %s" % (UI_SEPARATOR, UI_SEPARATOR, msg)
+        if self.mmu_logger and self.log_file_level > 2:
+            self.mmu_logger.log(msg)
+        if self.log_level > 2:
+            self.gcode.respond_info(msg)
+
+    def log_stepper(self, msg):
+        msg = "%s %s %s STEPPER: %s" % (UI_SEPARATOR, UI_SEPARATOR, UI_SEPARATOR, msg)
+        if self.mmu_logger and self.log_file_level > 3:
+            self.mmu_logger.log(msg)
+        if self.log_level > 3:
+            self.gcode.respond_info(msg)
+
+
+# Build class from the facade methods of extras/mmu/mmu.py
+def facade_class():
+    with open(os.path.join(HH_DIR, "extras", "mmu", "mmu.py")) as f:
+        tree = ast.parse(f.read())
+    mmu_class = next(n for n in tree.body if isinstance(n, ast.ClassDef) and n.name == "Mmu")
+    methods = [n for n in mmu_class.body if isinstance(n, ast.FunctionDef) and n.name in FACADE_METHODS]
+    missing = set(FACADE_METHODS) - set(m.name for m in methods)
+    if missing:
+        sys.exit("Facade methods not found in mmu.py: %s" % ", ".join(sorted(missing)))
+    namespace = {'UI_SEPARATOR': UI_SEPARATOR}
+    exec(compile(ast.Module(body=methods, type_ignores=[]), "mmu.py", "exec"), namespace)
+    cls = type("FacadeMmu", (BaseMmu,), {m.name: namespace[m.name] for m in methods})
+    original_init = cls.__init__
+    def __init__(self, log_level, log_file_level):
+        original_init(self, log_level, log_file_level)
+        self._color_cache = mmu_logger.MmuColorCache()
+        self._update_log_threshold()
+    cls.__init__ = __init__
+    return cls
+
+
+def toolchange_legacy(mmu, tc, gate, dist, speed, rd):
+    mmu.log_info("{3}Loading gate %d (T%d){0}" % (gate, tc), color=True)
+    for i in range(4):
+        mmu.log_stepper("%s MOVE: dist=%.1f, speed=%.1f, accel=%.1f, wait=%s" % ("GEAR", dist, speed, 1000., False))
+        mmu.log_trace("Course loading move into bowden. Stepper: '%s' moved %.1fmm, encoder measured %.1fmm (delta %.1fmm). Pos: @%.1f, (%.1fmm)" % ("gear", dist, dist - 0.4, 0.4, dist * i, dist * i - 0.4))
+    mmu.log_debug("Loaded %.1fmm of filament to reach extruder" % (dist * 4))
+    for i in range(8):
+        mmu.log_trace("MmuSyncFeedbackManager: Adjusted gear rotation_distance: %.4f (slow:%.4f, current: %.4f, fast:%.4f, tuned:%s, initial:%.4f)" % (rd, rd * 1.05, rd, rd * 0.95, "None", rd))
+    mmu.log_info("{1}Tool T%d enabled{0}" % tc, color=True)
+
+def toolchange_facade(mmu, tc, gate, dist, speed, rd):
+    mmu.log_info("{3}Loading gate %d (T%d){0}", gate, tc, color=True)
+    for i in range(4):
+        mmu.log_stepper("%s MOVE: dist=%.1f, speed=%.1f, accel=%.1f, wait=%s", "GEAR", dist, speed, 1000., False)
+        mmu.log_trace("Course loading move into bowden. Stepper: '%s' moved %.1fmm, encoder measured %.1fmm (delta %.1fmm). Pos: @%.1f, (%.1fmm)", "gear", dist, dist - 0.4, 0.4, dist * i, dist * i - 0.4)
+    mmu.log_debug("Loaded %.1fmm of filament to reach extruder", dist * 4)
+    for i in range(8):
+        mmu.log_trace("MmuSyncFeedbackManager: Adjusted gear rotation_distance: %.4f (slow:%.4f, current: %.4f, fast:%.4f, tuned:%s, initial:%.4f)", rd, rd * 1.05, rd, rd * 0.95, "None", rd)
+    mmu.log_info("{1}Tool T%d enabled{0}", tc, color=True)
+
+
+def run(mmu, toolchange, toolchanges):
+    start = time.perf_counter()
+    for tc in range(toolchanges):
+        toolchange(mmu, tc % 8, tc % 4, 300. + tc % 7, 150., 22.7 + (tc % 5) * 0.01)
+    return time.perf_counter() - start, (mmu.gcode.digest, mmu.mmu_logger.digest if mmu.mmu_logger else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Happy Hare logging")
+    parser.add_argument("--toolchanges", type=int, default=20000, help="number of simulated toolchanges")
+    parser.add_argument("--log-level", type=int, default=1, help="console log level (0-4)")
+    parser.add_argument("--log-file-level", type=int, default=2, help="logfile log level (-1 to disable, 0-4)")
+    args = parser.parse_args()
+
+    facade_mmu = facade_class()
+    print("%d toolchanges, log_level=%d, log_file_level=%d" % (args.toolchanges, args.log_level, args.log_file_level))
+    for levels in [(args.log_level, args.log_file_level), (0, -1), (4, 4)]:
+        legacy, legacy_output = run(LegacyMmu(*levels), toolchange_legacy, args.toolchanges)
+        facade, facade_output = run(facade_mmu(*levels), toolchange_facade, args.toolchanges)
+        same = legacy_output == facade_output
+        print("Levels console=%d, file=%2d: legacy %.3fs, facade %.3fs, speedup %.1fx, output %s" % (
+            levels[0], levels[1], legacy, facade, legacy / facade if facade else 0, "match" if same else "DIFFERS"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# mmu_preprocess_benchmark.py
+# Times the legacy two pass gcode preprocessor (parse_gcode_file() + process_file()) against the
+# single pass byte level preprocess_file() in components/mmu_server.py on a synthetic gcode file.
+#
+# Usage:
+#   python3 utils/mmu_preprocess_benchmark.py [--toolchanges 100000] [--moves 20] [--gates 8] [--keep]
+#
+# The synthetic file looks like PrusaSlicer output: header, start gcode with Happy Hare placeholders,
+# a body of toolchanges each followed by a wipe tower section and extrusion moves, and a config block
+# at the tail. Both outputs are compared (ignoring back-patch padding) so the speedup is like-for-like.
+#
+import argparse, os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from components import mmu_server
+
+
+def generate(path, toolchanges, moves, gates):
+    rnd = random.Random(42)
+    with open(path, "w") as f:
+        f.write("; generated by PrusaSlicer 2.7.1+linux-x64-GTK3 on 2024-01-01 at 00:00:00 UTC\n")
+        f.write("PRINT_START TOOLS=!referenced_tools! TOOLCHANGES=!total_toolchanges! COLORS=!colors! TEMPS=!temperatures! MATERIALS=!materials!\n")
+        x, y = 100.0, 100.0
+        for i in range(toolchanges):
+            f.write("; CP TOOLCHANGE WIPE\n")
+            f.write("T%d\n" % rnd.randrange(gates))
+            f.write("G1 E-.8 F2100\n")
+            f.write("; CP TOOLCHANGE END\n")
+            for _ in range(moves):
+                x += rnd.uniform(-2, 2)
+                y += rnd.uniform(-2, 2)
+                f.write("G1 X%.3f Y%.3f E%.5f\n" % (x, y, rnd.uniform(0.01, 0.05)))
+            f.write(";WIPE_START\nG1 Z.6 F720\n")
+        f.write("; prusaslicer_config = begin\n")
+        f.write("; extruder_colour = %s\n" % ";".join("#%06X" % rnd.randrange(1 << 24) for _ in range(gates)))
+        f.write("; filament_type = %s\n" % ";".join("PLA" for _ in range(gates)))
+        f.write("; temperature = %s\n" % ",".join("215" for _ in range(gates)))
+        f.write("; wiping_volumes_matrix = %s\n" % ",".join("70" for _ in range(gates * gates)))
+        f.write("; prusaslicer_config = end\n")
+
+
+def time_legacy(path, out):
+    start = time.time()
+    has_placeholder, tools_used, total_toolchanges, colors, temps, materials, purge_volumes, filament_names, slicer = mmu_server.parse_gcode_file(path)
+    mmu_server.process_file(path, out, True, tools_used, total_toolchanges, colors, temps, materials, purge_volumes, filament_names)
+    return time.time() - start
+
+
+def time_single_pass(path, out):
+    start = time.time()
+    mmu_server.preprocess_file(path, out, True)
+    return time.time() - start
+
+
+def same_output(legacy_out, new_out):
+    with open(legacy_out, "rb") as f1, open(new_out, "rb") as f2:
+        for l1, l2 in zip(f1, f2):
+            if l1.rstrip(b"\n") != l2.rstrip(b"\n").rstrip(b" "):
+                return False
+        return not f1.read(1) and not f2.read(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Happy Hare gcode preprocessing")
+    parser.add_argument("--toolchanges", type=int, default=100000, help="number of toolchanges in synthetic file")
+    parser.add_argument("--moves", type=int, default=20, help="extrusion moves between toolchanges")
+    parser.add_argument("--gates", type=int, default=8, help="number of tools used")
+    parser.add_argument("--keep", action="store_true", help="keep generated files")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="mmu_preprocess_")
+    path = os.path.join(tmp_dir, "synthetic.gcode")
+    legacy_out = os.path.join(tmp_dir, "legacy.gcode")
+    new_out = os.path.join(tmp_dir, "single_pass.gcode")
+    try:
+        generate(path, args.toolchanges, args.moves, args.gates)
+        print("Synthetic file: %s (%.1f MB, %d toolchanges)" % (path, os.path.getsize(path) / 1048576., args.toolchanges))
+        legacy = time_legacy(path, legacy_out)
+        print("Legacy parse_gcode_file + process_file: %.2fs" % legacy)
+        single = time_single_pass(path, new_out)
+        print("Single pass preprocess_file:            %.2fs" % single)
+        print("Speedup: %.1fx, outputs %s" % (legacy / single if single else 0, "match" if same_output(legacy_out, new_out) else "DIFFER"))
+    finally:
+        if not args.keep:
+            for f in (path, legacy_out, new_out):
+                if os.path.exists(f):
+                    os.remove(f)
+            os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+# mmu_sync_simulator.py
+# Non-interactive simulation engine for MmuSyncFeedbackManager (extras/mmu/mmu_sync_feedback_manager.py) and
+# a batch runner that executes many scenarios across a process pool. Used to tune the autotune constants
+# (MULTIPLIER_WHEN_STUCK, AUTOTUNE_TOLERANCE, ...) without printing.
+#
+# Usage:
+#   python3 utils/mmu_sync_simulator.py [--scenarios 1000] [--duration 600] [--stuck 0.005,0.01,0.02]
+#                                       [--tolerance 0.001,0.0025,0.005] [--rd-error 0.05] [--sensors dual]
+#                                       [--profile recorded.csv] [--workers N] [--csv results.csv] [--seed 1]
+#
+# Model: the gear stepper is synced to the extruder so for every mm of commanded extruder movement the gear
+# feeds 'gear_rd / set_rd' mm (gear_rd is the true rotation_distance of the gear, set_rd is what the manager
+# last set) while the extruder pulls 'extruder_scale' mm. The difference accumulates in the filament buffer
+# (+ve compression, -ve tension) which is physically limited to +/- sync_feedback_buffer_maxrange/2 (excess is
+# slip/grinding). Switch sensors trigger at +/- 'trigger' of half of sync_feedback_buffer_range and release
+# with 'hysteresis' mm. The manager converges on 'gear_rd / extruder_scale'.
+#
+# Extrusion profiles are synthetic (random print-like mix of extrusion, retracts, travel and pauses) or a
+# recorded file with one sample per line where the first column is time (s) and the last is extruder position
+# (mm), e.g. the output of _MMU_DUMP_ENCODER.
+#
+# Reported per scenario: time until the rd_clamps range first converged (tuned rotation_distance found),
+# number of set_rotation_distance() calls, number of oscillations (compression <-> tension reversals),
+# time spent at the buffer limit, time averaged error of the gear rotation_distance and final error of the
+# autotuned rotation_distance.
+#
+import argparse, bisect, csv, itertools, math, os, random, sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "extras", "mmu"))
+from mmu_sync_feedback_manager import MmuSyncFeedbackManager
+
+
+# ----------------------------- Simulated Klipper/MMU objects -----------------------------
+
+class SimReactor:
+    NOW = 0.
+    NEVER = float("inf")
+
+    def __init__(self):
+        self.timers = {}
+
+    def register_timer(self, callback, waketime=NEVER):
+        self.timers[callback] = waketime
+        return callback
+
+    def update_timer(self, timer, waketime):
+        self.timers[timer] = waketime
+
+    def run_due(self, eventtime):
+        for timer, waketime in list(self.timers.items()):
+            if waketime <= eventtime:
+                self.timers[timer] = timer(eventtime)
+
+
+class SimMcu:
+    def estimated_print_time(self, eventtime):
+        return eventtime
+
+
+class SimExtruder:
+    def __init__(self, profile):
+        self.profile = profile
+        self.position = 0.
+
+    def find_past_position(self, print_time):
+        return self.profile.position(print_time)
+
+
+class SimToolhead:
+    def __init__(self, extruder):
+        self.extruder = extruder
+
+    def get_extruder(self):
+        return self.extruder
+
+
+class SimPrinter:
+    def __init__(self, reactor):
+        self.reactor = reactor
+        self.handlers = {}
+        self.mcu = SimMcu()
+
+    def register_event_handler(self, event, callback):
+        self.handlers.setdefault(event, []).append(callback)
+
+    def send_event(self, event, *params):
+        for callback in self.handlers.get(event, []):
+            callback(*params)
+
+    def lookup_object(self, name, default=None):
+        if name == 'mcu':
+            return self.mcu
+        return default
+
+
+class SimConfig:
+    def __init__(self, values):
+        self.values = values
+
+    def getint(self, option, default=None, minval=None, maxval=None):
+        return int(self.getfloat(option, default, minval=minval, maxval=maxval))
+
+    def getfloat(self, option, default=None, minval=None, maxval=None, above=None, below=None):
+        value = float(self.values.get(option, default))
+        if minval is not None:
+            value = max(value, minval)
+        if maxval is not None:
+            value = min(value, maxval)
+        return value
+
+    def getchoice(self, option, choices, default=None):
+        return choices[self.values.get(option, default)]
+
+
+class SimSensorManager:
+    def __init__(self, mmu, sensors):
+        self.mmu = mmu
+        self.present = {
+            mmu.SENSOR_TENSION: sensors in ('dual', 'tension'),
+            mmu.SENSOR_COMPRESSION: sensors in ('dual', 'compression'),
+        }
+        self.active = {mmu.SENSOR_TENSION: False, mmu.SENSOR_COMPRESSION: False}
+
+    def has_sensor(self, sensor):
+        return self.present.get(sensor, False)
+
+    def check_sensor(self, sensor):
+        return self.present.get(sensor, False) and self.active.get(sensor, False)
+
+
+class SimMachine:
+    filament_always_gripped = False
+
+
+class SimMmu:
+    SENSOR_TENSION = "filament_tension"
+    SENSOR_COMPRESSION = "filament_compression"
+    DIRECTION_LOAD = 1
+    DIRECTION_UNLOAD = -1
+
+    def __init__(self, config, sensors, rotation_distance, clock):
+        self.reactor = SimReactor()
+        self.printer = SimPrinter(self.reactor)
+        self.config = config
+        self.clock = clock
+        self.toolhead = None
+        self.sensor_manager = SimSensorManager(self, sensors)
+        self.mmu_machine = SimMachine()
+        self.gate_selected = 0
+        self.is_enabled = True
+        self.autotune_rotation_distance = True
+        self._is_running_test = False
+        self.calibrated_rd = rotation_distance
+        self.rd = rotation_distance
+        self.rd_calls = 0
+        self.saved_rd = []
+
+    def get_rotation_distance(self, gate):
+        return self.calibrated_rd
+
+    def set_rotation_distance(self, rd, deferred=False):
+        self.rd = rd
+        self.rd_calls += 1
+
+    def save_rotation_distance(self, gate, rd):
+        self.saved_rd.append((self.clock(), rd))
+
+    def log_trace(self, msg, *args, **kwargs): pass
+    def log_debug(self, msg, *args, **kwargs): pass
+    def log_info(self, msg, *args, **kwargs): pass
+    def log_always(self, msg, *args, **kwargs): pass
+    def log_warning(self, msg, *args, **kwargs): pass
+    def log_error(self, msg, *args, **kwargs): pass
+
+
+# ----------------------------- Extrusion profiles -----------------------------
+
+class ExtrusionProfile:
+
+    def __init__(self, times, positions):
+        self.times = times
+        self.positions = positions
+
+    @property
+    def duration(self):
+        return self.times[-1]
+
+    # Extruder position at time (linear between breakpoints, constant outside)
+    def position(self, t):
+        i = bisect.bisect_right(self.times, t)
+        if i <= 0:
+            return self.positions[0]
+        if i >= len(self.times):
+            return self.positions[-1]
+        t0, t1 = self.times[i - 1], self.times[i]
+        p0, p1 = self.positions[i - 1], self.positions[i]
+        return p0 + (p1 - p0) * (t - t0) / (t1 - t0) if t1 > t0 else p1
+
+    # Random print-like profile: extrusion at varying flow, retract/unretract, travel and occasional pause
+    @classmethod
+    def synthetic(cls, duration, seed):
+        rnd = random.Random(seed)
+        times, positions = [0.], [0.]
+        t = pos = 0.
+
+        def add(dt, dpos):
+            times.append(times[-1] + dt)
+            positions.append(positions[-1] + dpos)
+            return times[-1], positions[-1]
+
+        while t < duration:
+            seg = rnd.uniform(0.5, 10.)
+            t, pos = add(seg, seg * rnd.uniform(0.5, 15.))
+            r = rnd.random()
+            if r < 0.5:
+                retract = rnd.uniform(0.4, 1.5)
+                add(retract / 35., -retract)
+                add(rnd.uniform(0.1, 1.), 0.)
+                t, pos = add(retract / 35., retract)
+            elif r < 0.52:
+                t, pos = add(rnd.uniform(5., 30.), 0.)
+        return cls(times, positions)
+
+    # Recorded profile. First column is time, last column is extruder position. Non numeric lines are ignored
+    @classmethod
+    def load(cls, filename):
+        times, positions = [], []
+        with open(filename, "r") as f:
+            for line in f:
+                fields = line.replace(",", " ").split()
+                try:
+                    t, pos = float(fields[0]), float(fields[-1])
+                except (ValueError, IndexError):
+                    continue
+                if times and t <= times[-1]:
+                    continue
+                times.append(t)
+                positions.append(pos)
+        if len(times) < 2:
+            raise ValueError("No samples found in %s" % filename)
+        t0, p0 = times[0], positions[0]
+        return cls([t - t0 for t in times], [p - p0 for p in positions])
+
+
+# ----------------------------- Simulation -----------------------------
+
+DEFAULT_SCENARIO = {
+    'seed': 0,
+    'duration': 600.,             # Simulated seconds (capped by recorded profile length)
+    'dt': 0.02,                   # Simulation step
+    'profile': None,              # Recorded profile filename (None for synthetic)
+    'sensors': 'dual',            # 'dual', 'compression' or 'tension'
+    'rotation_distance': 22.7,    # Calibrated (starting) gear rotation_distance
+    'gear_error': 0.,             # True gear rotation_distance relative error
+    'extruder_scale': 1.,         # True extruder filament pull per commanded mm
+    'trigger': 1.,                # Sensor trigger point as fraction of half buffer range
+    'hysteresis': 0.3,            # Sensor release hysteresis (mm)
+    'buffer_range': 6.,
+    'buffer_maxrange': 12.,
+    'multiplier_high': 1.05,
+    'multiplier_low': 0.95,
+    'controller': 'clamp',        # sync_feedback_controller
+    'constants': {},              # MmuSyncFeedbackManager class constant overrides
+}
+
+
+class SyncSimulation:
+
+    def __init__(self, scenario):
+        s = dict(DEFAULT_SCENARIO)
+        s.update(scenario)
+        self.scenario = s
+        self.time = 0.
+
+        if s['profile']:
+            self.profile = ExtrusionProfile.load(s['profile'])
+        else:
+            self.profile = ExtrusionProfile.synthetic(s['duration'], s['seed'])
+        self.duration = min(s['duration'], self.profile.duration)
+
+        config = SimConfig({
+            'sync_feedback_enabled': 1,
+            'sync_feedback_buffer_range': s['buffer_range'],
+            'sync_feedback_buffer_maxrange': s['buffer_maxrange'],
+            'sync_multiplier_high': s['multiplier_high'],
+            'sync_multiplier_low': s['multiplier_low'],
+            'sync_feedback_controller': s['controller'],
+        })
+        self.mmu = SimMmu(config, s['sensors'], s['rotation_distance'], lambda: self.time)
+        self.mmu.toolhead = SimToolhead(SimExtruder(self.profile))
+        self.manager = MmuSyncFeedbackManager(self.mmu)
+        for name, value in s['constants'].items():
+            setattr(self.manager, name, value) # Instance attribute shadows class constant
+
+        self.gear_rd = s['rotation_distance'] * (1. + s['gear_error'])
+        self.ideal_rd = self.gear_rd / s['extruder_scale']
+        self.trigger = s['trigger'] * s['buffer_range'] / 2.
+        self.limit = s['buffer_maxrange'] / 2.
+        self.buffer = 0.
+        self.state = 0
+        self.last_extreme = 0
+        self.oscillations = 0
+        self.transitions = 0
+        self.limit_time = 0.
+        self.rd_error_sum = 0.
+        self.converged_time = None
+
+    # Update sensor switches from buffer position (with hysteresis) and return effective feedback state
+    def _update_sensors(self):
+        mmu = self.mmu
+        sm = mmu.sensor_manager
+        hyst = self.scenario['hysteresis']
+        c = sm.active[mmu.SENSOR_COMPRESSION]
+        t = sm.active[mmu.SENSOR_TENSION]
+        sm.active[mmu.SENSOR_COMPRESSION] = self.buffer >= self.trigger or (c and self.buffer > self.trigger - hyst)
+        sm.active[mmu.SENSOR_TENSION] = self.buffer <= -self.trigger or (t and self.buffer < -self.trigger + hyst)
+        self.manager._reset_current_sync_state() # Same interpretation of sensors as manager
+        state = self.manager.state
+        self.manager.state = self.state
+        return state
+
+    def run(self):
+        s = self.scenario
+        mmu, manager = self.mmu, self.manager
+        manager.reset_sync_starting_state_for_gate(mmu.gate_selected)
+        self.state = manager.state
+        mmu.printer.send_event("mmu:synced")
+        mmu.reactor.run_due(self.time)
+
+        dt = s['dt']
+        steps = int(self.duration / dt)
+        last_pos = self.profile.position(0.)
+        for i in range(1, steps + 1):
+            self.time = i * dt
+            pos = self.profile.position(self.time)
+            move = pos - last_pos
+            last_pos = pos
+            if move:
+                self.buffer += move * (self.gear_rd / mmu.rd - s['extruder_scale'])
+                if abs(self.buffer) > self.limit:
+                    self.buffer = math.copysign(self.limit, self.buffer)
+                    self.limit_time += dt
+
+            state = self._update_sensors()
+            if state != self.state:
+                self.transitions += 1
+                if state and self.last_extreme and state != self.last_extreme:
+                    self.oscillations += 1
+                if state:
+                    self.last_extreme = state
+                self.state = state
+                mmu.printer.send_event("mmu:sync_feedback", self.time, state)
+
+            mmu.reactor.run_due(self.time)
+            self.rd_error_sum += abs(mmu.rd - self.ideal_rd) * dt
+
+            if self.converged_time is None:
+                clamp = manager.rd_clamps[mmu.gate_selected]
+                if clamp[3] is not None:
+                    self.converged_time = self.time
+        return self.results()
+
+    def results(self):
+        clamp = self.manager.rd_clamps[self.mmu.gate_selected]
+        tuned_rd = clamp[3]
+        return {
+            'seed': self.scenario['seed'],
+            'stuck': getattr(self.manager, 'MULTIPLIER_WHEN_STUCK'),
+            'tolerance': getattr(self.manager, 'AUTOTUNE_TOLERANCE'),
+            'gear_error': self.scenario['gear_error'],
+            'duration': round(self.duration, 2),
+            'converged_time': round(self.converged_time, 2) if self.converged_time is not None else None,
+            'rd_calls': self.mmu.rd_calls,
+            'oscillations': self.oscillations,
+            'transitions': self.transitions,
+            'limit_time': round(self.limit_time, 2),
+            'rd_error': round(self.rd_error_sum / self.duration / self.ideal_rd, 5) if self.duration else 0.,
+            'tuned_rd': round(tuned_rd, 4) if tuned_rd else None,
+            'ideal_rd': round(self.ideal_rd, 4),
+            'tuned_error': round(abs(tuned_rd - self.ideal_rd) / self.ideal_rd, 5) if tuned_rd else None,
+        }
+
+
+def simulate(scenario):
+    return SyncSimulation(scenario).run()
+
+
+# ----------------------------- Batch runner -----------------------------
+
+def build_scenarios(args):
+    rnd = random.Random(args.seed)
+    scenarios = []
+    for stuck, tolerance in itertools.product(args.stuck, args.tolerance):
+        for n in range(args.scenarios):
+            scenarios.append({
+                'seed': rnd.randrange(1 << 30),
+                'duration': args.duration,
+                'profile': args.profile,
+                'sensors': args.sensors,
+                'controller': args.controller,
+                'gear_error': rnd.uniform(-args.rd_error, args.rd_error),
+                'extruder_scale': 1. + rnd.uniform(-args.extruder_error, args.extruder_error),
+                'constants': {
+                    'MULTIPLIER_WHEN_STUCK': stuck,
+                    'AUTOTUNE_TOLERANCE': tolerance,
+                },
+            })
+    return scenarios
+
+
+def run_batch(scenarios, workers=None, chunksize=8):
+    if workers == 1:
+        return [simulate(s) for s in scenarios]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(simulate, scenarios, chunksize=chunksize))
+
+
+def _median(values):
+    values = sorted(values)
+    if not values:
+        return None
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2.
+
+
+def summarize(results):
+    groups = {}
+    for r in results:
+        groups.setdefault((r['stuck'], r['tolerance']), []).append(r)
+    print("%-8s %-9s %6s %10s %10s %8s %8s %9s %8s %10s" % (
+        "stuck", "tolerance", "runs", "converged", "conv_time", "rd_calls", "osc", "limit_s", "rd_err", "tuned_err"))
+    for (stuck, tolerance), runs in sorted(groups.items()):
+        converged = [r['converged_time'] for r in runs if r['converged_time'] is not None]
+        errors = [r['tuned_error'] for r in runs if r['tuned_error'] is not None]
+        conv_time = _median(converged)
+        tuned_err = _median(errors)
+        print("%-8g %-9g %6d %9.1f%% %10s %8.1f %8.1f %9.1f %7.3f%% %10s" % (
+            stuck, tolerance, len(runs),
+            100. * len(converged) / len(runs),
+            "%.1f" % conv_time if conv_time is not None else "-",
+            sum(r['rd_calls'] for r in runs) / float(len(runs)),
+            sum(r['oscillations'] for r in runs) / float(len(runs)),
+            sum(r['limit_time'] for r in runs) / float(len(runs)),
+            100. * sum(r['rd_error'] for r in runs) / float(len(runs)),
+            "%.4f%%" % (tuned_err * 100.) if tuned_err is not None else "-"))
+
+
+def _float_list(value):
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch simulation of Happy Hare sync-feedback rotation_distance autotuning")
+    parser.add_argument("--scenarios", type=int, default=100, help="scenarios per parameter combination")
+    parser.add_argument("--duration", type=float, default=600., help="simulated seconds per scenario")
+    parser.add_argument("--stuck", type=_float_list, default=[MmuSyncFeedbackManager.MULTIPLIER_WHEN_STUCK], help="comma separated MULTIPLIER_WHEN_STUCK values")
+    parser.add_argument("--tolerance", type=_float_list, default=[MmuSyncFeedbackManager.AUTOTUNE_TOLERANCE], help="comma separated AUTOTUNE_TOLERANCE values")
+    parser.add_argument("--rd-error", type=float, default=0.05, help="max relative error of calibrated gear rotation_distance")
+    parser.add_argument("--extruder-error", type=float, default=0.01, help="max relative error of extruder filament pull")
+    parser.add_argument("--sensors", choices=["dual", "compression", "tension"], default="dual", help="sync-feedback sensor configuration")
+    parser.add_argument("--controller", choices=MmuSyncFeedbackManager.CONTROLLER_OPTIONS, default=MmuSyncFeedbackManager.CONTROLLER_CLAMP, help="sync_feedback_controller algorithm")
+    parser.add_argument("--profile", default=None, help="recorded extrusion profile (time ... extruder_pos per line)")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default cpu count, 1 to run inline)")
+    parser.add_argument("--csv", default=None, help="write per scenario results to csv file")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for scenario generation")
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args)
+    print("Running %d scenarios..." % len(scenarios))
+    results = run_batch(scenarios, workers=args.workers)
+    summarize(results)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+        print("Results written to %s" % args.csv)
+
+
+if __name__ == "__main__":
+    main()
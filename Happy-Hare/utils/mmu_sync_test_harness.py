@@ -114,14 +114,15 @@ class Config:
         if minval is not None: v = max(v, minval)
         if maxval is not None: v = min(v, maxval)
         return v
+    def getchoice(self, k, choices, d): return choices[self.values.get(k, d)]
 
 class LoggerMixin:
-    def log_trace(self, msg): print("[TRACE]", msg)
-    def log_debug(self, msg): print("[DEBUG]", msg)
-    def log_info(self, msg):  print("[INFO ]", msg)
-    def log_warning(self, msg): print("[WARN ]", msg)
-    def log_error(self, msg): print("[ERROR]", msg)
-    def log_always(self, msg): print("[ALWAYS]", msg)
+    def log_trace(self, msg, *args, **kwargs): print("[TRACE]", msg % args if args else msg)
+    def log_debug(self, msg, *args, **kwargs): print("[DEBUG]", msg % args if args else msg)
+    def log_info(self, msg, *args, **kwargs):  print("[INFO ]", msg % args if args else msg)
+    def log_warning(self, msg, *args, **kwargs): print("[WARN ]", msg % args if args else msg)
+    def log_error(self, msg, *args, **kwargs): print("[ERROR]", msg % args if args else msg)
+    def log_always(self, msg, *args, **kwargs): print("[ALWAYS]", msg % args if args else msg)
 
 class MMUMachine:
     def __init__(self): self.filament_always_gripped = False
@@ -142,7 +143,7 @@ class MockMMU(LoggerMixin):
         self._rd = 20.0
         self._rd_set_log: List[Tuple[float, float]] = []
     def get_rotation_distance(self, gate): return self._rd
-    def set_rotation_distance(self, rd):
+    def set_rotation_distance(self, rd, deferred=False):
         self._rd_set_log.append((time.time(), rd))
         print(f"[RD-SET] rd={rd:.4f}")
     def save_rotation_distance(self, gate, rd):
@@ -11,6 +11,13 @@ class SaveVariables:
         self.printer = config.get_printer()
         self.filename = os.path.expanduser(config.get('filename'))
         self.allVariables = {}
+        # In-memory store is authoritative. The file is only re-read (and then only changed
+        # values re-evaluated) if it is modified by something else
+        self._raw = {}              # name -> raw value string last read from/written to file
+        self._file_key = None       # (mtime, size) of file when last read or written
+        self._varfile_cache = None  # (file_key, ConfigParser) for load_variable()
+        self._status = None         # Cached get_status() result
+        self._status_vars = None    # allVariables object the cached status was built from
         
         self.default_values = {
             # 新增 AI 摄像头设置变量
@@ -65,47 +72,94 @@ class SaveVariables:
         self.detection_thread = None
         self.detection_running = False
 
-    def load_variable(self, section, option):
+    def _stat_key(self):
+        try:
+            st = os.stat(self.filename)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    # Parsed file, only re-read if it has changed on disk
+    def _read_varfile(self):
+        key = self._stat_key()
+        if self._varfile_cache is not None and key is not None and self._varfile_cache[0] == key:
+            return self._varfile_cache[1]
         varfile = configparser.ConfigParser()
+        varfile.read(self.filename)
+        self._varfile_cache = (key, varfile)
+        return varfile
+
+    def load_variable(self, section, option):
         try:
-            varfile.read(self.filename)
-            return varfile.get(section, option)
+            return self._read_varfile().get(section, option)
         except:
             msg = "Unable to parse existing variable file"
             logging.exception(msg)
             raise self.printer.command_error(msg)
             
     def save_variable(self, section, option, value):
-        varfile = configparser.ConfigParser()
         try:
-            varfile.read(self.filename)
+            varfile = self._read_varfile()
             if not varfile.has_section(section):
                 varfile.add_section(section)
             varfile.set(section, option, value)
             with open(self.filename, 'w') as configfile:
                 varfile.write(configfile)
+            self._varfile_cache = (self._stat_key(), varfile)
         except Exception as e:
+            self._varfile_cache = None
             msg = "Unable to save variable"
             logging.exception(msg)
             raise self.printer.command_error(msg)
         self.loadVariables()
-        
+
+    # Re-read file only if changed since last read/write. Values whose raw text is unchanged
+    # keep their in-memory (already parsed) value
     def loadVariables(self):
+        key = self._stat_key()
+        if key is not None and key == self._file_key:
+            return
         allvars = {}
-        varfile = configparser.ConfigParser()
+        raw = {}
         try:
-            varfile.read(self.filename)
+            varfile = self._read_varfile()
             if varfile.has_section('Variables'):
                 for name, val in varfile.items('Variables'):
-                    allvars[name] = ast.literal_eval(val)
+                    raw[name] = val
+                    if self._raw.get(name) == val and name in self.allVariables:
+                        allvars[name] = self.allVariables[name]
+                    else:
+                        allvars[name] = ast.literal_eval(val)
         except:
             msg = "Unable to parse existing variable file"
             logging.exception(msg)
             raise self.printer.command_error(msg)
-        self.allVariables = allvars
-        
+        self._raw = raw
+        self._file_key = key
+        self._set_variables(allvars)
+
+    # Replace (never mutate) variables so status subscribers see the change
+    def _set_variables(self, newvars, changed=None):
+        self.allVariables = newvars
         for key, default in self.default_values.items():
-            setattr(self, key, self.allVariables.get(key, default))
+            if changed is None or key in changed:
+                setattr(self, key, newvars.get(key, default))
+
+    # Write variables to file. Only the changed values need re-evaluation afterwards
+    # because the in-memory store is what was written
+    def _write_variables(self, newvars, changed):
+        varfile = configparser.ConfigParser()
+        varfile.add_section('Variables')
+        raw = {}
+        for name, val in sorted(newvars.items()):
+            raw[name.lower()] = r = repr(val)
+            varfile.set('Variables', name, r)
+        with open(self.filename, "w") as f:
+            varfile.write(f)
+        self._raw = raw
+        self._file_key = self._stat_key()
+        self._varfile_cache = (self._file_key, varfile)
+        self._set_variables(newvars, changed)
             
     cmd_SAVE_VARIABLE_help = "Save arbitrary variables to disk"
     
@@ -118,20 +172,12 @@ class SaveVariables:
             raise gcmd.error("Unable to parse '%s' as a literal" % (value,))
         newvars = dict(self.allVariables)
         newvars[varname] = value
-        # Write file
-        varfile = configparser.ConfigParser()
-        varfile.add_section('Variables')
-        for name, val in sorted(newvars.items()):
-            varfile.set('Variables', name, repr(val))
         try:
-            f = open(self.filename, "w")
-            varfile.write(f)
-            f.close()
+            self._write_variables(newvars, (varname,))
         except:
             msg = "Unable to save variable"
             logging.exception(msg)
             raise gcmd.error(msg)
-        self.loadVariables()
         
     cmd_M4050_help = "Run foreign object detection procedure"
     
@@ -242,28 +288,20 @@ class SaveVariables:
         newvars = dict(self.allVariables)
         newvars['qdc_ai_error_code'] = error_msg
         
-        # 写入文件
-        varfile = configparser.ConfigParser()
-        varfile.add_section('Variables')
-        for name, val in sorted(newvars.items()):
-            varfile.set('Variables', name, repr(val))
-        
+        # 写入文件并更新内存中的变量
         try:
-            with open(self.filename, "w") as f:
-                varfile.write(f)
+            self._write_variables(newvars, ('qdc_ai_error_code',))
         except Exception as e:
             logging.exception("Unable to save AI error code")
-        
-        # 更新内存中的变量
-        self.loadVariables()
 
     def get_status(self, eventtime):
-        status = {'variables': self.allVariables}
-        
-        for key in self.default_values.keys():
-            status[key] = getattr(self, key)
-            
-        return status
+        if self._status is None or self._status_vars is not self.allVariables:
+            status = {'variables': self.allVariables}
+            for key in self.default_values.keys():
+                status[key] = getattr(self, key)
+            self._status = status
+            self._status_vars = self.allVariables
+        return self._status
 
 def load_config(config):
     return SaveVariables(config)
\ No newline at end of file